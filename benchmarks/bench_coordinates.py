@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+""" file:    bench_coordinates.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare the time and peak memory allocated when
+        reprojecting, rotating and sampling a fault/contact layer, against
+        the old implementations which went through per-geometry coordinate
+        sequences and transposed copies
+
+    usage: python benchmarks/bench_coordinates.py [--lines 50000]
+           [--layer LinearFeatures1M.shp]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import geopandas
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+
+from explore_australia import rotation
+from explore_australia.reprojection import get_transformer, reproject_geometries
+
+CRS = ('EPSG:4326', 'EPSG:3577')
+
+def make_faults(count, rng):
+    "Scatter random-walk fault traces over the continent"
+    lengths = rng.integers(5, 100, count)
+    starts = np.column_stack([rng.uniform(113, 154, count), rng.uniform(-44, -10, count)])
+    return [LineString(start + np.cumsum(rng.normal(scale=0.005, size=(length, 2)), axis=0))
+            for start, length in zip(starts, lengths)]
+
+def old_reproject_geometries(geoms):
+    "The old reproject_geometries, with strided columns and a column_stack"
+    coords = shapely.get_coordinates(geoms)
+    xs, ys = get_transformer(*CRS).transform(coords[:, 0], coords[:, 1])
+    return shapely.set_coordinates(geoms.copy(), np.column_stack([xs, ys]))
+
+def old_geographic_to_cartesian(points):
+    "The old conversions, building each step with vstack and transpose"
+    longitude, latitude = points.transpose()
+    inclination, azimuth = np.radians(90 - latitude), np.radians(longitude + 180)
+    points = np.vstack([inclination, azimuth]).transpose()
+    inclination, azimuth = points.transpose()
+    return np.vstack([np.sin(inclination) * np.cos(azimuth),
+                      np.sin(inclination) * np.sin(azimuth),
+                      np.cos(inclination)]).transpose()
+
+def old_cartesian_to_geographic(points):
+    "The old conversions back, building each step with vstack and transpose"
+    x, y, z = points.transpose()
+    inclination = np.arccos(z / np.sqrt(x ** 2 + y ** 2 + z ** 2))
+    azimuth = np.arctan2(y, x)
+    azimuth[azimuth < 0] += 2 * np.pi
+    return np.vstack([np.degrees(azimuth) - 180, 90 - np.degrees(inclination)]).transpose()
+
+def old_rotate_geometries(geoms, poles, angles):
+    "The old rotate_geometries, gathering a rotation matrix for every coordinate"
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    matrices = rotation.rotation_matrices(old_geographic_to_cartesian(poles),
+                                          np.radians(angles))
+    rotated = np.einsum('nij,nj->ni', matrices[index], old_geographic_to_cartesian(coords))
+    return shapely.set_coordinates(geoms.copy(), old_cartesian_to_geographic(rotated))
+
+def old_sampler_points(geoms):
+    "The old way LinestringSampler got its points, via linestring.xy"
+    return [np.asarray(geom.xy).transpose() for geom in geoms]
+
+def measure(func):
+    "Return the time taken and the peak memory allocated while running a function"
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--layer', default=None,
+                        help='a real fault/contact layer to use instead of random traces')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    if args.layer:
+        layer = geopandas.read_file(args.layer).to_crs(CRS[0]).explode(index_parts=False)
+        geoms = np.asarray(layer.geometry.values, dtype=object)
+    else:
+        geoms = np.asarray(make_faults(args.lines, rng), dtype=object)
+    poles = shapely.get_coordinates(shapely.centroid(geoms))
+    angles = rng.uniform(0, 360, len(geoms))
+    print(f'{len(geoms)} lines, {len(shapely.get_coordinates(geoms))} coordinates')
+
+    cases = {
+        'reproject': (lambda: old_reproject_geometries(geoms),
+                      lambda: reproject_geometries(geoms, *CRS)),
+        'rotate': (lambda: old_rotate_geometries(geoms, poles, angles),
+                   lambda: rotation.rotate_geometries(geoms, poles, angles)),
+        'line points': (lambda: old_sampler_points(geoms),
+                        lambda: [shapely.get_coordinates(geom) for geom in geoms]),
+    }
+    for name, (old, new) in cases.items():
+        (old_time, old_peak), (new_time, new_peak) = measure(old), measure(new)
+        print(f'{name:>15}: {old_time:7.3f} s -> {new_time:7.3f} s, '
+              f'peak {old_peak / 2 ** 20:7.1f} MiB -> {new_peak / 2 ** 20:7.1f} MiB')
+
+if __name__ == '__main__':
+    main()
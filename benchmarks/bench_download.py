@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+""" file:    bench_download.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare the threaded and asynchronous coverage downloaders
+        against a local stand-in WCS with simulated server latency
+
+    usage: python benchmarks/bench_download.py [--stamps 40] [--latency 0.1]
+"""
+
+import argparse
+import concurrent.futures
+import pathlib
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / 'tests'))
+from wcs_server import LocalWCSServer  # pylint: disable=C0413
+
+from explore_australia.download import AsyncCoverageDownloader, CoverageTask
+from explore_australia.stamp import Stamp, get_stamp
+
+LAYERS = ('dose', 'pctk', 'ppmth', 'ppmu', 'tmi', 'vrtp')
+
+def make_tasks(server, root, nstamps):
+    "Generate random stamps over the continent and a task per layer"
+    rng = np.random.default_rng(42)
+    tasks = []
+    for idx in range(nstamps):
+        stamp = Stamp(lon=rng.uniform(120, 145), lat=rng.uniform(-35, -20),
+                      angle=rng.uniform(0, 360), distance=25, n_pixels=250)
+        for layer in LAYERS:
+            tasks.append(CoverageTask(idx, stamp, layer, server.url(f'{layer}.nc'),
+                                      root / f'{idx}_{layer}.tif', False))
+    return tasks
+
+def run_threads(tasks, nworkers=10):
+    "The current approach - one thread per stamp, layers fetched in turn"
+    by_stamp = {}
+    for task in tasks:
+        by_stamp.setdefault(task.key, []).append(task)
+
+    def _get(stamp_tasks):
+        for task in stamp_tasks:
+            get_stamp(task.wcs, task.stamp, output=task.output)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
+        list(executor.map(_get, by_stamp.values()))
+
+def run_async(tasks, per_host=32):
+    "Everything through one event loop"
+    AsyncCoverageDownloader(per_host=per_host).run(tasks, show_progress=False)
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stamps', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with LocalWCSServer(resolution=0.001, latency=args.latency) as server:
+        for name, runner in (('threads (10 workers)', run_threads), ('asyncio', run_async)):
+            with tempfile.TemporaryDirectory() as tempdir:
+                tasks = make_tasks(server, pathlib.Path(tempdir), args.stamps)
+                start = time.perf_counter()
+                runner(tasks)
+                elapsed = time.perf_counter() - start
+                print(f'{name:>22}: {len(tasks)} coverages in {elapsed:.2f} s '
+                      f'({len(tasks) / elapsed:.1f} coverages/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+""" file:    bench_geology.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare clipping geology out for stamps by scanning the
+        whole layer (as in jupyter/vector_data.ipynb) against the STRtree
+        index, one stamp at a time and in bulk, and against reading from
+        an ingested FlatGeobuf file
+
+    usage: python benchmarks/bench_geology.py [--units 40000] [--stamps 200]
+           [--layer GeologicUnitPolygons1M.shp]
+"""
+
+import argparse
+import pathlib
+import tempfile
+import time
+
+import geopandas
+import numpy as np
+from shapely.geometry import Polygon
+
+from explore_australia.geology import GeologyIndex, GeologyStore, ingest_geology
+from explore_australia.stamp import Stamp
+
+def make_units(count, rng):
+    "Scatter random hexagonal units over the continent"
+    lons, lats = rng.uniform(113, 154, count), rng.uniform(-44, -10, count)
+    radii = rng.uniform(0.02, 0.3, count)
+    angles = np.linspace(0, 2 * np.pi, 7)[:-1]
+    return geopandas.GeoDataFrame(
+        {'code': np.arange(count)},
+        geometry=[Polygon(np.column_stack([lon + r * np.cos(angles), lat + r * np.sin(angles)]))
+                  for lon, lat, r in zip(lons, lats, radii)],
+        crs='EPSG:4326')
+
+def clip_out(units, stamp):
+    "The notebook's clip_out - a linear scan over the whole layer"
+    subset = units[units.intersects(stamp.geometry)]
+    return subset.intersection(stamp.geometry).to_crs(stamp.crs)
+
+def timed(func, count):
+    "Time a function, returning the cost per stamp in ms"
+    start = time.perf_counter()
+    func()
+    return 1e3 * (time.perf_counter() - start) / count
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--units', type=int, default=40000)
+    parser.add_argument('--stamps', type=int, default=200)
+    parser.add_argument('--layer', default=None,
+                        help='a real geology layer to use instead of random units')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    units = geopandas.read_file(args.layer) if args.layer else make_units(args.units, rng)
+    stamps = [Stamp(lon=lon, lat=lat, angle=angle) for lon, lat, angle in
+              zip(rng.uniform(120, 145, args.stamps), rng.uniform(-35, -20, args.stamps),
+                  rng.uniform(0, 360, args.stamps))]
+
+    start = time.perf_counter()
+    index = GeologyIndex(units)
+    print(f'{"build index":>20}: {time.perf_counter() - start:8.3f} s for {len(units)} units')
+
+    results = {
+        'linear scan': timed(lambda: [clip_out(units, s) for s in stamps], len(stamps)),
+        'index': timed(lambda: [index.clip(s) for s in stamps], len(stamps)),
+        'index (bulk)': timed(lambda: index.clip_many(stamps), len(stamps)),
+    }
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        layer, path = args.layer, pathlib.Path(tempdir) / 'units.fgb'
+        if layer is None:
+            layer = pathlib.Path(tempdir) / 'units.shp'
+            units.to_file(layer)
+        start = time.perf_counter()
+        ingest_geology(layer, path)
+        print(f'{"ingest":>20}: {time.perf_counter() - start:8.3f} s')
+
+        store = GeologyStore(path)
+        results['store (bulk)'] = timed(lambda: store.clip_many(stamps), len(stamps))
+        print(f'{"store read":>20}: {store.features_read} of {len(store)} features')
+
+    for name, cost in results.items():
+        print(f'{name:>20}: {cost:8.2f} ms/stamp')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" file:    bench_geometry.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare the per-stamp cost of building stamp geometries
+        with pint quantities against the unit-free implementation
+
+    usage: python benchmarks/bench_geometry.py [--stamps 2000]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+from shapely.geometry import LineString, Point
+from shapely.ops import polygonize
+
+from explore_australia.geometry import make_box, make_stamp, make_stamps
+from explore_australia.rotation import rotate
+
+def make_box_pint(centre, distance, units, npoints=2):
+    "The old make_box, doing every conversion through pint quantities"
+    distance = distance * units.km
+    earth_radius = 6.3781e6 * units.m
+    lon0, lat0 = (centre.xy * units.deg).to('rad')
+    angular_dist = (distance / earth_radius) * units.rad
+    lat1 = lat0 - angular_dist / 2
+    lat2 = lat0 + angular_dist / 2
+    delta_lon = lambda lat: angular_dist / np.cos(lat)
+    to_point = lambda x, y: Point(x.to('deg').magnitude, y.to('deg').magnitude)
+    top_left = to_point(lon0 - delta_lon(lat1) / 2, lat1)
+    top_right = to_point(lon0 + delta_lon(lat1) / 2, lat1)
+    bottom_left = to_point(lon0 - delta_lon(lat2) / 2, lat2)
+    bottom_right = to_point(lon0 + delta_lon(lat2) / 2, lat2)
+    interp = lambda a, b: LineString(zip(np.linspace(a.x, b.x, npoints),
+                                         np.linspace(a.y, b.y, npoints)))
+    sides = (interp(top_left, top_right), interp(top_right, bottom_right),
+             interp(bottom_left, bottom_right), interp(bottom_left, top_left))
+    return next(iter(polygonize(sides)))
+
+def timed(func, nstamps):
+    "Time a function over a number of stamps, returning microseconds per stamp"
+    start = time.perf_counter()
+    func()
+    return 1e6 * (time.perf_counter() - start) / nstamps
+
+def import_time(statement):
+    "Time a statement in a fresh interpreter"
+    code = f'import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code],
+                            capture_output=True, text=True, check=True)
+    return float(output.stdout)
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stamps', type=int, default=2000)
+    args = parser.parse_args()
+
+    import pint  # pylint: disable=C0415
+    units = pint.UnitRegistry()
+    rng = np.random.default_rng(42)
+    lons = rng.uniform(120, 145, args.stamps)
+    lats = rng.uniform(-35, -20, args.stamps)
+    angles = rng.uniform(0, 360, args.stamps)
+    centres = [Point(lon, lat) for lon, lat in zip(lons, lats)]
+
+    results = {
+        'make_box (pint)': timed(
+            lambda: [make_box_pint(c, 25, units) for c in centres], args.stamps),
+        'make_box': timed(
+            lambda: [make_box(c, 25) for c in centres], args.stamps),
+        'make_stamp (pint)': timed(
+            lambda: [rotate(make_box_pint(c, 25, units), c, a)
+                     for c, a in zip(centres, angles)], args.stamps),
+        'make_stamp': timed(
+            lambda: [make_stamp(c, a) for c, a in zip(centres, angles)], args.stamps),
+        'make_stamps': timed(
+            lambda: make_stamps(lons, lats, angles), args.stamps),
+    }
+    for name, cost in results.items():
+        print(f'{name:>20}: {cost:8.1f} us/stamp')
+
+    print()
+    print(f'{"import pint":>20}: {import_time("import pint; pint.UnitRegistry()"):8.3f} s')
+    print(f'{"import geometry":>20}: {import_time("import explore_australia.geometry"):8.3f} s')
+
+if __name__ == '__main__':
+    main()
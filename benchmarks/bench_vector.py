@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+""" file:    bench_vector.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare resampling lots of geology boundaries one
+        geometry at a time against the batched ragged-array sampler
+
+    usage: python benchmarks/bench_vector.py [--geoms 20000] [--resolution 0.01]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from shapely.geometry import LineString, Polygon
+
+from explore_australia.vector import resample, resample_many
+
+def make_geoms(count, rng):
+    "Make a mix of ragged polygons and fault traces"
+    geoms = []
+    for idx in range(count):
+        npoints = rng.integers(5, 50)
+        if idx % 2:
+            angles = np.sort(rng.uniform(0, 2 * np.pi, npoints))
+            radii = rng.uniform(0.05, 0.1, npoints)
+            geoms.append(Polygon(np.column_stack([radii * np.cos(angles),
+                                                  radii * np.sin(angles)])))
+        else:
+            geoms.append(LineString(np.cumsum(rng.normal(scale=0.02, size=(npoints, 2)), axis=0)))
+    return geoms
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--geoms', type=int, default=20000)
+    parser.add_argument('--resolution', type=float, default=0.01)
+    args = parser.parse_args()
+    geoms = make_geoms(args.geoms, np.random.default_rng(42))
+
+    start = time.perf_counter()
+    single = [resample(geom, args.resolution, return_points=True) for geom in geoms]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = resample_many(geoms, args.resolution)
+    batched_time = time.perf_counter() - start
+
+    assert all(np.allclose(a, b) for a, b in zip(single, batched))
+    npoints = sum(len(points) for points in batched)
+    for name, elapsed in (('one at a time', single_time), ('ragged', batched_time)):
+        print(f'{name:>15}: {elapsed:8.3f} s ({npoints / elapsed / 1e6:6.2f} M points/s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+""" file:    bench_warp.py (benchmarks)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Compare warping synthetic coverages onto stamps in threads,
+        in worker processes with pickled arrays, and in worker processes
+        through shared memory
+
+    usage: python benchmarks/bench_warp.py [--stamps 32] [--layers 4] [--workers 4]
+"""
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import time
+
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+
+from explore_australia.stamp import Stamp
+from explore_australia.warp import (WARP_PLANS, Coverage, ProcessWarper, ThreadWarper,
+                                    WarpPlanCache)
+
+def make_coverages(nstamps, nlayers, resolution):
+    "Generate random stamps, each with a few synthetic layers on the same grid"
+    rng = np.random.default_rng(42)
+    crs = CRS.from_epsg(4326)
+    jobs = []
+    for _ in range(nstamps):
+        stamp = Stamp(lon=rng.uniform(120, 145), lat=rng.uniform(-35, -20),
+                      angle=rng.uniform(0, 360), distance=25, n_pixels=500)
+        left, bottom, right, top = stamp.geometry.bounds
+        shape = (int((top - bottom) / resolution) + 1, int((right - left) / resolution) + 1)
+        transform = Affine(resolution, 0, left, 0, -resolution, top)
+        for _ in range(nlayers):
+            data = rng.standard_normal(shape).astype('float32')
+            jobs.append((Coverage(data, crs, transform, None), stamp))
+    return jobs
+
+def _warp_pickled(coverage, stamp):
+    "Warp in a worker, with the arrays pickled both ways"
+    return WARP_PLANS(coverage, stamp).apply(coverage.data, nodata=coverage.nodata)
+
+def run_threads(jobs, nworkers):
+    "Warp in a thread pool (holding the GIL outside of the numpy/pyproj calls)"
+    warper = ThreadWarper(plans=WarpPlanCache())
+    with concurrent.futures.ThreadPoolExecutor(nworkers) as executor:
+        list(executor.map(lambda job: warper.warp(*job), jobs))
+
+def run_pickled(jobs, nworkers):
+    "Warp in a process pool, pickling coverages and stamps in and arrays out"
+    context = multiprocessing.get_context('forkserver')
+    with concurrent.futures.ProcessPoolExecutor(nworkers, mp_context=context) as executor:
+        list(executor.map(_warp_pickled, *zip(*jobs)))
+
+def run_shared(jobs, nworkers):
+    "Warp in a process pool through shared memory blocks"
+    with ProcessWarper(nworkers) as warper, \
+            concurrent.futures.ThreadPoolExecutor(nworkers) as executor:
+        def _warp(job):
+            _, block = warper.warp(*job)
+            warper.release(block)
+        list(executor.map(_warp, jobs))
+
+def main():
+    "Run the benchmark"
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stamps', type=int, default=32)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--resolution', type=float, default=0.0005,
+                        help='coverage resolution in degrees')
+    args = parser.parse_args()
+
+    jobs = make_coverages(args.stamps, args.layers, args.resolution)
+    nbytes = sum(coverage.data.nbytes for coverage, _ in jobs)
+    print(f'{len(jobs)} warps of {nbytes / len(jobs) / 2 ** 20:.1f} MB coverages '
+          f'with {args.workers} workers')
+    for name, run in (('threads', run_threads), ('processes (pickled)', run_pickled),
+                      ('processes (shared)', run_shared)):
+        start = time.perf_counter()
+        run(jobs, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>20}: {elapsed:6.2f} s, {len(jobs) / elapsed:6.1f} warps/s')
+
+if __name__ == '__main__':
+    main()
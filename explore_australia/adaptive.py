@@ -0,0 +1,353 @@
+""" file:    adaptive.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tune the number of concurrent downloads and warps as a
+        campaign runs
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from .retry import CircuitOpenError, is_retryable, releasing
+
+LOGGER = logging.getLogger('explore_australia')
+
+Decision = collections.namedtuple('Decision', 'time stage old new reason')
+Decision.__doc__ = """
+A change to one of the controller's limits
+
+Parameters:
+    time - when the change was made (from the controller's clock)
+    stage - 'downloads' or 'warps'
+    old - the limit before the change
+    new - the limit after the change
+    reason - why the limit was changed
+"""
+
+def cpu_count():
+    "The number of CPUs this process can run on"
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class AdaptiveLimit:
+
+    """
+    A limit on the number of things running at once, which can be changed
+    while it's in use
+
+    Shrinking the limit doesn't interrupt anything: new work just waits
+    until enough of the running work has finished.
+
+    Parameters:
+        name - a name for the limit, used in metrics and logs
+        initial - the starting limit
+        minimum - the smallest the limit can go. Optional, defaults to 1.
+        maximum - the largest the limit can go. Optional, defaults to 32.
+    """
+
+    def __init__(self, name, initial, minimum=1, maximum=32):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.active = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.
+        self._window = []  # (latency, ok) pairs since the last adjustment
+        self._saturated = False
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        "Wait for a slot"
+        with self._cond:
+            if self.active >= self.limit:
+                self._saturated = True
+                self.waiting += 1
+                while self.active >= self.limit:
+                    self._cond.wait()
+                self.waiting -= 1
+            self.active += 1
+
+    def release(self, latency=None, ok=True):
+        """
+        Give back a slot, recording how the work went
+
+        Parameters:
+            latency - how long the work took, in seconds. Optional, if None
+                the work never happened (e.g. the request was turned away
+                before it was sent) and nothing is recorded.
+            ok - False if the work failed in a way that suggests we're
+                overloading something
+        """
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+            if latency is None:
+                return
+            self.completed += 1
+            self.failed += not ok
+            self.busy_time += latency
+            self._window.append((latency, ok))
+
+    def set_limit(self, limit):
+        "Change the limit, clipped to [minimum, maximum], returning the new value"
+        with self._cond:
+            self.limit = min(max(int(limit), self.minimum), self.maximum)
+            self._cond.notify_all()
+            return self.limit
+
+    def take_window(self, min_samples=1):
+        """
+        Collect what's happened since the last call
+
+        Parameters:
+            min_samples - the fewest completions worth looking at. If there
+                are fewer than this nothing is collected.
+
+        Returns:
+            a list of (latency, ok) pairs and whether anything had to wait
+            for a slot, or None if there aren't enough samples yet
+        """
+        with self._cond:
+            if len(self._window) < min_samples:
+                return None
+            window = self._window
+            saturated = self._saturated or self.waiting > 0
+            self._window, self._saturated = [], False
+        return window, saturated
+
+    def metrics(self):
+        "Return the current state of the limit as a dictionary"
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'waiting': self.waiting,
+                'completed': self.completed,
+                'failed': self.failed,
+                'mean_latency': self.busy_time / self.completed if self.completed else None
+            }
+
+class AdaptiveController:
+
+    """
+    Tunes the number of concurrent downloads and warps as a campaign runs
+
+    Downloads and warps each get their own `AdaptiveLimit`, adjusted
+    independently every `interval` seconds using additive increase and
+    multiplicative decrease (AIMD, as in TCP congestion control):
+
+    - downloads are cut by `decrease` if more than `max_error_rate` of
+      them failed with a retryable error (the server is struggling), or if
+      their median latency has gone above `latency_tolerance` times the
+      best we've seen (we're queueing at the server). Otherwise, if
+      downloads had to wait for a slot, the limit goes up by one.
+    - warps are cut by `decrease` if the process is using more than
+      `cpu_ceiling` of the available CPU, and go up by one if warps had to
+      wait for a slot while CPU use was under `cpu_target`.
+
+    The latency baseline drifts up by `baseline_drift` each interval so a
+    server that's permanently slower than it was at the start doesn't
+    pin downloads at the minimum forever. It never goes below
+    `min_baseline`, so a run of very quick responses can't make every
+    normal one look like congestion.
+
+    Only requests which actually went out are timed. Requests turned away
+    by an open circuit breaker aren't counted at all, and the download
+    slot is given up while a request backs off before a retry (see
+    `retry.releasing`), with each failed attempt counted as a failure.
+    Sources marked `local` (e.g. `tiles.TileCache`) don't take a
+    download slot.
+
+    Work is wrapped in `download()` and `warp()` blocks, which wait for a
+    slot and time the work. Every decision is logged and kept in
+    `decisions`, and `metrics()` gives a snapshot of the current state.
+
+    Parameters:
+        downloads - the starting number of concurrent downloads. Optional,
+            defaults to 4.
+        warps - the starting number of concurrent warps. Optional,
+            defaults to half the CPUs.
+        max_downloads - the most concurrent downloads. Optional, defaults
+            to 32.
+        max_warps - the most concurrent warps. Optional, defaults to the
+            number of CPUs.
+        interval - seconds between adjustments. Optional, defaults to 5.
+        min_samples - the fewest completed downloads to base an adjustment
+            on. Optional, defaults to 4.
+        max_error_rate - the fraction of failed downloads we put up with.
+            Optional, defaults to 0.05.
+        latency_tolerance - how many times slower than the baseline
+            downloads can get. Optional, defaults to 2.
+        baseline_drift - how far the latency baseline creeps up each
+            interval. Optional, defaults to 0.1.
+        min_baseline - the lowest the latency baseline can go, in
+            seconds. Optional, defaults to 0.05.
+        cpu_target - the CPU use to grow warps up to. Optional, defaults
+            to 0.8.
+        cpu_ceiling - the CPU use above which warps are cut. Optional,
+            defaults to 0.95.
+        decrease - the factor limits are multiplied by when cut. Optional,
+            defaults to 0.5.
+        clock, cpu_clock - functions returning wall and process CPU time
+            in seconds. Optional, for testing.
+        ncpus - the number of CPUs to measure use against. Optional,
+            defaults to the CPUs this process can run on.
+    """
+
+    def __init__(self, downloads=4, warps=None, max_downloads=32, max_warps=None,
+                 interval=5., min_samples=4, max_error_rate=0.05, latency_tolerance=2.,
+                 baseline_drift=0.1, min_baseline=0.05, cpu_target=0.8, cpu_ceiling=0.95, decrease=0.5,
+                 clock=time.monotonic, cpu_clock=time.process_time, ncpus=None):
+        self.ncpus = ncpus or cpu_count()
+        max_warps = max_warps or self.ncpus
+        self.downloads = AdaptiveLimit('downloads', downloads, maximum=max_downloads)
+        self.warps = AdaptiveLimit('warps', warps or max(self.ncpus // 2, 1), maximum=max_warps)
+        self.interval = interval
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.latency_tolerance = latency_tolerance
+        self.baseline_drift = baseline_drift
+        self.min_baseline = min_baseline
+        self.cpu_target = cpu_target
+        self.cpu_ceiling = cpu_ceiling
+        self.decrease = decrease
+        self.clock = clock
+        self.cpu_clock = cpu_clock
+        self.baseline = None
+        self.cpu = None
+        self.decisions = collections.deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._last_wall, self._last_cpu = clock(), cpu_clock()
+
+    @property
+    def max_workers(self):
+        "The number of threads needed to fill every slot"
+        return self.downloads.maximum + self.warps.maximum
+
+    def download(self):
+        "Context manager holding a download slot while the block runs"
+        return self._slot(self.downloads)
+
+    def warp(self):
+        "Context manager holding a warp slot while the block runs"
+        return self._slot(self.warps)
+
+    @contextlib.contextmanager
+    def _slot(self, limit):
+        limit.acquire()
+        start = self.clock()
+
+        def _back_off(_):
+            # The failed attempt is a sample of its own, and someone else
+            # can have the slot while we wait to try again
+            limit.release(self.clock() - start, ok=False)
+
+        def _try_again():
+            nonlocal start
+            limit.acquire()
+            start = self.clock()
+
+        latency, ok = None, True
+        try:
+            with releasing(_back_off, _try_again):
+                yield
+            latency = self.clock() - start
+        except CircuitOpenError:
+            # Never sent, so it tells us nothing about the server
+            raise
+        except Exception as exc:
+            latency, ok = self.clock() - start, not is_retryable(exc)
+            raise
+        finally:
+            limit.release(latency, ok)
+            self.maybe_adjust()
+
+    def maybe_adjust(self):
+        "Adjust the limits if it's been long enough since the last time"
+        with self._lock:
+            if self.clock() - self._last_wall >= self.interval:
+                self._adjust()
+
+    def adjust(self):
+        "Look at what's happened since the last adjustment and update the limits"
+        with self._lock:
+            self._adjust()
+
+    def _adjust(self):
+        now, cpu_now = self.clock(), self.cpu_clock()
+        elapsed = now - self._last_wall
+        if elapsed > 0:
+            self.cpu = (cpu_now - self._last_cpu) / (elapsed * self.ncpus)
+        self._last_wall, self._last_cpu = now, cpu_now
+        self._adjust_downloads(now)
+        self._adjust_warps(now)
+
+    def _adjust_downloads(self, now):
+        window = self.downloads.take_window(self.min_samples)
+        if window is None:
+            return
+        samples, saturated = window
+        latencies = sorted(latency for latency, _ in samples)
+        median = latencies[len(latencies) // 2]
+        error_rate = sum(not ok for _, ok in samples) / len(samples)
+        baseline = self.baseline if self.baseline is not None \
+            else max(median, self.min_baseline)
+
+        limit = self.downloads.limit
+        if error_rate > self.max_error_rate:
+            self._change(now, self.downloads, limit * self.decrease,
+                         f'error rate {error_rate:.0%}')
+        elif median > self.latency_tolerance * baseline:
+            self._change(now, self.downloads, limit * self.decrease,
+                         f'median latency {median:.2f}s vs {baseline:.2f}s baseline')
+        elif saturated:
+            self._change(now, self.downloads, limit + 1, 'downloads waiting for a slot')
+        self.baseline = max(min(median, baseline * (1 + self.baseline_drift)),
+                            self.min_baseline)
+
+    def _adjust_warps(self, now):
+        window = self.warps.take_window()
+        if window is None or self.cpu is None:
+            return
+        _, saturated = window
+        limit = self.warps.limit
+        if self.cpu > self.cpu_ceiling:
+            self._change(now, self.warps, limit * self.decrease, f'CPU use {self.cpu:.0%}')
+        elif saturated and self.cpu < self.cpu_target:
+            self._change(now, self.warps, limit + 1,
+                         f'warps waiting for a slot with CPU use {self.cpu:.0%}')
+
+    def _change(self, now, limit, value, reason):
+        old = limit.limit
+        new = limit.set_limit(value)
+        if new != old:
+            LOGGER.info(f'Changing {limit.name} from {old} to {new}: {reason}')
+            self.decisions.append(Decision(now, limit.name, old, new, reason))
+
+    def metrics(self):
+        """
+        Return a snapshot of what the controller is doing
+
+        Returns:
+            a dictionary with the state of the 'downloads' and 'warps'
+            limits (see `AdaptiveLimit.metrics`), the latest 'cpu'
+            use, the download latency 'baseline' and the number of
+            'adjustments' made so far
+        """
+        return {
+            'downloads': self.downloads.metrics(),
+            'warps': self.warps.metrics(),
+            'cpu': self.cpu,
+            'baseline': self.baseline,
+            'adjustments': len(self.decisions)
+        }
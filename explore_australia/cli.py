@@ -5,9 +5,12 @@
     description: CLI implementation
 """
 import logging
+from pathlib import Path
 
 import click
 
+from .manifest import Manifest, run_manifest
+from .mirror import LocalMirror
 from .stamp import get_coverages, Stamp
 
 LOGGER = logging.getLogger('explore_australia')
@@ -18,8 +21,11 @@ LOGGER = logging.getLogger('explore_australia')
 @click.option('--distance', type=int, default=25, help='The approximate length of the sides of the coverage (in km)')
 @click.option('--angle', type=float, default=None, help='An angle to rotate the box, in degrees')
 @click.option('--no-crs', is_flag=True, help='If set, remove CRS from data')
+@click.option('--cube', is_flag=True, help='If set, write all layers to a single multi-band GeoTIFF')
+@click.option('--mirror', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Read coverages from local copies of the national grids in this folder')
 @click.argument('name')
-def main(name, lat, lon, angle, distance, no_crs):
+def main(name, lat, lon, angle, distance, no_crs, cube, mirror):
     """
     Get coverages for a given centre and angle
 
@@ -28,7 +34,93 @@ def main(name, lat, lon, angle, distance, no_crs):
     on latitude.
     """
     stamp = Stamp(lat=lat, lon=lon, angle=angle or 0, distance=distance)
-    get_coverages(name=name, stamp=stamp, no_crs=no_crs, show_progress=True)
+    source = LocalMirror(mirror) if mirror else None
+    get_coverages(name=name, stamp=stamp, no_crs=no_crs, show_progress=True, cube=cube,
+                  source=source)
+
+@click.group()
+def campaign():
+    """
+    Run a resumable campaign, tracking every (stamp, layer) task in an
+    SQLite manifest
+    """
+    pass
+
+@campaign.command()
+@click.argument('manifest', type=click.Path(dir_okay=False))
+@click.argument('stamps', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None,
+              help='The number of tasks to run at once (tuned automatically if not given)')
+@click.option('--no-crs', is_flag=True, help='If set, remove CRS from data')
+@click.option('--mirror', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Read coverages from local copies of the national grids in this folder')
+@click.option('--coalesce', is_flag=True,
+              help='If set, overlapping stamps share one request per layer')
+def start(manifest, stamps, workers, no_crs, mirror, coalesce):
+    """
+    Add the stamps in a CSV (with 'id' and 'local_projection' columns) to
+    a manifest and run them
+    """
+    import pandas
+    locations = pandas.read_csv(stamps, dtype={'id': str})
+    with Manifest(manifest) as tasks:
+        added = tasks.add_stamps(locations, no_crs=no_crs)
+        click.echo(f'Added {added} tasks to {manifest}')
+        counts = run_manifest(tasks, nworkers=workers,
+                              source=LocalMirror(mirror) if mirror else None,
+                              coalesce=coalesce)
+    click.echo(_format_counts(counts))
+
+@campaign.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None,
+              help='The number of tasks to run at once (tuned automatically if not given)')
+@click.option('--max-attempts', type=int, default=None,
+              help='Skip tasks which have already been tried this many times')
+@click.option('--mirror', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Read coverages from local copies of the national grids in this folder')
+@click.option('--coalesce', is_flag=True,
+              help='If set, overlapping stamps share one request per layer')
+def resume(manifest, workers, max_attempts, mirror, coalesce):
+    """
+    Rerun the tasks in a manifest which failed or didn't finish
+    """
+    with Manifest(manifest) as tasks:
+        counts = run_manifest(tasks, nworkers=workers, max_attempts=max_attempts,
+                              source=LocalMirror(mirror) if mirror else None,
+                              coalesce=coalesce)
+    click.echo(_format_counts(counts))
+
+@campaign.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+def status(manifest):
+    """
+    Show how many tasks in a manifest have each status
+    """
+    with Manifest(manifest) as tasks:
+        click.echo(_format_counts(tasks.counts()))
+
+@click.command()
+@click.argument('layers', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', type=click.Path(file_okay=False), default='.',
+              help='The folder to write the FlatGeobuf files to (defaults to the current folder)')
+@click.option('--columns', default=None,
+              help='A comma-separated list of the attributes to keep (defaults to all of them)')
+def ingest(layers, output, columns):
+    """
+    Convert geology layers (e.g. the 1:1M shapefiles) into FlatGeobuf files,
+    so stamps only read the geology under them
+    """
+    from .geology import ingest_geology  # only pull in geopandas if we need it
+    columns = columns.split(',') if columns else None
+    for layer in layers:
+        target = Path(output) / (Path(layer).stem + '.fgb')
+        count = ingest_geology(layer, target, columns=columns)
+        click.echo(f'{layer}: wrote {count} features to {target}')
+
+def _format_counts(counts):
+    "Format task counts for printing"
+    return ', '.join(f'{status}: {count}' for status, count in sorted(counts.items()))
 
 if __name__ == '__main__':
     main()
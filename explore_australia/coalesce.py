@@ -0,0 +1,423 @@
+""" file:    coalesce.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Coalesce requests for overlapping stamps into one
+        GetCoverage per cluster
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.windows import transform as window_transform
+
+from .coverage import WCS_SOURCE
+from .mirror import snap_window
+from .stream import MEMORY
+from .warp import Coverage
+
+LOGGER = logging.getLogger('explore_australia')
+
+CoverageRequest = collections.namedtuple('CoverageRequest', 'wcs bounds members')
+CoverageRequest.__doc__ = """
+A single GetCoverage standing in for a cluster of stamp requests
+
+Parameters:
+    wcs - the URL pointing to the WCS endpoint
+    bounds - the union of the members' bounding boxes, given as
+        (minx, miny, maxx, maxy)
+    members - the bounding boxes of the stamps served by the request, one
+        for each time a stamp asks for it
+"""
+
+def _area(bounds):
+    minx, miny, maxx, maxy = bounds
+    return (maxx - minx) * (maxy - miny)
+
+def _union(first, second):
+    return (min(first[0], second[0]), min(first[1], second[1]),
+            max(first[2], second[2]), max(first[3], second[3]))
+
+class RequestPlan:
+
+    """
+    The coalesced requests for a set of (wcs, bounds) jobs
+
+    Parameters:
+        requests - a list of `CoverageRequest`s
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+        self._index = {}
+        for idx, request in enumerate(requests):
+            for bounds in request.members:
+                self._index[request.wcs, bounds] = idx
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(self.requests)
+
+    def request(self, wcs, bounds):
+        "Return the request serving a bounding box, or None if it isn't in the plan"
+        idx = self._index.get((wcs, tuple(bounds)))
+        return None if idx is None else self.requests[idx]
+
+    def order(self, jobs, key):
+        """
+        Sort jobs so that the members of each request are next to each
+        other, and so each cluster can be let go as soon as possible
+
+        Parameters:
+            jobs - an iterable of jobs
+            key - a function returning the (wcs, bounds) for a job
+
+        Returns:
+            a list of jobs, with any not in the plan at the end
+        """
+        def _position(job):
+            wcs, bounds = key(job)
+            return self._index.get((wcs, tuple(bounds)), len(self.requests))
+        return sorted(jobs, key=_position)
+
+    def summary(self):
+        """
+        Estimate how much coalescing saves
+
+        The estimate assumes each layer comes back at a fixed resolution,
+        so bytes go with area.
+
+        Returns:
+            a dictionary with the number of 'requests' and 'members', the
+            total 'area' requested with and without coalescing (in square
+            degrees) as 'area' and 'member_area', and the fraction of bytes
+            'saved'
+        """
+        area = sum(_area(request.bounds) for request in self.requests)
+        member_area = sum(_area(bounds) for request in self.requests
+                          for bounds in request.members)
+        return {
+            'requests': len(self.requests),
+            'members': sum(len(request.members) for request in self.requests),
+            'area': area,
+            'member_area': member_area,
+            'saved': 1 - area / member_area if member_area else 0.
+        }
+
+class RequestPlanner:
+
+    """
+    Clusters stamp bounding boxes so overlapping stamps share a GetCoverage
+
+    Stamps are often near-duplicates (several offset stamps per deposit,
+    and deposits a few km apart), so their bounding boxes overlap a lot.
+    For each layer the boxes are swept west to east and each is added to
+    the open cluster it grows the least, as long as:
+
+    - the cluster's union box stays within `max_size` degrees on a side,
+      so no single response gets too big, and
+    - the union box is no bigger than the cluster and the new box fetched
+      separately, plus a `max_overhead` fraction. With the default of zero
+      coalescing never asks for more pixels than it saves.
+
+    Boxes which don't fit anywhere start a new cluster.
+
+    Parameters:
+        max_size - the largest a request can get on a side, in degrees.
+            Optional, defaults to 0.5 degrees (about 50 km).
+        max_overhead - the extra area we'll fetch to save a request, as a
+            fraction. Optional, defaults to 0.
+    """
+
+    def __init__(self, max_size=0.5, max_overhead=0.):
+        self.max_size = max_size
+        self.max_overhead = max_overhead
+
+    def cluster(self, boxes):
+        """
+        Group bounding boxes into clusters
+
+        Parameters:
+            boxes - a list of bounding boxes given as (minx, miny, maxx, maxy)
+
+        Returns:
+            a list of (union bounds, member indices) pairs
+        """
+        clusters, active = [], []
+        for idx in sorted(range(len(boxes)), key=lambda idx: boxes[idx][0]):
+            bounds = tuple(boxes[idx])
+
+            # Clusters that started too far west can't take this box or any after it
+            active = [cluster for cluster in active
+                      if bounds[0] - cluster[0][0] <= self.max_size]
+            best, best_growth = None, None
+            for cluster in active:
+                union = _union(cluster[0], bounds)
+                if union[2] - union[0] > self.max_size or union[3] - union[1] > self.max_size:
+                    continue
+                growth = _area(union) - _area(cluster[0])
+                if _area(union) > (1 + self.max_overhead) * (_area(cluster[0]) + _area(bounds)):
+                    continue
+                if best is None or growth < best_growth:
+                    best, best_growth = cluster, growth
+
+            if best is None:
+                best = [bounds, []]
+                clusters.append(best)
+                active.append(best)
+            else:
+                best[0] = _union(best[0], bounds)
+            best[1].append(idx)
+        return [tuple(cluster) for cluster in clusters]
+
+    def plan(self, jobs):
+        """
+        Plan the requests for a set of jobs
+
+        Parameters:
+            jobs - an iterable of (wcs, bounds) pairs, one for each stamp
+                layer we want
+
+        Returns:
+            a `RequestPlan`
+        """
+        by_layer = collections.defaultdict(list)
+        for wcs, bounds in jobs:
+            by_layer[wcs].append(tuple(bounds))
+
+        requests = []
+        for wcs, boxes in by_layer.items():
+            for union, members in self.cluster(boxes):
+                requests.append(CoverageRequest(wcs, union, [boxes[idx] for idx in members]))
+        plan = RequestPlan(requests)
+        LOGGER.info(f'Planned requests: {plan.summary()}')
+        return plan
+
+class _Fetch:
+
+    "A cluster's coverage, shared by its members until the last one is served"
+
+    def __init__(self):
+        self.coverage = None
+        self.error = None
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+class CoalescingSource:
+
+    """
+    Serves stamps out of coalesced requests
+
+    The first member of a cluster to ask for its coverage fetches the
+    whole cluster from the underlying source, and every member then gets
+    the window covering its own bounding box. The cluster is held in memory
+    until all its members have been served, so hand out tasks in the
+    plan's order (see `RequestPlan.order`) to keep that short. If the fetch
+    fails the rest of the cluster fails with the same error rather than
+    asking again.
+
+    Held clusters reserve their bytes from a `stream.MemoryBudget`. Some
+    members never come back for their cluster (e.g. they were cut out of
+    a tile cache, or failed before reading), so when the budget runs out
+    the least recently used clusters are let go, and fetched again if
+    another member turns up. Call `clear` once the run is done.
+
+    Bounding boxes which aren't in the plan, or have a request to
+    themselves, go straight to the underlying source.
+
+    This has the same `covers`/`open` interface as `coverage.WCSSource`,
+    so it can be passed as the `source` wherever stamps are read, and
+    keeps count of the bytes it fetches and serves (see `report`).
+
+    Parameters:
+        plan - the `RequestPlan` to follow
+        source - where to fetch the clusters from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods.
+            Optional, defaults to the WCS itself (`coverage.WCSSource`).
+        padding - the number of extra pixels to serve around each stamp.
+            Optional, defaults to 1.
+        budget - the `stream.MemoryBudget` that held clusters count
+            against. Optional, defaults to the one shared by all downloads
+            (`stream.MEMORY`).
+    """
+
+    def __init__(self, plan, source=None, padding=1, budget=None):
+        self.plan = plan
+        self.source = WCS_SOURCE if source is None else source
+        self.padding = padding
+        self.budget = MEMORY if budget is None else budget
+        self.fetched_bytes, self.served_bytes = 0, 0
+        self.fetches, self.served, self.evicted = 0, 0, 0
+        self._fetches = collections.OrderedDict()
+        self._remaining = {}
+        self._lock = threading.Lock()
+
+    def covers(self, wcs, bounds):
+        "Check whether the underlying source covers the request for a bounding box"
+        request = self.plan.request(wcs, bounds)
+        return self.source.covers(wcs, bounds if request is None else request.bounds)
+
+    @contextlib.contextmanager
+    def open(self, wcs, bounds):
+        """
+        Get the coverage for a bounding box, fetching its cluster if needed
+
+        Use as a context manager:
+
+            with source.open(wcs, bounds) as src:
+                data = src.read(1)
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Yields:
+            an open rasterio dataset
+        """
+        request = self.plan.request(wcs, bounds)
+        if request is None or len(request.members) == 1:
+            with self.source.open(wcs, bounds) as src:
+                nbytes = src.width * src.height * np.dtype(src.dtypes[0]).itemsize
+                self._count(fetches=1, fetched_bytes=nbytes, served=1, served_bytes=nbytes)
+                yield src
+            return
+
+        coverage = self._fetch(request)
+        window = snap_window(bounds, coverage.transform, coverage.height, coverage.width,
+                             self.padding)
+        rows, cols = window.toslices()
+        data = coverage.data[rows, cols]
+        self._count(served=1, served_bytes=data.nbytes)
+
+        profile = dict(
+            driver='GTiff', dtype=data.dtype, count=1,
+            width=data.shape[1], height=data.shape[0], crs=coverage.crs,
+            transform=window_transform(window, coverage.transform),
+            nodata=coverage.nodata
+        )
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as sink:
+                sink.write(data, 1)
+            with memfile.open() as windowed:
+                yield windowed
+
+    def report(self):
+        """
+        Return what coalescing has saved so far
+
+        Returns:
+            a dictionary with the number of 'fetches' made, 'served'
+            stamps and clusters 'evicted' before all their members were
+            served, the 'fetched_bytes' and the 'served_bytes' (what the
+            stamps would have fetched on their own), and the fraction of
+            bytes 'saved'
+        """
+        with self._lock:
+            return {
+                'fetches': self.fetches,
+                'served': self.served,
+                'evicted': self.evicted,
+                'fetched_bytes': self.fetched_bytes,
+                'served_bytes': self.served_bytes,
+                'saved': 1 - self.fetched_bytes / self.served_bytes if self.served_bytes else 0.
+            }
+
+    def clear(self):
+        "Let go of any clusters still waiting on members"
+        with self._lock:
+            for key in list(self._fetches):
+                self._drop(key)
+            self._remaining.clear()
+
+    def _count(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def _fetch(self, request):
+        "Get a cluster's coverage, fetching it if it isn't held already"
+        key = (request.wcs, request.bounds)
+        with self._lock:
+            fetch = self._fetches.get(key)
+            if fetch is None:
+                fetch = self._fetches[key] = _Fetch()
+            self._fetches.move_to_end(key)
+        try:
+            with fetch.lock:
+                if fetch.error is not None:
+                    raise fetch.error
+                if fetch.coverage is None:
+                    try:
+                        with self.source.open(request.wcs, request.bounds) as src:
+                            coverage = Coverage.from_dataset(src)
+                    except Exception as exc:
+                        fetch.error = exc
+                        raise
+                    LOGGER.debug(f'Fetched {request.bounds} from {request.wcs} for '
+                                 f'{len(request.members)} stamps')
+                    self._reserve(key, coverage.data.nbytes)
+                    fetch.coverage, fetch.nbytes = coverage, coverage.data.nbytes
+                    self._count(fetches=1, fetched_bytes=coverage.data.nbytes)
+                return fetch.coverage
+        finally:
+            # Count members down separately from the fetch, so an evicted
+            # cluster which is fetched again still goes when it's done
+            with self._lock:
+                remaining = self._remaining.get(key, len(request.members)) - 1
+                if remaining <= 0:
+                    self._remaining.pop(key, None)
+                    self._drop(key)
+                else:
+                    self._remaining[key] = remaining
+
+    def _reserve(self, key, nbytes):
+        "Make room in the budget for a cluster, letting the oldest ones go if we need to"
+        while not self.budget.acquire(nbytes, blocking=False):
+            with self._lock:
+                held = [other for other, fetch in self._fetches.items()
+                        if other != key and fetch.nbytes]
+                if not held:
+                    break
+                self._drop(held[0])
+                self.evicted += 1
+        else:
+            return
+        self.budget.acquire(nbytes)
+
+    def _drop(self, key):
+        "Let go of a cluster, giving its memory back. Call with the lock held."
+        fetch = self._fetches.pop(key, None)
+        if fetch is not None and fetch.nbytes:
+            self.budget.release(fetch.nbytes)
+            fetch.nbytes = 0
+
+def coalesce_tasks(tasks, planner=None, source=None, bounds=None):
+    """
+    Plan coalesced requests for a set of download tasks
+
+    Parameters:
+        tasks - an iterable of tasks with a `wcs` attribute, such as
+            `download.CoverageTask`s
+        planner - the `RequestPlanner` to use. Optional, defaults to a
+            RequestPlanner with its default size budget.
+        source - where to fetch the clusters from. Optional, defaults to
+            the WCS.
+        bounds - a function returning the bounding box of a task's stamp.
+            Optional, defaults to the bounds of `task.stamp`.
+
+    Returns:
+        the tasks in the plan's order, and a `CoalescingSource` to read them
+        from
+    """
+    planner = planner or RequestPlanner()
+    bounds = bounds or (lambda task: task.stamp.geometry.bounds)
+    tasks = list(tasks)
+    key = lambda task: (task.wcs, tuple(bounds(task)))
+    plan = planner.plan(key(task) for task in tasks)
+    return plan.order(tasks, key), CoalescingSource(plan, source=source)
@@ -5,14 +5,29 @@
     description: Coverage data getting
 """
 
+import collections
+import contextlib
+import hashlib
+import io
 import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
 
+import requests
 from shapely.geometry import box
 from owslib.wcs import WebCoverageService
+from owslib.coverage.wcsBase import WCSCapabilitiesReader
+from owslib.util import openURL
 import rasterio
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import numpy as np
 
+from .retry import RETRY
+from .stream import CHUNK_SIZE, buffer_stream, content_length, copy_stream
+
 LOGGER = logging.getLogger('explore_australia')
 
 def rotate_raster(input_raster, output_raster, angle, band=1):
@@ -99,18 +114,133 @@ def read_to_maskedarray(geotiff, layer_id=1):
     return band
 
 
+class CapabilitiesCache:
+
+    """
+    A thread-safe cache of WCS capabilities, keyed by endpoint URL
+
+    Building a `WebCoverageService` fetches and parses the service's
+    GetCapabilities document, which is the same every time we hit an
+    endpoint. This keeps the parsed service around for `ttl` seconds so
+    that every `CoverageService` for the same URL shares it. If `cache_dir`
+    is set the raw XML is also written to disk so that other processes (or
+    later runs) can skip the round-trip too.
+
+    Parameters:
+        ttl - the number of seconds before a capabilities document is
+            refetched. Optional, defaults to a day. If None, documents
+            never expire.
+        cache_dir - a directory to persist capabilities documents to.
+            Optional, if None documents are only cached in memory.
+        timeout - the timeout for fetching capabilities, in seconds
+    """
+
+    def __init__(self, ttl=86400, cache_dir=None, timeout=30):
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._url_locks = collections.defaultdict(threading.Lock)
+
+    def __call__(self, url):
+        """
+        Get the WebCoverageService for a URL, fetching capabilities if required
+
+        Parameters:
+            url - the URL pointing to the WCS endpoint
+
+        Returns:
+            an owslib WebCoverageService instance
+        """
+        # Only one thread fetches a given URL, others wait for it
+        with self._lock:
+            url_lock = self._url_locks[url]
+        with url_lock:
+            with self._lock:
+                entry = self._entries.get(url)
+            if entry is not None and not self._expired(entry[0]):
+                return entry[1]
+
+            fetched, xml = self._read(url)
+            if xml is None:
+                fetched, xml = time.time(), self._fetch(url)
+                self._write(url, xml)
+            wcs = WebCoverageService(url, xml=xml)
+            with self._lock:
+                self._entries[url] = (fetched, wcs)
+            return wcs
+
+    def clear(self):
+        "Drop everything held in memory (persisted documents are kept)"
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, fetched):
+        return self.ttl is not None and time.time() - fetched > self.ttl
+
+    def _fetch(self, url):
+        "Get the raw capabilities XML from the server"
+        LOGGER.debug(f'Getting capabilities for {url}')
+        request = WCSCapabilitiesReader().capabilities_url(url)
+        return openURL(request, timeout=self.timeout).read()
+
+    def _path(self, url):
+        return pathlib.Path(self.cache_dir) / (hashlib.sha1(url.encode('utf-8')).hexdigest() + '.xml')
+
+    def _read(self, url):
+        "Read a persisted capabilities document, if there is a fresh one"
+        if self.cache_dir is None:
+            return None, None
+        path = self._path(url)
+        try:
+            fetched = path.stat().st_mtime
+            if self._expired(fetched):
+                return None, None
+            return fetched, path.read_bytes()
+        except FileNotFoundError:
+            return None, None
+
+    def _write(self, url, xml):
+        "Persist a capabilities document, atomically so readers never see half a file"
+        if self.cache_dir is None:
+            return
+        # The cache directory is shared between processes, so the temporary
+        # file needs a name no other writer can pick
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as sink:
+                sink.write(xml)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+# Shared by all CoverageService instances in this process. Set
+# `CAPABILITIES.cache_dir` to persist capabilities between runs.
+CAPABILITIES = CapabilitiesCache()
+
 class CoverageService:
 
     """
     Manages getting data from a Web Coverage Service
 
+    Capabilities for each endpoint are only fetched once and then shared
+    between instances (see `CapabilitiesCache`).
+
     Parameters:
         url - the URL pointing to the WCS endpoint
+        capabilities - the capabilities cache to use. Optional, defaults
+            to the process-wide `CAPABILITIES` cache.
     """
 
-    def __init__(self, url):
+    timeout = 30  # seconds to wait for the server
+
+    def __init__(self, url, capabilities=None):
         "Initialize using a URL"
-        self.wcs = WebCoverageService(url)
+        self.wcs = (capabilities or CAPABILITIES)(url)
 
     def __call__(self, bbox, layer=None, output=None):
         """
@@ -131,23 +261,142 @@ class CoverageService:
             layer = self.default_layer
         if output is None:  # just use layer name
             output = f"{layer}.tif"
+        self.download(bbox, output, layer)
+        return output
 
-        # Make request
-        LOGGER.debug(f'Getting coverage for {layer}')
-        response = self.wcs.getCoverage(
-            identifier=layer,
-            bbox=self.snap_bounds(bbox, layer),
-            format='GeoTIFF_Float'
-        )
+    @contextlib.contextmanager
+    def request(self, bbox, layer=None):
+        """
+        Send a GetCoverage request, without reading the response body
+
+        Use as a context manager, and read the body in chunks:
+
+            with service.request(bbox) as response:
+                for chunk in response.iter_content(stream.CHUNK_SIZE):
+                    ...
+
+        Parameters
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+
+        Yields:
+            a streaming requests.Response
+        """
+        url, params = self.request_params(bbox, layer)
+        LOGGER.debug(f'Getting coverage for {params["Coverage"]}')
+        with requests.get(url, params=params, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            yield response
+
+    def download(self, bbox, output, layer=None, checksum=None):
+        """
+        Stream the coverage in the given box to a file, a chunk at a time
 
-        # Dump to geotiff
-        if response._response.ok:
-            with open(output, 'wb') as sink:
+        Parameters
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            output - the name of the output file
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+            checksum - the name of a hashlib algorithm (e.g. 'sha256') to
+                digest the response with as it comes in. Optional.
+
+        Returns:
+            a `stream.StreamStats` with the size (and checksum) of the
+            response
+        """
+        try:
+            with self.request(bbox, layer) as response, open(output, 'wb') as sink:
                 LOGGER.debug(f'Dumping to {output}')
-                sink.write(response.read())
-        else:
-            raise IOError('Something went wrong getting raster!')
-        return output
+                return copy_stream(response.iter_content(CHUNK_SIZE), sink,
+                                   content_length(response.headers), checksum)
+        except BaseException:
+            # Don't leave half a GeoTIFF lying around
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(output)
+            raise
+
+    def fetch(self, bbox, layer=None):
+        """
+        Get the coverage in the given box as GeoTIFF bytes, without
+        touching the disk
+
+        Use `rasterio.io.MemoryFile` to open the result, or `buffer` to
+        keep large coverages under the memory ceiling.
+
+        Parameters
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+
+        Returns:
+            the raw GeoTIFF response
+        """
+        sink = io.BytesIO()
+        with self.request(bbox, layer) as response:
+            copy_stream(response.iter_content(CHUNK_SIZE), sink, content_length(response.headers))
+        return sink.getvalue()
+
+    def buffer(self, bbox, layer=None, checksum=None, budget=None):
+        """
+        Stream the coverage in the given box into memory
+
+        Space for the response comes out of a memory budget shared by all
+        downloads, so lots of threads pulling big coverages at once wait
+        their turn (or spill to disk) rather than blowing out memory.
+
+        Parameters
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+            checksum - the name of a hashlib algorithm (e.g. 'sha256') to
+                digest the response with as it comes in. Optional.
+            budget - the `stream.MemoryBudget` to use. Optional, defaults
+                to the shared `stream.MEMORY` budget.
+
+        Returns:
+            a `stream.ResponseBuffer` holding the coverage. Close it when
+            you're done to give the memory back.
+        """
+        with self.request(bbox, layer) as response:
+            return buffer_stream(response.iter_content(CHUNK_SIZE),
+                                 content_length(response.headers), checksum, budget)
+
+    def request_params(self, bbox, layer=None, format='GeoTIFF_Float'):
+        """
+        Build a GetCoverage request for the given box without sending it
+
+        This mirrors what owslib sends for a WCS 1.0.0 GetCoverage so that
+        other HTTP clients (e.g. the asynchronous downloader) can make the
+        same request.
+
+        Parameters:
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+            format - the format to request. Optional, defaults to
+                'GeoTIFF_Float'
+
+        Returns:
+            the base URL for the request and a dictionary of query
+            parameters
+        """
+        if layer is None:
+            layer = self.default_layer
+        try:
+            url = next(m.get('url') for m in self.wcs.getOperationByName('GetCoverage').methods
+                       if m.get('type').lower() == 'get')
+        except (StopIteration, KeyError):
+            url = self.wcs.url
+        params = {
+            'version': self.wcs.version,
+            'request': 'GetCoverage',
+            'service': 'WCS',
+            'Coverage': layer,
+            'BBox': ','.join(repr(float(v)) for v in self.snap_bounds(bbox, layer)),
+            'format': format
+        }
+        return url, params
 
     @property
     def default_layer(self):
@@ -165,3 +414,81 @@ class CoverageService:
         return box(*bounds)\
                    .intersection(box(*self.wcs[layer].boundingBoxWGS84))\
                    .bounds
+
+    @contextlib.contextmanager
+    def open(self, bbox, layer=None):
+        """
+        Get the coverage in the given box as an open rasterio dataset,
+        held in memory
+
+        Use as a context manager:
+
+            with CoverageService(url).open(bbox) as src:
+                data = src.read(1)
+
+        Parameters
+            bbox - a bounding box given as (minx, miny, maxx, maxy)
+            layer - the layer to pull from. Optional, defaults to
+                self.default_layer
+
+        Yields:
+            an open rasterio dataset
+        """
+        with self.buffer(bbox, layer) as buffer, buffer.open() as src:
+            yield src
+
+class WCSSource:
+
+    """
+    Reads coverages straight from their WCS endpoints
+
+    This is the default place stamps get their data from. Other sources
+    (e.g. `tiles.TileCache` or `mirror.LocalMirror`) provide the same
+    two methods, so they can be swapped in wherever a source is taken.
+
+    Requests which fail with a retryable error are retried with backoff,
+    and endpoints which keep failing are paused for everyone (see
+    `retry.RetryPolicy`).
+
+    Responses are streamed into memory under a ceiling shared by every
+    download (see `stream.MemoryBudget`).
+
+    Parameters:
+        retry - the `retry.RetryPolicy` to use. Optional, defaults to
+            the shared `retry.RETRY` policy.
+        budget - the `stream.MemoryBudget` to use. Optional, defaults to
+            the shared `stream.MEMORY` budget.
+    """
+
+    def __init__(self, retry=None, budget=None):
+        self.retry = retry or RETRY
+        self.budget = budget
+
+    def covers(self, wcs, bounds):  # pylint: disable=W0613,R0201
+        "The WCS covers everything it serves"
+        return True
+
+    @contextlib.contextmanager
+    def open(self, wcs, bounds):
+        """
+        Get the coverage for a bounding box from a WCS endpoint
+
+        Use as a context manager:
+
+            with source.open(wcs, bounds) as src:
+                data = src.read(1)
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Yields:
+            an open rasterio dataset
+        """
+        buffer = self.retry.call(
+            lambda: CoverageService(wcs).buffer(bounds, budget=self.budget), key=wcs)
+        with buffer, buffer.open() as src:
+            yield src
+
+# The default source for coverages
+WCS_SOURCE = WCSSource()
@@ -0,0 +1,213 @@
+""" file:    cube.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Campaign-wide (stamp, band, y, x) stores for training
+"""
+
+import concurrent.futures
+import logging
+
+from affine import Affine
+import numpy as np
+import zarr
+from tqdm import tqdm
+
+from .stamp import coverage_layers, get_cube, proj_to_stamp
+
+LOGGER = logging.getLogger('explore_australia')
+
+class StampCube:
+
+    """
+    A Zarr store holding every stamp in a campaign as one
+    (stamp, band, y, x) array
+
+    Each stamp is a single chunk, so a training loader can read a whole
+    epoch by walking the stamp axis in order rather than opening one
+    GeoTIFF per layer per stamp. All stamps share the same pixel grid (see
+    `Stamp.transform`), which is stored once; the local CRS for each stamp
+    is stored alongside its id.
+
+    Use `StampCube.create` to make a new store and `StampCube(path)` to
+    open an existing one.
+
+    Parameters:
+        path - the location of the Zarr store
+        mode - the mode to open the store in. Optional, defaults to 'r+'.
+    """
+
+    def __init__(self, path, mode='r+'):
+        self.path = path
+        self.group = zarr.open_group(str(path), mode=mode)
+        self.data = self.group['data']
+        self.complete = self.group['complete']
+
+    @classmethod
+    def create(cls, path, ids, crses, transform, bands=None, width=500, height=500):
+        """
+        Create a new, empty stamp cube
+
+        Parameters:
+            path - the location of the Zarr store
+            ids - a list of identifiers for each stamp
+            crses - a list of the local CRS strings for each stamp
+            transform - the affine transform shared by all stamps
+            bands - the names of the bands. Optional, defaults to the
+                layers from `stamp.coverage_layers()`
+            width, height - the number of pixels in each stamp
+
+        Returns:
+            a StampCube instance
+        """
+        bands = bands or [layer for layer, _ in coverage_layers()]
+        group = zarr.open_group(str(path), mode='w')
+        group.attrs.update(
+            ids=[str(i) for i in ids],
+            crs=list(crses),
+            bands=list(bands),
+            transform=list(transform)[:6]
+        )
+        zarr.open_array(
+            store=str(path), path='data', mode='w',
+            shape=(len(ids), len(bands), height, width),
+            chunks=(1, len(bands), height, width),
+            dtype='float32', fill_value=np.nan
+        )
+        zarr.open_array(
+            store=str(path), path='complete', mode='w',
+            shape=(len(ids),), chunks=(len(ids),), dtype='bool', fill_value=False
+        )
+        return cls(path)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, index):
+        "Read stamps from the cube, as a numpy array"
+        return self.data[index]
+
+    def __setitem__(self, index, value):
+        "Write stamps into the cube"
+        self.data[index] = value
+
+    @property
+    def ids(self):
+        "The identifiers for each stamp"
+        return self.group.attrs['ids']
+
+    @property
+    def bands(self):
+        "The names of the bands"
+        return self.group.attrs['bands']
+
+    @property
+    def crs(self):
+        "The local CRS strings for each stamp"
+        return self.group.attrs['crs']
+
+    @property
+    def transform(self):
+        "The affine transform shared by all stamps"
+        return Affine(*self.group.attrs['transform'])
+
+    def band(self, name):
+        "Return the index of a named band"
+        return self.bands.index(name)
+
+    def check(self, ids, bands, width, height):
+        """
+        Check the cube was made for the stamps and bands we're about to
+        write into it
+
+        Parameters:
+            ids - a list of identifiers for each stamp
+            bands - the names of the bands
+            width, height - the number of pixels in each stamp
+
+        Raises:
+            ValueError if the stamps, bands or stamp size don't match
+        """
+        mismatched = []
+        if self.ids != [str(i) for i in ids]:
+            mismatched.append('stamp ids')
+        if self.bands != list(bands):
+            mismatched.append(f'bands ({self.bands} vs {list(bands)})')
+        if tuple(self.data.shape[2:]) != (height, width):
+            mismatched.append(f'stamp size ({self.data.shape[3]}x{self.data.shape[2]} '
+                              f'vs {width}x{height})')
+        if mismatched:
+            raise ValueError(f'Stamp cube at {self.path} was made for different '
+                             f'{", ".join(mismatched)}')
+
+def get_cubes_parallel(stamps, store, tiles=None, layers=None, nworkers=10, source=None,
+                       geology=None):
+    """
+    Get stamp raster data for a campaign into a single StampCube
+
+    Stamps which have already been written are skipped, so this can be
+    rerun on the same store to fill in gaps. Each stamp is marked complete
+    as soon as it's written, so a run which is killed partway keeps its
+    progress.
+
+    Parameters:
+        stamps - a geodataframe with 'id' and 'local_projection'
+            columns containing stamp info
+        store - the path to the Zarr store. If it doesn't exist it is
+            created.
+        tiles - a `tiles.TileCache` to cut stamps out of. Optional.
+        layers - a list of (layer name, WCS URL) pairs to use as bands.
+            Optional, defaults to `stamp.coverage_layers()`.
+        nworkers - the number of stamps to get at once
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        geology - a `geology.GeologyRasterizer`. Optional, if given its
+            bands are added after the coverage layers.
+
+    Returns:
+        the StampCube
+
+    Raises:
+        ValueError if the store already exists but was made for different
+        stamps, bands or stamp sizes
+    """
+    layers = layers or coverage_layers()
+    proj_stamps = [proj_to_stamp(proj) for proj in stamps.local_projection]
+    bands = [layer for layer, _ in layers] + (geology.bands if geology else [])
+    width, height = proj_stamps[0].width, proj_stamps[0].height
+    try:
+        cube = StampCube(store)
+    except (FileNotFoundError, KeyError, zarr.errors.GroupNotFoundError):
+        cube = StampCube.create(
+            store, ids=list(stamps.id), crses=[s.crs for s in proj_stamps],
+            transform=proj_stamps[0].transform, bands=bands, width=width, height=height
+        )
+    else:
+        cube.check(list(stamps.id), bands, width, height)
+    todo = [idx for idx, done in enumerate(cube.complete[:]) if not done]
+
+    # Each stamp is its own chunk so workers can write in parallel
+    def _get(idx):
+        data, failed = get_cube(proj_stamps[idx], tiles=tiles, layers=layers, source=source)
+        if geology is not None:
+            data = np.concatenate([data, geology(proj_stamps[idx])])
+        cube[idx] = data
+        return failed
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
+        futures = {executor.submit(_get, idx): idx for idx in todo}
+        for future in tqdm(concurrent.futures.as_completed(futures),
+                           total=len(todo), desc='Collecting stamps'):
+            idx = futures[future]
+            try:
+                failed = future.result()
+                for layer, _ in failed:
+                    LOGGER.error('Stamp %s failed to get %s', cube.ids[idx], layer)
+                # The completion flags share a chunk, so they're only ever
+                # written from this thread
+                cube.complete[idx] = not failed
+            except Exception as exc:  # pylint: disable=W0703
+                LOGGER.error('Stamp %s get generated an exception: %s\n', cube.ids[idx], exc)
+    return cube
@@ -0,0 +1,276 @@
+""" file:    download.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Asynchronous coverage downloads for many stamps at once
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import os
+from urllib.parse import urlparse
+
+import aiohttp
+from tqdm import tqdm
+
+from .coverage import CoverageService
+from .retry import RETRY, HTTPStatusError
+from .stamp import coverage_folders, proj_to_stamp, warp_to_stamp
+from .stream import CHUNK_SIZE, MEMORY, buffer_stream_async, content_length
+
+LOGGER = logging.getLogger('explore_australia')
+
+CoverageTask = collections.namedtuple('CoverageTask', 'key stamp layer wcs output remove_crs')
+CoverageTask.__doc__ = """
+A single (stamp, layer) download
+
+Parameters:
+    key - an identifier for the stamp (e.g. the id from the stamp locations)
+    stamp - the `Stamp` to pull data for
+    layer - the name of the layer (e.g. 'total_magnetic_intensity')
+    wcs - the URL pointing to the WCS endpoint for the layer
+    output - the path to write the warped GeoTIFF to
+    remove_crs - if True, remove the CRS from the output
+"""
+
+def stamp_tasks(name, stamp, no_crs=False, overwrite=False, make_folders=True):
+    """
+    Generate the download tasks for all the coverages of a single stamp
+
+    Creates the output folders as a side effect, mirroring `get_coverages`.
+
+    Parameters:
+        name - the root folder for the stamp
+        stamp - the `Stamp` to pull data for
+        no_crs - if True, remove CRS from data
+        overwrite - if False (the default), skip layers that already exist
+        make_folders - if False, don't create the output folders (e.g. if
+            we're only planning). Optional, defaults to True.
+
+    Yields:
+        CoverageTask instances
+    """
+    for wcses, folder in coverage_folders(name):
+        if make_folders and not folder.exists():
+            folder.mkdir(parents=True)
+        for layer, wcs in wcses.items():
+            output_tif = folder / f'{layer}.tif'
+            if overwrite or not output_tif.exists():
+                yield CoverageTask(name, stamp, layer, wcs, output_tif, no_crs)
+
+def campaign_tasks(stamps, no_crs=False, overwrite=False):
+    """
+    Generate the download tasks for a set of stamps
+
+    Stamps are only constructed as the tasks are consumed, so this can be
+    handed straight to the downloader for large campaigns.
+
+    Parameters:
+        stamps - a dataframe with 'id' and 'local_projection' columns
+            containing stamp info
+        no_crs - if True, remove CRS from data
+        overwrite - if False (the default), skip layers that already exist
+
+    Yields:
+        CoverageTask instances
+    """
+    for _, row in stamps.iterrows():
+        yield from stamp_tasks(row.id, proj_to_stamp(row.local_projection),
+                               no_crs=no_crs, overwrite=overwrite)
+
+def count_pending(stamps, overwrite=False):
+    """
+    Count the tasks `campaign_tasks` would generate for a set of stamps
+
+    Only looks for the outputs, so no stamps are built and no folders are
+    made.
+
+    Parameters:
+        stamps - a dataframe with an 'id' column
+        overwrite - if False (the default), don't count layers that
+            already exist
+
+    Returns:
+        the number of (stamp, layer) pairs still to get
+    """
+    return sum(overwrite or not (folder / f'{layer}.tif').exists()
+               for name in stamps.id
+               for wcses, folder in coverage_folders(name)
+               for layer in wcses)
+
+def _warp_buffer(buffer, task):
+    "Warp a buffered GetCoverage response into a stamp"
+    with buffer.open() as src:
+        return warp_to_stamp(src, task.stamp, output=task.output, remove_crs=task.remove_crs)
+
+class AsyncCoverageDownloader:
+
+    """
+    Downloads coverages for many (stamp, layer) pairs from a single event loop
+
+    All requests share one HTTP session so connections to each host are kept
+    alive and reused. The number of requests in flight to any one host is
+    capped at `per_host`, and tasks are pulled from the input iterable only
+    as fast as they can be processed so that memory use stays bounded.
+    Responses are streamed into memory in chunks under a ceiling shared
+    with every other download in the process, and warped onto the stamp
+    grids in a thread pool.
+
+    Parameters:
+        per_host - the maximum number of concurrent requests to each host.
+            Optional, defaults to 8.
+        concurrency - the maximum number of tasks in flight overall.
+            Optional, defaults to 64.
+        warp_workers - the number of threads used to warp coverages.
+            Optional, defaults to the number of CPUs.
+        timeout - the total timeout for a single request, in seconds.
+            Optional, defaults to 120.
+        retry - the `retry.RetryPolicy` for failed requests. Optional,
+            defaults to the shared `retry.RETRY` policy. While an
+            endpoint's circuit breaker is open its tasks fail straight away
+            rather than tying up a slot.
+        budget - the `stream.MemoryBudget` capping how many response bytes
+            are held at once. Optional, defaults to the shared
+            `stream.MEMORY` budget.
+    """
+
+    def __init__(self, per_host=8, concurrency=64, warp_workers=None, timeout=120, retry=None,
+                 budget=None):
+        self.retry = retry or RETRY
+        self.budget = MEMORY if budget is None else budget
+        self.per_host = per_host
+        self.concurrency = concurrency
+        self.warp_workers = warp_workers or os.cpu_count()
+        self.timeout = timeout
+        self._services, self._service_locks, self._host_limits = None, None, None
+
+    def run(self, tasks, total=None, show_progress=True):
+        """
+        Download and warp all of the given tasks
+
+        Parameters:
+            tasks - an iterable of CoverageTasks
+            total - the number of tasks, used for the progress bar. Optional.
+            show_progress - if True, show a progress bar
+
+        Returns:
+            a list of (task, exception) pairs for the tasks that failed
+        """
+        return asyncio.run(self.download(tasks, total=total, show_progress=show_progress))
+
+    async def download(self, tasks, total=None, show_progress=True):
+        "Coroutine version of `run`, for use inside an existing event loop"
+        self._services = {}
+        self._service_locks = collections.defaultdict(asyncio.Lock)
+        self._host_limits = collections.defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        failures = []
+
+        # The per-host semaphores are the only limit on requests, since they
+        # cover capabilities fetches as well as the connections here
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        with concurrent.futures.ThreadPoolExecutor(self.warp_workers) as executor, \
+             tqdm(total=total, desc='Downloading coverages', disable=not show_progress) as pbar:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                workers = [
+                    asyncio.ensure_future(self._worker(session, queue, executor, failures, pbar))
+                    for _ in range(self.concurrency)
+                ]
+                try:
+                    # Blocks when the queue is full so we only generate tasks as needed
+                    for task in tasks:
+                        await queue.put(task)
+                    for _ in workers:
+                        await queue.put(None)
+                    await asyncio.gather(*workers)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+        return failures
+
+    async def _worker(self, session, queue, executor, failures, pbar):
+        "Pull tasks off the queue until we get a sentinel"
+        while True:
+            task = await queue.get()
+            if task is None:
+                return
+            try:
+                await self.fetch(session, task, executor)
+            except Exception as exc:  # pylint: disable=W0703
+                LOGGER.error('Failed to get %s for stamp %s: %s', task.layer, task.key, exc)
+                failures.append((task, exc))
+            pbar.update(1)
+
+    async def fetch(self, session, task, executor):
+        """
+        Download a single coverage task and warp it onto the stamp grid
+
+        Parameters:
+            session - the aiohttp.ClientSession to use
+            task - the CoverageTask to get
+            executor - the executor to warp in
+
+        Returns:
+            the path to the output GeoTIFF
+        """
+        loop = asyncio.get_running_loop()
+        buffer = await self.retry.call_async(self._get, session, task, key=task.wcs)
+        with buffer:
+            return await loop.run_in_executor(executor, _warp_buffer, buffer, task)
+
+    async def _get(self, session, task):
+        "Make a single GetCoverage request for a task"
+        service = await self._service(task.wcs)
+        url, params = service.request_params(task.stamp.geometry.bounds)
+        async with self._host_limits[urlparse(url).netloc]:
+            async with session.get(url, params=params) as response:
+                if response.status != 200:
+                    raise HTTPStatusError(response.status)
+                return await buffer_stream_async(
+                    response.content.iter_chunked(CHUNK_SIZE),
+                    content_length(response.headers), budget=self.budget)
+
+    async def _service(self, url):
+        "Get the coverage service for a URL, only fetching capabilities once"
+        async with self._service_locks[url]:
+            if url not in self._services:
+                loop = asyncio.get_running_loop()
+                async with self._host_limits[urlparse(url).netloc]:
+                    self._services[url] = await loop.run_in_executor(None, CoverageService, url)
+        return self._services[url]
+
+def get_coverages_async(stamps, logfile='get_stamps.log', no_crs=False,
+                        per_host=8, concurrency=64, show_progress=True):
+    """
+    Get stamp raster data for many stamps using the asynchronous downloader
+
+    This is a drop-in alternative to `stamp.get_coverages_parallel` that
+    shares a single event loop across every (stamp, layer) request rather
+    than running one blocking thread per stamp.
+
+    Parameters:
+        stamps - a geodataframe with 'id' and 'local_projection'
+            columns containing stamp info
+        logfile - the file to log failures to
+        no_crs - if True, remove CRS from data
+        per_host - the maximum number of concurrent requests to each host
+        concurrency - the maximum number of tasks in flight overall
+        show_progress - if True, show a progress bar
+
+    Returns:
+        a list of (task, exception) pairs for the tasks that failed
+    """
+    # Set up basic logging to file
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                        datefmt='%m-%d %H:%M',
+                        filename=logfile,
+                        filemode='a')
+
+    # Layers which are already there are skipped, so count what's left
+    downloader = AsyncCoverageDownloader(per_host=per_host, concurrency=concurrency)
+    return downloader.run(campaign_tasks(stamps, no_crs=no_crs),
+                          total=count_pending(stamps), show_progress=show_progress)
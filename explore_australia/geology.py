@@ -0,0 +1,580 @@
+""" file:    geology.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Clip vector geology (e.g. the 1:1M geological units) out
+        for stamps using a spatial index, and burn it onto the stamp grids.
+        Layers can be ingested into FlatGeobuf files so stamps only read
+        the features under them.
+"""
+
+import functools
+import logging
+import pathlib
+import threading
+
+from affine import Affine
+import geopandas
+import numpy as np
+import pandas
+import pyogrio
+import pyproj
+import rasterio.features
+import shapely
+from scipy import ndimage
+from tqdm import tqdm
+
+from .coalesce import RequestPlanner
+from .reprojection import GEOJSON_PROJ, reproject, reproject_geometries
+from .stamp import proj_to_stamp, write_stamp
+
+LOGGER = logging.getLogger('explore_australia')
+
+def _keep_dimension(clipped, dimension):
+    """
+    Drop the bits of clipped geometries which are lower-dimensional than
+    the layer, e.g. the lines and points left where a unit just touches a
+    stamp's edge
+    """
+    clipped = np.asarray(clipped, dtype=object)
+    keep = ~shapely.is_empty(clipped) & (shapely.get_dimensions(clipped) == dimension)
+    collections = keep & (shapely.get_type_id(clipped) == 7)  # GeometryCollection
+    for idx in np.flatnonzero(collections):
+        parts = shapely.get_parts(clipped[idx])
+        clipped[idx] = shapely.union_all(parts[shapely.get_dimensions(parts) == dimension])
+    return clipped, keep
+
+def grid_footprint(stamp, margin=0.):
+    """
+    Get the outline of a stamp's pixel grid, in longitude and latitude
+
+    This can be a little different from `stamp.geometry`, which is the
+    rotated box the stamp was made from rather than the grid the rasters
+    end up on.
+
+    Parameters:
+        stamp - the `stamp.Stamp` to get the grid outline of
+        margin - how far to grow the outline by, in metres. Optional,
+            defaults to 0.
+
+    Returns:
+        a shapely Polygon in 'epsg:4326'
+    """
+    left, top = stamp.transform * (0, 0)
+    right, bottom = stamp.transform * (stamp.width, stamp.height)
+    outline = shapely.box(left - margin, bottom - margin, right + margin, top + margin)
+    outline = shapely.segmentize(outline, max(right - left, top - bottom) / 16)
+    return reproject(outline, stamp.crs, GEOJSON_PROJ)
+
+class GeologyIndex:
+
+    """
+    Clips a geology layer out for stamps, using an STRtree over the layer
+
+    The tree is built once, when the index is made, so each stamp only
+    looks at the features whose boxes overlap its own rather than scanning
+    the whole layer. Only those candidates are intersected with the stamp
+    and reprojected into the stamp's local CRS.
+
+        >>> index = GeologyIndex.from_file('GeologicUnitPolygons1M.shp')
+        >>> units = index.clip(stamp)
+
+    Use `clip_many` for lots of stamps at once: the tree is queried and
+    the candidates are intersected in single vectorised calls.
+
+    Parameters:
+        layer - a GeoDataFrame holding the geology. Features with missing
+            or empty geometries are dropped.
+    """
+
+    def __init__(self, layer):
+        valid = layer.geometry.notna() & ~layer.geometry.is_empty
+        self.layer = layer[valid.values]
+        self.crs = self.layer.crs or GEOJSON_PROJ
+        self.attributes = pandas.DataFrame(self.layer.drop(columns=self.layer.geometry.name))
+        self.geometries = np.asarray(self.layer.geometry.values, dtype=object)
+        dimensions = shapely.get_dimensions(self.geometries)
+        self.dimension = int(dimensions.max()) if len(dimensions) else 2
+        self.tree = shapely.STRtree(self.geometries)
+        LOGGER.debug(f'Indexed {len(self.layer)} geology features')
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Read a geology layer and index it
+
+        Parameters:
+            path - the shapefile (or anything else geopandas can read)
+            **kwargs - passed on to `geopandas.read_file` (e.g. `columns`
+                to only read the attributes you need)
+
+        Returns:
+            a GeologyIndex instance
+        """
+        return cls(geopandas.read_file(path, **kwargs))
+
+    def __len__(self):
+        return len(self.layer)
+
+    def values(self, column):
+        "Return the values of an attribute for the whole layer"
+        return self.layer[column]
+
+    def candidates(self, stamp):
+        """
+        Find the features intersecting a stamp
+
+        Parameters:
+            stamp - the `stamp.Stamp` to look under
+
+        Returns:
+            the positions of the intersecting features in `layer`
+        """
+        return self.tree.query(self._polygon(stamp.geometry), predicate='intersects')
+
+    def clip(self, stamp, to_crs=None):
+        """
+        Clip out the features under a stamp
+
+        Parameters:
+            stamp - the `stamp.Stamp` to clip out
+            to_crs - the CRS to return the features in. Optional, defaults
+                to the stamp's local CRS.
+
+        Returns:
+            a GeoDataFrame with the layer's attributes and the clipped
+            geometries, indexed like the layer
+        """
+        return self.clip_many([stamp], to_crs=to_crs)[0]
+
+    def clip_many(self, stamps, to_crs=None, outlines=None):
+        """
+        Clip out the features under lots of stamps
+
+        Parameters:
+            stamps - a list of `stamp.Stamp`s
+            to_crs - the CRS to return the features in. Optional, defaults
+                to each stamp's local CRS.
+            outlines - a list of polygons (in longitude and latitude) to
+                clip each stamp with. Optional, defaults to the stamp
+                geometries.
+
+        Returns:
+            a list of GeoDataFrames, one for each stamp (see `clip`)
+        """
+        if outlines is None:
+            outlines = [stamp.geometry for stamp in stamps]
+        polygons = np.asarray([self._polygon(outline) for outline in outlines], dtype=object)
+        which, features = self.tree.query(polygons, predicate='intersects')
+        order = np.lexsort((features, which))
+        which, features = which[order], features[order]
+        clipped, keep = _keep_dimension(
+            shapely.intersection(self.geometries[features], polygons[which]), self.dimension)
+        which, features, clipped = which[keep], features[keep], clipped[keep]
+
+        # Sorted by stamp, so each stamp's features are a slice
+        attributes = self.attributes.iloc[features]
+        bounds = np.searchsorted(which, np.arange(len(stamps) + 1))
+        results = []
+        for idx, stamp in enumerate(stamps):
+            start, end = bounds[idx], bounds[idx + 1]
+            crs = pyproj.CRS(to_crs or stamp.crs)
+            geometries = reproject_geometries(clipped[start:end], from_crs=self.crs, to_crs=crs)
+            results.append(geopandas.GeoDataFrame(
+                attributes.iloc[start:end], geometry=geometries, crs=crs))
+        return results
+
+    def _polygon(self, outline):
+        "Get a stamp's outline in the layer's CRS"
+        return reproject(outline, GEOJSON_PROJ, self.crs)
+
+class GeologyStore:
+
+    """
+    Clips geology out for stamps from a FlatGeobuf file written by
+    `ingest_geology`, reading only the features under the stamps
+
+    FlatGeobuf files carry a packed R-tree, with the features stored in
+    the tree's (Hilbert curve) order, so reading a bounding box only
+    touches the bits of the file under it. Stamps are grouped into
+    clusters of nearby stamps (see `coalesce.RequestPlanner`), each
+    cluster's box is read once and indexed with a `GeologyIndex`, and the
+    features are let go once the cluster's stamps are clipped. Each worker
+    only ever holds the features under one cluster in memory, rather than
+    the whole layer.
+
+        >>> store = GeologyStore('geology/GeologicUnitPolygons1M.fgb')
+        >>> units = store.clip(stamp)
+
+    This has the same `clip`/`clip_many`/`values` interface as
+    `GeologyIndex`, so can be used in a `GeologyRasterizer`. Features are
+    indexed by their position in the FlatGeobuf file.
+
+    Parameters:
+        path - the FlatGeobuf file to read from
+        columns - the attributes to read. Optional, defaults to all of them.
+        max_size - the largest box to read in one go, in the layer's units
+            (degrees for the GA layers). Optional, defaults to 0.5.
+    """
+
+    def __init__(self, path, columns=None, max_size=0.5):
+        self.path = str(path)
+        self.columns = None if columns is None else list(columns)
+        info = pyogrio.read_info(self.path)
+        self.crs = pyproj.CRS(info['crs']) if info['crs'] else GEOJSON_PROJ
+        self.count = info['features']
+        self.planner = RequestPlanner(max_size=max_size, max_overhead=1.)
+        self.features_read = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def values(self, column):
+        "Return the values of an attribute for the whole layer, without reading any geometries"
+        return pyogrio.read_dataframe(self.path, columns=[column], read_geometry=False)[column]
+
+    def read(self, bounds):
+        """
+        Read the features intersecting a bounding box
+
+        Parameters:
+            bounds - the box to read, given as (minx, miny, maxx, maxy) in
+                the layer's CRS
+
+        Returns:
+            a GeoDataFrame indexed by position in the file
+        """
+        features = pyogrio.read_dataframe(self.path, bbox=tuple(bounds), columns=self.columns,
+                                          fid_as_index=True)
+        with self._lock:
+            self.features_read += len(features)
+        return features
+
+    def clip(self, stamp, to_crs=None):
+        """
+        Clip out the features under a stamp
+
+        Parameters:
+            stamp - the `stamp.Stamp` to clip out
+            to_crs - the CRS to return the features in. Optional, defaults
+                to the stamp's local CRS.
+
+        Returns:
+            a GeoDataFrame with the layer's attributes and the clipped
+            geometries
+        """
+        return self.clip_many([stamp], to_crs=to_crs)[0]
+
+    def clip_many(self, stamps, to_crs=None, outlines=None):
+        """
+        Clip out the features under lots of stamps, reading each cluster
+        of nearby stamps in one go
+
+        Parameters:
+            stamps - a list of `stamp.Stamp`s
+            to_crs - the CRS to return the features in. Optional, defaults
+                to each stamp's local CRS.
+            outlines - a list of polygons (in longitude and latitude) to
+                clip each stamp with. Optional, defaults to the stamp
+                geometries.
+
+        Returns:
+            a list of GeoDataFrames, one for each stamp (see `clip`)
+        """
+        if outlines is None:
+            outlines = [stamp.geometry for stamp in stamps]
+        boxes = [reproject(outline, GEOJSON_PROJ, self.crs).bounds for outline in outlines]
+        results = [None] * len(stamps)
+        for bounds, members in self.planner.cluster(boxes):
+            index = GeologyIndex(self.read(bounds))
+            clipped = index.clip_many([stamps[idx] for idx in members], to_crs=to_crs,
+                                      outlines=[outlines[idx] for idx in members])
+            for idx, result in zip(members, clipped):
+                results[idx] = result
+        return results
+
+def ingest_geology(path, output, columns=None):
+    """
+    Convert a geology layer (e.g. one of the 1:1M shapefiles) into a
+    FlatGeobuf file, for clipping stamps with a `GeologyStore`
+
+    The file is written with a spatial index, so features end up sorted
+    along a Hilbert curve and bounding box reads only touch the features
+    under them. Features with missing or empty geometries are dropped.
+
+    Parameters:
+        path - the shapefile (or anything else geopandas can read)
+        output - the FlatGeobuf file to write
+        columns - the attributes to keep. Optional, defaults to all of them.
+
+    Returns:
+        the number of features written
+    """
+    layer = geopandas.read_file(path, columns=columns)
+    layer = layer[(layer.geometry.notna() & ~layer.geometry.is_empty).values]
+    pathlib.Path(output).parent.mkdir(parents=True, exist_ok=True)
+    layer.to_file(output, driver='FlatGeobuf', engine='pyogrio', index=False,
+                  SPATIAL_INDEX='YES')
+    LOGGER.info(f'Ingested {len(layer)} features from {path} into {output}')
+    return len(layer)
+
+@functools.lru_cache(maxsize=4)
+def open_geology(path):
+    """
+    Open a geology layer, once per process
+
+    FlatGeobuf files (see `ingest_geology`) are read as they're needed;
+    anything else is read in full and indexed.
+
+    Parameters:
+        path - a FlatGeobuf file, or a shapefile (or anything else
+            geopandas can read)
+
+    Returns:
+        a shared `GeologyStore` for FlatGeobuf files, or `GeologyIndex`
+        otherwise
+    """
+    if pathlib.Path(path).suffix.lower() == '.fgb':
+        return GeologyStore(path)
+    return GeologyIndex.from_file(path)
+
+def categories(values):
+    """
+    Number the distinct values of a categorical attribute
+
+    Parameters:
+        values - the attribute values (e.g. a GeoDataFrame column)
+
+    Returns:
+        a dictionary mapping each value to an integer label, starting from
+        1 in sorted order (0 is left for pixels with no unit)
+    """
+    distinct = sorted(set(pandas.Series(values).dropna()), key=str)
+    return {value: label for label, value in enumerate(distinct, start=1)}
+
+def rasterize_units(units, stamp, column, labels):
+    """
+    Burn unit polygons onto a stamp's grid as integer labels
+
+    Parameters:
+        units - a GeoDataFrame of units in the stamp's CRS (see
+            `GeologyIndex.clip`)
+        stamp - the `stamp.Stamp` to burn onto
+        column - the attribute to burn (e.g. lithology or age codes)
+        labels - a dictionary mapping attribute values to labels (see
+            `categories`). Values which aren't in it are left out.
+
+    Returns:
+        a (stamp.height, stamp.width) int32 array, 0 where there's no unit
+    """
+    shapes = [(geom, labels[value]) for geom, value in zip(units.geometry, units[column])
+              if value in labels]
+    if not shapes:
+        return np.zeros((stamp.height, stamp.width), dtype='int32')
+    return rasterio.features.rasterize(shapes, out_shape=(stamp.height, stamp.width),
+                                       transform=stamp.transform, fill=0, dtype='int32')
+
+def _padded_grid(stamp, padding):
+    "Return the transform and shape of a stamp's grid grown by some pixels on each side"
+    transform = stamp.transform * Affine.translation(-padding, -padding)
+    return transform, (stamp.height + 2 * padding, stamp.width + 2 * padding)
+
+def line_distance(lines, stamp, max_distance=None):
+    """
+    Work out the distance from each pixel to the nearest line (e.g. a
+    fault or contact)
+
+    Parameters:
+        lines - a GeoDataFrame or array of lines in the stamp's CRS
+        stamp - the `stamp.Stamp` to work on
+        max_distance - the distance to cap at, in metres. Optional, if
+            given lines up to this far outside the stamp are taken into
+            account, otherwise only lines on the stamp are seen and
+            stamps with no lines come out as NaN.
+
+    Returns:
+        a (stamp.height, stamp.width) float32 array of distances in metres
+    """
+    xres, yres = stamp.transform.a, abs(stamp.transform.e)
+    padding = 0 if max_distance is None else int(np.ceil(max_distance / min(xres, yres)))
+    transform, shape = _padded_grid(stamp, padding)
+    geoms = [geom for geom in getattr(lines, 'geometry', lines) if not geom.is_empty]
+    mask = np.zeros(shape, dtype='uint8')
+    if geoms:
+        mask = rasterio.features.rasterize(geoms, out_shape=shape, transform=transform,
+                                           fill=0, all_touched=True, dtype='uint8')
+    if not mask.any():
+        fill = np.nan if max_distance is None else max_distance
+        return np.full((stamp.height, stamp.width), fill, dtype='float32')
+
+    distance = ndimage.distance_transform_edt(mask == 0, sampling=(yres, xres))
+    distance = distance[padding:padding + stamp.height, padding:padding + stamp.width]
+    if max_distance is not None:
+        np.minimum(distance, max_distance, out=distance)
+    return distance.astype('float32')
+
+def line_density(lines, stamp, radius=1000.):
+    """
+    Work out the length of line (e.g. faults or contacts) per unit area
+    around each pixel
+
+    Each line segment's length is binned into the pixel holding its
+    midpoint, and the lengths are summed over a disc around each pixel.
+    Lines up to `radius` outside the stamp count towards pixels near
+    the edges.
+
+    Parameters:
+        lines - a GeoDataFrame or array of lines in the stamp's CRS
+        stamp - the `stamp.Stamp` to work on
+        radius - the radius of the disc, in metres. Optional, defaults
+            to 1 km.
+
+    Returns:
+        a (stamp.height, stamp.width) float32 array in km of line per km²
+    """
+    xres, yres = stamp.transform.a, abs(stamp.transform.e)
+    ny, nx = int(radius // yres), int(radius // xres)
+    padding = max(nx, ny)
+    transform, (height, width) = _padded_grid(stamp, padding)
+
+    # Segments are between consecutive points on the same part
+    geoms = np.asarray(getattr(lines, 'geometry', lines), dtype=object)
+    geoms = shapely.segmentize(geoms, min(xres, yres) / 2)
+    coords, index = shapely.get_coordinates(shapely.get_parts(geoms), return_index=True)
+    same = index[1:] == index[:-1]
+    starts, ends = coords[:-1][same], coords[1:][same]
+    lengths = np.hypot(*(ends - starts).T)
+    cols, rows = ~transform * ((starts + ends).T / 2)
+    inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+    lengths_per_pixel = np.zeros((height, width))
+    np.add.at(lengths_per_pixel, (rows[inside].astype(int), cols[inside].astype(int)),
+              lengths[inside])
+
+    # Sum over a disc and divide by its area
+    ys, xs = np.ogrid[-ny:ny + 1, -nx:nx + 1]
+    disc = ((ys * yres) ** 2 + (xs * xres) ** 2 <= radius ** 2).astype(float)
+    total = ndimage.convolve(lengths_per_pixel, disc, mode='constant')
+    total = total[padding:padding + stamp.height, padding:padding + stamp.width]
+    area = disc.sum() * xres * yres
+    return (1e3 * total / area).astype('float32')  # m / m² to km / km²
+
+class GeologyRasterizer:
+
+    """
+    Burns geology onto stamp grids as extra channels, alongside the
+    coverage layers
+
+    Each attribute in `columns` becomes a band of integer labels, numbered
+    from the whole layer so labels mean the same thing in every stamp
+    (see `labels`). Each line layer (e.g. faults and contacts) becomes a
+    `<name>_distance` band (see `line_distance`) and a `<name>_density`
+    band (see `line_density`).
+
+        >>> rasterizer = GeologyRasterizer(
+        ...     units=open_geology('GeologicUnitPolygons1M.shp'),
+        ...     columns=['LITHOLOGY', 'MAX_AGE'],
+        ...     lines={'faults': open_geology('LinearFeatures1M.shp'),
+        ...            'contacts': open_geology('Contacts1M.shp')})
+        >>> data = rasterizer(stamp)
+
+    Parameters:
+        units - a `GeologyIndex` or `GeologyStore` of unit polygons.
+            Optional.
+        columns - the unit attributes to burn as labels. Optional.
+        lines - a dictionary mapping names to `GeologyIndex`es or
+            `GeologyStore`s of line features. Optional.
+        max_distance - where to cap line distances, in metres. Optional,
+            defaults to 5 km.
+        density_radius - the radius to measure line density over, in
+            metres. Optional, defaults to 1 km.
+    """
+
+    def __init__(self, units=None, columns=(), lines=None, max_distance=5000.,
+                 density_radius=1000.):
+        if columns and units is None:
+            raise ValueError('Need a units layer to burn attributes from')
+        self.units = units
+        self.columns = list(columns)
+        self.lines = dict(lines or {})
+        self.max_distance = max_distance
+        self.density_radius = density_radius
+        self.labels = {column: categories(units.values(column)) for column in self.columns}
+
+    @property
+    def bands(self):
+        "The names of the bands we make"
+        names = list(self.columns)
+        for name in self.lines:
+            names.extend([f'{name}_distance', f'{name}_density'])
+        return names
+
+    def __call__(self, stamp):
+        "Rasterize the geology for a stamp, returning an (nbands, height, width) float32 array"
+        return self.rasterize_many([stamp])[0]
+
+    def rasterize_many(self, stamps):
+        """
+        Rasterize the geology for lots of stamps, clipping each layer out
+        for all the stamps in one go (see `GeologyIndex.clip_many`)
+
+        Parameters:
+            stamps - a list of `stamp.Stamp`s
+
+        Returns:
+            a list of (nbands, height, width) float32 arrays
+        """
+        # Clip to the pixel grids, with a margin for the lines so distances
+        # and densities near the edges can see lines just outside
+        units = [None] * len(stamps)
+        if self.columns:
+            units = self.units.clip_many(
+                stamps, outlines=[grid_footprint(stamp) for stamp in stamps])
+        margin = max(self.max_distance or 0, self.density_radius)
+        margins = [grid_footprint(stamp, margin=margin) for stamp in stamps]
+        lines = {name: index.clip_many(stamps, outlines=margins)
+                 for name, index in self.lines.items()}
+
+        results = []
+        for idx, stamp in enumerate(stamps):
+            bands = [rasterize_units(units[idx], stamp, column, self.labels[column])
+                     for column in self.columns]
+            for name in self.lines:
+                bands.append(line_distance(lines[name][idx], stamp,
+                                           max_distance=self.max_distance))
+                bands.append(line_density(lines[name][idx], stamp, radius=self.density_radius))
+            results.append(np.stack(bands).astype('float32') if bands
+                           else np.empty((0, stamp.height, stamp.width), dtype='float32'))
+        return results
+
+def rasterize_geology(stamps, rasterizer, no_crs=False, batch_size=64, show_progress=True):
+    """
+    Rasterize geology for many stamps, writing each band into the stamp's
+    folder next to its coverages (as `<id>/geology/<band>.tif`)
+
+    Stamps are done in batches so each layer is only queried once per
+    batch, and stamps with all their bands written already are skipped.
+
+    Parameters:
+        stamps - a dataframe with 'id' and 'local_projection' columns
+            containing stamp info
+        rasterizer - the `GeologyRasterizer` to use
+        no_crs - if True, remove CRS from data
+        batch_size - the number of stamps to clip out at once
+        show_progress - if True, show a progress bar
+    """
+    todo = []
+    for _, row in stamps.iterrows():
+        folder = pathlib.Path(row.id) / 'geology'
+        if not all((folder / f'{band}.tif').exists() for band in rasterizer.bands):
+            todo.append((folder, proj_to_stamp(row.local_projection)))
+
+    with tqdm(total=len(todo), desc='Rasterizing geology', disable=not show_progress) as pbar:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            for (folder, stamp), data in zip(
+                    batch, rasterizer.rasterize_many([stamp for _, stamp in batch])):
+                folder.mkdir(parents=True, exist_ok=True)
+                for band, values in zip(rasterizer.bands, data):
+                    write_stamp(values, stamp, output=folder / f'{band}.tif', remove_crs=no_crs)
+                pbar.update(1)
@@ -5,17 +5,43 @@
     description: Creating postage stamps for geospatial learners
 """
 
-from shapely.geometry import LineString, Point
-from shapely.ops import polygonize
-import pint
+import functools
+
+import shapely
+from shapely.geometry import LineString, Polygon
 import numpy as np
 
 from .reprojection import reproject
-from .rotation import rotate
+from .rotation import rotate, rotate_coordinates
 
 # Constances
-UNITS = pint.UnitRegistry()
-EARTH_RADIUS = 6.3781e6 * UNITS.m
+EARTH_RADIUS_M = 6.3781e6  # metres
+
+@functools.lru_cache(maxsize=None)
+def get_units():
+    """
+    Return the pint unit registry, creating it the first time it's needed
+
+    Building a registry is slow, and we only need one for callers who
+    pass pint quantities in.
+    """
+    import pint
+    return pint.UnitRegistry()
+
+def __getattr__(name):
+    "Create UNITS and EARTH_RADIUS lazily, so importing this module doesn't load pint"
+    if name == 'UNITS':
+        return get_units()
+    elif name == 'EARTH_RADIUS':
+        return EARTH_RADIUS_M * get_units().m
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _magnitude(value, units):
+    "Strip the units off a pint quantity, or pass plain numbers through"
+    try:
+        return value.to(units).magnitude
+    except AttributeError:
+        return value
 
 def linterpolate(point_a, point_b, npoints=2):
     """
@@ -52,34 +78,33 @@ def make_box(centre, distance, projection=None, output_projection=None, npoints=
     Returns:
         a geometry with either an approximated polygon or a box approximating the polygon
     """
-    # Constants and units
-    distance = distance * UNITS.km
+    distance = _magnitude(distance, 'km')
 
     # Project input points to WGS84 -> radians
-    if projection is None:
-        lon0, lat0 = (centre.xy * UNITS.deg).to('rad')
-    else:
-        lon0, lat0 = (reproject(centre, projection, 'epsg:4326').xy * UNITS.deg).to('rad')
+    if projection is not None:
+        centre = reproject(centre, projection, 'epsg:4326')
+    lon0, lat0 = np.radians(centre.x), np.radians(centre.y)
 
     # Construct difference in latitude first (since this is independent of longitude)
-    angular_dist = (distance / EARTH_RADIUS) * UNITS.rad
+    angular_dist = distance * 1e3 / EARTH_RADIUS_M
     lat1 = lat0 - angular_dist / 2
     lat2 = lat0 + angular_dist / 2
 
-    # For each corner, construct the minimum and maximum seperately
-    delta_lon = lambda lat: angular_dist / np.cos(lat)
-    to_point = lambda x, y: Point(x.to('deg').magnitude, y.to('deg').magnitude)
-    top_left = to_point(lon0 - delta_lon(lat1) / 2, lat1)
-    top_right = to_point(lon0 + delta_lon(lat1) / 2, lat1)
-    bottom_left = to_point(lon0 - delta_lon(lat2) / 2, lat2)
-    bottom_right = to_point(lon0 + delta_lon(lat2) / 2, lat2)
-
-    # Interpolate along sides, reproject
-    top = linterpolate(top_left, top_right, npoints)
-    right = linterpolate(top_right, bottom_right, npoints)
-    bottom = linterpolate(bottom_left, bottom_right, npoints)
-    left = linterpolate(bottom_left, top_left, npoints)
-    shape = next(polygonize((top, right, bottom, left)))
+    # The corners, in the order we walk around the box
+    half_dlon1 = angular_dist / np.cos(lat1) / 2
+    half_dlon2 = angular_dist / np.cos(lat2) / 2
+    corners = np.degrees([
+        (lon0 + half_dlon1, lat1),
+        (lon0 - half_dlon1, lat1),
+        (lon0 - half_dlon2, lat2),
+        (lon0 + half_dlon2, lat2)
+    ])
+
+    # Interpolate along sides
+    steps = np.linspace(0, 1, npoints)[:-1, np.newaxis, np.newaxis]
+    ends = np.roll(corners, -1, axis=0)
+    ring = (corners + steps * (ends - corners)).transpose(1, 0, 2).reshape(-1, 2)
+    shape = Polygon(ring)
 
     # Handle reprojection logic
     if output_projection is None and projection is not None:  # go back from wgs84
@@ -102,5 +127,64 @@ def make_stamp(centre, angle=None, distance=25):
         angle - the angle to rotate the box through, in degrees
         distance - the approximate length of the sides of the box (in km)
     """
-    angle = angle or np.random.uniform(0, 360)
+    angle = _magnitude(angle, 'deg') or np.random.uniform(0, 360)
     return rotate(make_box(centre, distance=distance), centre, angle)
+
+def make_stamps(lons, lats, angles=None, distance=25, npoints=2, as_frame=False):
+    """
+    Make many rotated boxes at once
+
+    This gives the same boxes as calling `make_stamp` for each centre,
+    but all the corners are calculated together with numpy so it's fast
+    enough to generate hundreds of thousands of candidate stamps.
+
+    Parameters:
+        lons, lats - arrays of the longitude and latitude of the centres
+            of the boxes, in degrees
+        angles - an array of angles to rotate each box through, in degrees.
+            Optional, if None then random angles are used.
+        distance - the approximate length of the sides of the boxes (in
+            km), either as a scalar or an array
+        npoints - number of points on each side, must be >= 2
+        as_frame - if True, return a geopandas GeoDataFrame with 'lon',
+            'lat', 'angle' and 'geometry' columns instead of an array
+
+    Returns:
+        a numpy array of shapely Polygons (or a GeoDataFrame, see above)
+    """
+    lons, lats = np.atleast_1d(lons).astype(float), np.atleast_1d(lats).astype(float)
+    if angles is None:
+        angles = np.random.uniform(0, 360, len(lons))
+    angles = np.broadcast_to(np.asarray(angles, dtype=float), lons.shape)
+    distance = np.broadcast_to(np.asarray(_magnitude(distance, 'km'), dtype=float), lons.shape)
+
+    # Corners of the unrotated boxes, as in make_box
+    angular_dist = distance * 1000 / EARTH_RADIUS_M
+    lon0, lat0 = np.radians(lons), np.radians(lats)
+    lat1, lat2 = lat0 - angular_dist / 2, lat0 + angular_dist / 2
+    half_dlon1 = angular_dist / np.cos(lat1) / 2
+    half_dlon2 = angular_dist / np.cos(lat2) / 2
+    corners = np.degrees(np.stack([
+        np.stack([lon0 - half_dlon1, lat1], axis=-1),
+        np.stack([lon0 + half_dlon1, lat1], axis=-1),
+        np.stack([lon0 + half_dlon2, lat2], axis=-1),
+        np.stack([lon0 - half_dlon2, lat2], axis=-1),
+    ], axis=1))  # (N, 4, 2)
+
+    # Interpolate along the sides to get closed rings
+    steps = np.linspace(0, 1, npoints)[:-1].reshape(1, 1, -1, 1)
+    starts, ends = corners, np.roll(corners, -1, axis=1)
+    ring = (starts[:, :, np.newaxis] + steps * (ends - starts)[:, :, np.newaxis])
+    ring = ring.reshape(len(lons), -1, 2)
+    ring = np.concatenate([ring, ring[:, :1]], axis=1)  # (N, M, 2)
+
+    # Rotate each ring about its centre in one batch
+    ring = rotate_coordinates(ring, np.column_stack([lons, lats]), angles)
+
+    polygons = shapely.polygons(ring)
+    if as_frame:
+        import geopandas
+        return geopandas.GeoDataFrame(
+            {'lon': lons, 'lat': lats, 'angle': angles},
+            geometry=polygons, crs='epsg:4326')
+    return polygons
@@ -0,0 +1,296 @@
+""" file:    manifest.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Resumable campaigns, with the state of every (stamp, layer)
+        task kept in an SQLite manifest
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+
+from tqdm import tqdm
+
+from .adaptive import AdaptiveController
+from .coalesce import RequestPlanner, coalesce_tasks
+from .stamp import coverage_folders, proj_to_stamp, read_stamp, write_stamp
+
+LOGGER = logging.getLogger('explore_australia')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    stamp_id TEXT NOT NULL,
+    layer TEXT NOT NULL,
+    wcs TEXT NOT NULL,
+    projection TEXT NOT NULL,
+    output TEXT NOT NULL,
+    remove_crs INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER,
+    checksum TEXT,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    PRIMARY KEY (stamp_id, layer)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, stamp_id);
+"""
+
+ManifestTask = collections.namedtuple(
+    'ManifestTask', 'stamp_id layer wcs projection output remove_crs attempts')
+ManifestTask.__doc__ = """
+A (stamp, layer) task that still needs doing
+
+Parameters:
+    stamp_id - the identifier for the stamp
+    layer - the name of the layer
+    wcs - the URL pointing to the WCS endpoint for the layer
+    projection - the local projection for the stamp (see `stamp.proj_to_stamp`)
+    output - the path to write the GeoTIFF to
+    remove_crs - if True, remove the CRS from the output
+    attempts - the number of times the task has been tried before
+"""
+
+def file_checksum(path, chunk_size=1 << 20):
+    """
+    Return the size and SHA-256 checksum of a file
+
+    Parameters:
+        path - the file to check
+        chunk_size - the number of bytes to read at a time
+
+    Returns:
+        the number of bytes in the file and the hex digest
+    """
+    digest, nbytes = hashlib.sha256(), 0
+    with open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            digest.update(chunk)
+            nbytes += len(chunk)
+    return nbytes, digest.hexdigest()
+
+class Manifest:
+
+    """
+    An SQLite record of every (stamp, layer) task in a campaign
+
+    Each task keeps its status ('pending', 'running', 'done' or 'failed'),
+    the number of attempts, the size and SHA-256 checksum of its output
+    and when it was started and finished. Working out what's left to do
+    after a crash is a single indexed query (see `pending`) rather than
+    checking every output on disk, and tasks that were part-way through
+    when we crashed are still 'running', so they get redone.
+
+    The manifest can be shared between threads.
+
+    Parameters:
+        path - the location of the SQLite database. It's created if it
+            doesn't exist.
+    """
+
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM tasks')[0][0]
+
+    def close(self):
+        "Close the database connection"
+        self._conn.close()
+
+    def add_stamps(self, stamps, no_crs=False, folders=coverage_folders):
+        """
+        Add the tasks for a set of stamps to the manifest
+
+        Tasks already in the manifest are left alone, so this is safe to
+        call again with the same stamps.
+
+        Parameters:
+            stamps - a dataframe with 'id' and 'local_projection' columns
+                containing stamp info
+            no_crs - if True, remove CRS from the outputs
+            folders - a function taking a stamp id and returning
+                (endpoints, folder) pairs. Optional, defaults to
+                `stamp.coverage_folders`.
+
+        Returns:
+            the number of new tasks added
+        """
+        rows = (
+            (str(row.id), layer, wcs, row.local_projection,
+             str(pathlib.Path(folder) / f'{layer}.tif'), int(no_crs))
+            for _, row in stamps.iterrows()
+            for wcses, folder in folders(str(row.id))
+            for layer, wcs in wcses.items()
+        )
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tasks '
+                '(stamp_id, layer, wcs, projection, output, remove_crs) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return self._conn.total_changes - before
+
+    def pending(self, max_attempts=None):
+        """
+        Return the tasks which haven't been done yet
+
+        This includes tasks which failed, or which were running when a
+        previous run stopped.
+
+        Parameters:
+            max_attempts - skip tasks that have already been tried this
+                many times. Optional, defaults to retrying everything.
+
+        Returns:
+            a list of ManifestTask instances, ordered by stamp
+        """
+        query = (
+            'SELECT stamp_id, layer, wcs, projection, output, remove_crs, attempts '
+            'FROM tasks WHERE status IN (?, ?, ?)'
+        )
+        params = [self.PENDING, self.RUNNING, self.FAILED]
+        if max_attempts is not None:
+            query += ' AND attempts < ?'
+            params.append(max_attempts)
+        query += ' ORDER BY stamp_id, layer'
+        return [ManifestTask(*row) for row in self._query(query, params)]
+
+    def start(self, stamp_id, layer):
+        "Mark a task as running"
+        self._update(
+            'UPDATE tasks SET status = ?, attempts = attempts + 1, started = ?, '
+            'finished = NULL, error = NULL WHERE stamp_id = ? AND layer = ?',
+            (self.RUNNING, time.time(), stamp_id, layer))
+
+    def finish(self, stamp_id, layer, nbytes, checksum):
+        "Mark a task as done, recording the size and checksum of the output"
+        self._update(
+            'UPDATE tasks SET status = ?, bytes = ?, checksum = ?, finished = ? '
+            'WHERE stamp_id = ? AND layer = ?',
+            (self.DONE, nbytes, checksum, time.time(), stamp_id, layer))
+
+    def fail(self, stamp_id, layer, error):
+        "Mark a task as failed, recording the error"
+        self._update(
+            'UPDATE tasks SET status = ?, error = ?, finished = ? '
+            'WHERE stamp_id = ? AND layer = ?',
+            (self.FAILED, str(error), time.time(), stamp_id, layer))
+
+    def counts(self):
+        "Return the number of tasks with each status"
+        return dict(self._query('SELECT status, COUNT(*) FROM tasks GROUP BY status'))
+
+    def task(self, stamp_id, layer):
+        "Return the record for a single task as a dictionary"
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT * FROM tasks WHERE stamp_id = ? AND layer = ?', (stamp_id, layer))
+            row = cursor.fetchone()
+            names = [col[0] for col in cursor.description]
+        return dict(zip(names, row)) if row is not None else None
+
+    def _query(self, query, params=()):
+        "Run a query and return all the rows"
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def _update(self, query, params):
+        "Run an update in its own transaction"
+        with self._lock, self._conn:
+            self._conn.execute(query, params)
+
+def run_manifest(manifest, nworkers=None, tiles=None, source=None, max_attempts=None,
+                 show_progress=True, controller=None, coalesce=None):
+    """
+    Run all the tasks in a manifest which haven't been done yet
+
+    Each output is written atomically and its size and checksum are
+    recorded, so this can be interrupted and rerun (see the
+    `coverage_campaign resume` command) without ever trusting a half
+    written GeoTIFF.
+
+    Parameters:
+        manifest - a Manifest instance
+        nworkers - a fixed number of tasks to run at once. Optional, by
+            default the number of downloads and warps running at once is
+            tuned as we go (see `adaptive.AdaptiveController`).
+        tiles - a `tiles.TileCache` to cut stamps out of. Optional.
+        source - where to read coverages from (see `stamp.read_stamp`).
+            Optional, defaults to the WCS.
+        max_attempts - skip tasks that have already been tried this many
+            times. Optional, defaults to retrying everything.
+        show_progress - if True, show a progress bar
+        controller - the `adaptive.AdaptiveController` to use when
+            nworkers isn't given. Optional.
+        coalesce - a `coalesce.RequestPlanner` (or True for the default
+            one). Optional, if given then overlapping stamps share one
+            GetCoverage per layer (see `coalesce.CoalescingSource`).
+
+    Returns:
+        the number of tasks with each status after the run
+    """
+    if nworkers is None:
+        controller = controller or AdaptiveController()
+        nworkers = controller.max_workers
+    tasks = manifest.pending(max_attempts=max_attempts)
+    LOGGER.info(f'{len(tasks)} tasks to do in {manifest.path}')
+
+    # Stamps are shared between a stamp's layers so warp plans get reused
+    stamps = {}
+    def _stamp(task):
+        stamp = stamps.get(task.projection)
+        if stamp is None:
+            stamp = stamps[task.projection] = proj_to_stamp(task.projection)
+        return stamp
+
+    if coalesce:
+        planner = coalesce if isinstance(coalesce, RequestPlanner) else None
+        tasks, source = coalesce_tasks(tasks, planner=planner, source=source,
+                                       bounds=lambda task: _stamp(task).geometry.bounds)
+
+    def _run(task):
+        manifest.start(task.stamp_id, task.layer)
+        stamp = _stamp(task)
+        output = pathlib.Path(task.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        data = read_stamp(task.wcs, stamp, tiles=tiles, source=source, controller=controller)
+        write_stamp(data, stamp, output=output, remove_crs=bool(task.remove_crs))
+        manifest.finish(task.stamp_id, task.layer, *file_checksum(output))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
+        futures = {executor.submit(_run, task): task for task in tasks}
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(tasks),
+                           desc='Running tasks', disable=not show_progress):
+            task = futures[future]
+            try:
+                future.result()
+            except Exception as exc:  # pylint: disable=W0703
+                LOGGER.error('Stamp %s failed to get %s: %s', task.stamp_id, task.layer, exc)
+                manifest.fail(task.stamp_id, task.layer, exc)
+    if controller is not None:
+        LOGGER.info(f'Worker controller finished with {controller.metrics()}')
+    if coalesce:
+        LOGGER.info(f'Coalesced requests: {source.report()}')
+        source.clear()
+    return manifest.counts()
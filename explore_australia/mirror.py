@@ -0,0 +1,186 @@
+""" file:    mirror.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Read coverages from local copies of the national grids
+        rather than over WCS
+"""
+
+import contextlib
+import logging
+import pathlib
+import threading
+from urllib.parse import urlparse
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.windows import Window, from_bounds
+
+from .warp import Coverage
+
+LOGGER = logging.getLogger('explore_australia')
+
+def snap_window(bounds, transform, height, width, padding=1):
+    """
+    Work out the window of pixels on a grid covering a bounding box
+
+    The window is snapped outwards onto whole pixels, padded and then
+    clipped to the grid.
+
+    Parameters:
+        bounds - a bounding box given as (minx, miny, maxx, maxy)
+        transform - the affine transform of the grid
+        height, width - the shape of the grid
+        padding - the number of extra pixels to take around the window.
+            Optional, defaults to 1.
+
+    Returns:
+        a rasterio Window
+    """
+    window = from_bounds(*bounds, transform=transform)
+    col_off = int(np.floor(window.col_off)) - padding
+    row_off = int(np.floor(window.row_off)) - padding
+    col_end = int(np.ceil(window.col_off + window.width)) + padding
+    row_end = int(np.ceil(window.row_off + window.height)) + padding
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)\
+        .intersection(Window(0, 0, width, height))
+
+class LocalMirror:
+
+    """
+    Reads coverages from local copies of the grids behind the WCS endpoints
+
+    Every layer in `endpoints` is a national NetCDF grid served up by
+    THREDDS. If you've downloaded those grids (or GeoTIFF conversions of
+    them) this reads just the window each stamp needs straight off disk,
+    so the network drops out of the loop entirely.
+
+    By default the local copy of a WCS endpoint is the file in `root`
+    with the same name as the endpoint (e.g. `radmap_v3_2015_filtered_dose.nc`
+    for the filtered dose layer), or the same name with a `.nc4`, `.tif`
+    or `.tiff` suffix. Use `paths` to point layers somewhere else.
+
+    Each thread keeps its own handles to the grids open, so the headers
+    are only parsed once per thread and reads only touch the blocks or
+    chunks under the window. `close` closes the handles from every thread.
+
+    This has the same `covers`/`open` interface as `coverage.WCSSource`
+    and `tiles.TileCache`, so it can be passed as the `source` wherever
+    stamps are read.
+
+    Parameters:
+        root - the directory holding the local grids
+        paths - a dictionary mapping WCS URLs to local paths (or any
+            other name GDAL can open, e.g. 'NETCDF:"grid.nc":variable').
+            Optional.
+        crs - the CRS to assume for grids which don't specify one.
+            Optional, defaults to 'EPSG:4326'.
+        padding - the number of extra pixels to read around each window.
+            Optional, defaults to 1.
+    """
+
+    suffixes = ('.nc', '.nc4', '.tif', '.tiff')
+
+    # Reads come off local disk, so they don't need a download slot
+    local = True
+
+    def __init__(self, root, paths=None, crs='EPSG:4326', padding=1):
+        self.root = pathlib.Path(root)
+        self.paths = dict(paths or {})
+        self.crs = crs
+        self.padding = padding
+        self._local = threading.local()
+        self._opened = []
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def path(self, wcs):
+        """
+        Return the local copy of the grid behind a WCS endpoint
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+
+        Returns:
+            the path to the local grid, or None if there isn't one
+        """
+        if wcs in self.paths:
+            return self.paths[wcs]
+        stem = pathlib.Path(urlparse(wcs).path).stem
+        for suffix in self.suffixes:
+            candidate = self.root / (stem + suffix)
+            if candidate.exists():
+                return candidate
+        return None
+
+    def covers(self, wcs, bounds):
+        "Check whether we have a local grid overlapping a bounding box"
+        path = self.path(wcs)
+        if path is None:
+            return False
+        left, bottom, right, top = self._dataset(path).bounds
+        minx, miny, maxx, maxy = bounds
+        return minx < right and maxx > left and miny < top and maxy > bottom
+
+    @contextlib.contextmanager
+    def open(self, wcs, bounds):
+        """
+        Read the window of a local grid covering a bounding box
+
+        Use as a context manager:
+
+            with mirror.open(wcs, bounds) as src:
+                data = src.read(1)
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Yields:
+            a `warp.Coverage` holding the window, which reads like an open
+            rasterio dataset
+        """
+        path = self.path(wcs)
+        if path is None:
+            raise FileNotFoundError(f'No local copy of {wcs} in {self.root}')
+        src = self._dataset(path)
+        window = self.window(src, bounds)
+        yield Coverage(src.read(1, window=window), src.crs or CRS.from_user_input(self.crs),
+                       src.window_transform(window), src.nodata)
+
+    def window(self, src, bounds):
+        """
+        Work out the window of pixels covering a bounding box (see
+        `snap_window`)
+
+        Parameters:
+            src - an open rasterio dataset
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Returns:
+            a rasterio Window
+        """
+        return snap_window(bounds, src.transform, src.height, src.width, self.padding)
+
+    def close(self):
+        "Close the grids opened by every thread"
+        with self._lock:
+            opened, self._opened = self._opened, []
+            self._generation += 1
+        for src in opened:
+            src.close()
+
+    def _dataset(self, path):
+        "Get this thread's handle on a grid, opening it if needed"
+        # Handles from before the last `close` are stale
+        if getattr(self._local, 'generation', None) != self._generation:
+            self._local.datasets, self._local.generation = {}, self._generation
+        datasets = self._local.datasets
+        key = str(path)
+        if key not in datasets:
+            LOGGER.debug(f'Opening local grid {key}')
+            datasets[key] = rasterio.open(key)
+            with self._lock:
+                self._opened.append(datasets[key])
+        return datasets[key]
@@ -0,0 +1,348 @@
+""" file:    pipeline.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Fetch, warp and write coverages in separate pipelined
+        stages
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from tqdm import tqdm
+
+from .adaptive import cpu_count
+from .download import campaign_tasks, count_pending
+from .stamp import find_source, write_stamp
+from .warp import ProcessWarper, ThreadWarper
+
+LOGGER = logging.getLogger('explore_australia')
+
+# Put on a queue to tell a stage's workers there's nothing more coming
+_DONE = None
+
+class StageStats:
+
+    """
+    Thread-safe counters for a pipeline stage
+
+    Time is split three ways: `busy` doing the work, `starved` waiting for
+    work from upstream, and `blocked` waiting for room downstream. A stage
+    that's mostly starved has too many workers (or the stage before it has
+    too few), and one that's mostly blocked is being held up by the stage
+    after it.
+
+    Parameters:
+        name - the name of the stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items, self.failed, self.batches = 0, 0, 0
+        self.busy, self.starved, self.blocked = 0., 0., 0.
+        self.started, self.finished = None, None
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        "Add to the counters"
+        with self._lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    @property
+    def elapsed(self):
+        "How long the stage has been running, in seconds"
+        if self.started is None:
+            return 0.
+        return (self.finished or time.monotonic()) - self.started
+
+    def metrics(self):
+        "Return the counters, and the throughput in items per second, as a dictionary"
+        with self._lock:
+            elapsed = self.elapsed
+            return {
+                'items': self.items,
+                'failed': self.failed,
+                'batches': self.batches,
+                'busy': self.busy,
+                'starved': self.starved,
+                'blocked': self.blocked,
+                'throughput': self.items / elapsed if elapsed else None
+            }
+
+class Stage:
+
+    """
+    A pool of threads taking (task, payload) items off one bounded queue,
+    doing some work on them and putting the results on the next
+
+    Parameters:
+        name - the name of the stage
+        func - a function taking a task and its payload and returning the
+            next payload
+        nworkers - the number of threads to run
+        inbox - the queue to take items from
+        outbox - the queue to put results on. Optional, if None results
+            are dropped (i.e. this is the last stage).
+        batch_size - the most items a worker takes at once. Optional,
+            defaults to 1.
+    """
+
+    def __init__(self, name, func, nworkers, inbox, outbox=None, batch_size=1):
+        self.func = func
+        self.nworkers = nworkers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.stats = StageStats(name)
+        self._threads = []
+
+    @property
+    def name(self):
+        return self.stats.name
+
+    def start(self, on_failure, on_finish=None):
+        """
+        Start the workers
+
+        Parameters:
+            on_failure - called with the task and exception when a task
+                fails
+            on_finish - called with each task that makes it through the
+                stage. Optional.
+        """
+        self.stats.started = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._work, args=(on_failure, on_finish),
+                             name=f'{self.name}-{idx}', daemon=True)
+            for idx in range(self.nworkers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        "Tell the workers nothing more is coming"
+        for _ in self._threads:
+            self.inbox.put(_DONE)
+
+    def join(self):
+        "Wait for the workers to finish what's left"
+        for thread in self._threads:
+            thread.join()
+        self.stats.finished = time.monotonic()
+
+    def _work(self, on_failure, on_finish):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            start, results = time.monotonic(), []
+            for task, payload in batch:
+                try:
+                    results.append((task, self.func(task, payload)))
+                except Exception as exc:  # pylint: disable=W0703
+                    LOGGER.error(f'{self.name} failed for {task.layer} ({task.key}): {exc}')
+                    self.stats.add(failed=1)
+                    on_failure(task, exc)
+            self.stats.add(busy=time.monotonic() - start, items=len(results), batches=1)
+
+            start = time.monotonic()
+            for task, result in results:
+                if self.outbox is not None:
+                    self.outbox.put((task, result))
+                elif on_finish is not None:
+                    on_finish(task)
+            self.stats.add(blocked=time.monotonic() - start)
+
+    def _take(self):
+        "Wait for the next batch of items, returning an empty batch when we're done"
+        start = time.monotonic()
+        item = self.inbox.get()
+        self.stats.add(starved=time.monotonic() - start)
+        batch = []
+        while item is not _DONE:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                return batch
+            try:
+                item = self.inbox.get_nowait()
+            except queue.Empty:
+                return batch
+
+        # Leave the marker for the worker that hasn't seen it yet
+        if batch:
+            self.inbox.put(_DONE)
+        return batch
+
+class Pipeline:
+
+    """
+    Gets coverages through three stages, so network waits, warping and
+    writing all overlap
+
+    - fetch: threads pull the coverage for each task from the tiles or
+      source (the WCS by default) and read it into shared memory
+    - warp: the coverages are warped onto the stamp grids in a pool of
+      worker processes (see `warp.ProcessWarper`), so warping isn't held
+      up by the GIL. Only the shared memory block names go between
+      processes, not the arrays.
+    - write: threads take warped stamps off the queue and write each one
+      to its own file
+
+    The stages are joined by bounded queues, so if the warps or writes fall
+    behind the fetchers wait rather than piling up coverages in memory.
+    Each stage can be sized on its own, and keeps counters of how it's
+    getting on (see `stats`).
+
+    Parameters:
+        fetchers - the number of fetch threads. Optional, defaults to 8.
+        warpers - the number of warp processes. Optional, defaults to the
+            number of CPUs.
+        writers - the number of write threads. Optional, defaults to 1.
+        queue_size - the most items waiting between two stages. Optional,
+            defaults to twice the number of warpers.
+        batch_size - the most stamps a writer takes off the queue at once.
+            This only saves trips to the queue; each stamp is still written
+            to its own file. Optional, defaults to 8.
+        tiles - a `tiles.TileCache` to cut stamps out of. Optional.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods. Optional,
+            defaults to the WCS itself (`coverage.WCSSource`).
+        processes - if False, warp in threads rather than processes (see
+            `warp.ThreadWarper`). Optional, defaults to True.
+    """
+
+    def __init__(self, fetchers=8, warpers=None, writers=1, queue_size=None, batch_size=8,
+                 tiles=None, source=None, processes=True):
+        self.fetchers = fetchers
+        self.warpers = warpers or cpu_count()
+        self.writers = writers
+        self.queue_size = queue_size or 2 * self.warpers
+        self.batch_size = batch_size
+        self.tiles = tiles
+        self.source = source
+        self.processes = processes
+        self.stages = []
+
+    def run(self, tasks, total=None, show_progress=True):
+        """
+        Fetch, warp and write all the given tasks
+
+        Parameters:
+            tasks - an iterable of `download.CoverageTask`s. It's only
+                consumed as fast as the pipeline can take them.
+            total - the number of tasks, used for the progress bar. Optional.
+            show_progress - if True, show a progress bar
+
+        Returns:
+            a list of (task, exception) pairs for the tasks that failed
+        """
+        failures, lock = [], threading.Lock()
+        with self._warper() as warper, \
+                tqdm(total=total, desc='Getting coverages', disable=not show_progress) as pbar:
+            def _failed(task, exc):
+                with lock:
+                    failures.append((task, exc))
+                    pbar.update(1)
+
+            def _finished(_):
+                with lock:
+                    pbar.update(1)
+
+            queues = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+            self.stages = [
+                Stage('fetch', lambda task, _: self._fetch(warper, task),
+                      self.fetchers, queues[0], queues[1]),
+                Stage('warp', lambda task, fetched: self._warp(warper, task, fetched),
+                      self.warpers, queues[1], queues[2]),
+                Stage('write', lambda task, warped: self._write(warper, task, warped),
+                      self.writers, queues[2], batch_size=self.batch_size)
+            ]
+            for stage in self.stages:
+                stage.start(_failed, _finished)
+
+            try:
+                # Blocks when the fetchers are behind, so tasks are generated as needed
+                for task in tasks:
+                    queues[0].put((task, None))
+            finally:
+                for stage in self.stages:
+                    stage.close()
+                    stage.join()
+
+        LOGGER.info(f'Pipeline finished with {self.stats()}')
+        return failures
+
+    def stats(self):
+        "Return the metrics for each stage (see `StageStats.metrics`), keyed by name"
+        return {stage.name: stage.stats.metrics() for stage in self.stages}
+
+    def _warper(self):
+        "Make the backend to warp with"
+        if self.processes:
+            return ProcessWarper(self.warpers)
+        return ThreadWarper()
+
+    def _fetch(self, warper, task):
+        bounds = task.stamp.geometry.bounds
+        backend = find_source(task.wcs, bounds, tiles=self.tiles, source=self.source)
+        with backend.open(task.wcs, bounds) as src:
+            return warper.read(src)
+
+    @staticmethod
+    def _warp(warper, task, fetched):
+        coverage, block = fetched
+        try:
+            return warper.warp(coverage, task.stamp, block)
+        finally:
+            warper.release(block)
+
+    @staticmethod
+    def _write(warper, task, warped):
+        data, block = warped
+        try:
+            return write_stamp(data, task.stamp, output=task.output, remove_crs=task.remove_crs)
+        finally:
+            warper.release(block)
+
+def get_coverages_pipelined(stamps, logfile='get_stamps.log', no_crs=False, tiles=None,
+                            source=None, fetchers=8, warpers=None, writers=1,
+                            show_progress=True):
+    """
+    Get stamp raster data for many stamps using a `Pipeline`
+
+    This is a drop-in alternative to `stamp.get_coverages_parallel` that
+    fetches, warps and writes in separate stages, with warping done in
+    worker processes.
+
+    Parameters:
+        stamps - a geodataframe with 'id' and 'local_projection'
+            columns containing stamp info
+        logfile - the file to log failures to
+        no_crs - if True, remove CRS from data
+        tiles - a `tiles.TileCache` to cut stamps out of. Optional.
+        source - where to read coverages from (see `stamp.read_stamp`).
+            Optional, defaults to the WCS.
+        fetchers - the number of fetch threads
+        warpers - the number of warp processes. Optional, defaults to the
+            number of CPUs.
+        writers - the number of write threads
+        show_progress - if True, show a progress bar
+
+    Returns:
+        a list of (task, exception) pairs for the tasks that failed
+    """
+    # Set up basic logging to file
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+                        datefmt='%m-%d %H:%M',
+                        filename=logfile,
+                        filemode='a')
+
+    pipeline = Pipeline(fetchers=fetchers, warpers=warpers, writers=writers,
+                        tiles=tiles, source=source)
+    # Layers which are already there are skipped, so count what's left
+    return pipeline.run(campaign_tasks(stamps, no_crs=no_crs),
+                        total=count_pending(stamps), show_progress=show_progress)
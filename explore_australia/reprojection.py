@@ -5,16 +5,83 @@
     description: Reprojection utilities
 """
 
-from functools import partial
+import functools
 import logging
+import threading
 
 import pyproj
-from shapely.geometry import Polygon, MultiPolygon, MultiLineString, \
-        LineString, LinearRing, Point, MultiPoint
+import shapely
 import numpy as np
 
 LOGGER = logging.getLogger('explore_australia')
 GEOJSON_PROJ = 'epsg:4326'  # Default/only projection used by GeoJSON
+TRANSFORMER_CACHE_SIZE = 128  # Number of CRS pairs to keep transformers for, per thread
+
+# Transformers aren't safe to share between threads, so each thread gets
+# its own cache of them
+_LOCAL = threading.local()
+
+def crs_key(crs):
+    """
+    Normalise a CRS specification into something hashable that we can
+    cache transformers on
+
+    Parameters:
+        crs - a PROJ string, an EPSG code (e.g. 'epsg:3857'), a dict of
+            PROJ parameters or a pyproj.CRS instance
+
+    Returns:
+        a hashable key for the CRS
+    """
+    if isinstance(crs, str):
+        return crs.strip().lower() if crs.lower().startswith('epsg') else crs.strip()
+    elif isinstance(crs, dict):
+        return tuple(sorted(crs.items()))
+    elif isinstance(crs, pyproj.CRS):
+        return crs
+    raise ValueError(f'Dont know what to do with {crs}')
+
+def _make_crs(key):
+    "Make a pyproj CRS from a key generated by crs_key"
+    try:
+        if isinstance(key, tuple):
+            return pyproj.CRS.from_dict(dict(key))
+        return pyproj.CRS(key)
+    except pyproj.exceptions.CRSError as err:
+        LOGGER.error(f"Can't handle {key}: {err}")
+        raise err
+
+def _make_transformer(from_key, to_key):
+    "Make a transformer between two CRS keys, or None if they're the same"
+    from_crs, to_crs = _make_crs(from_key), _make_crs(to_key)
+    if from_crs == to_crs:
+        return None
+    return pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+def get_transformer(from_crs, to_crs=None):
+    """
+    Return a (cached) pyproj Transformer from one coordinate reference
+    system (CRS) to another
+
+    Transformers are cached per thread on the (from_crs, to_crs) pair, so
+    the cost of resolving a CRS pair is only paid once per thread.
+    Coordinates are always taken and returned in (x, y) or
+    (longitude, latitude) order.
+
+    Parameters:
+        from_crs - the source coordinate reference system
+        to_crs - the destination coordinate reference system.
+            Optional, defaults to 'epsg:4326'
+
+    Returns:
+        a pyproj.Transformer, or None if the two CRSes are the same
+    """
+    try:
+        cache = _LOCAL.transformers
+    except AttributeError:
+        cache = _LOCAL.transformers = \
+            functools.lru_cache(maxsize=TRANSFORMER_CACHE_SIZE)(_make_transformer)
+    return cache(crs_key(from_crs), crs_key(to_crs or GEOJSON_PROJ))
 
 def get_projector(from_crs, to_crs=None):
     """
@@ -26,6 +93,9 @@ def get_projector(from_crs, to_crs=None):
     see fiona.crs.to_string for more on this) or using EPSG
     codes (e.g. 'epsg:3857').
 
+    The projector is safe to share between threads - each thread
+    uses its own cached transformer (see `get_transformer`).
+
     Parameters:
         from_crs - the source coordinate reference system
         to_crs - the destination coordinate reference system.
@@ -33,30 +103,22 @@ def get_projector(from_crs, to_crs=None):
             Mercator projection (to make it easy to pass to
             leaflet maps)
     """
-    # Generate pyproj objects from our CRSes
-    prjs = [from_crs, to_crs or GEOJSON_PROJ]
-    for idx, prj in enumerate(prjs):
-        if isinstance(prj, str):
-            if prj.lower().startswith('epsg'):
-                try:
-                    prjs[idx] = pyproj.Proj(init=prj)
-                except Exception as err:
-                    LOGGER.error("Can't handle {prj}: {err}")
-                    raise err
-            else:
-                prjs[idx] = pyproj.Proj(prj)
-        elif isinstance(prj, dict):
-            prjs[idx] = pyproj.Proj(**prj)
-        else:
-            raise ValueError(f'Dont know what to do with {prj}')
+    # Resolve the CRS pair now so we fail early on bad CRSes
+    to_crs = to_crs or GEOJSON_PROJ
+    if get_transformer(from_crs, to_crs) is None:
+        return lambda *p: p
 
     # Generate the function to actually carry out the transforms
-    if prjs[0] == prjs[1]:
-        _project = lambda *p: p
-    else:
-        _project = lambda *p: np.asarray(list(partial(pyproj.transform, *prjs)(*p)))
+    def _project(*p):
+        return np.asarray(get_transformer(from_crs, to_crs).transform(*p))
     return _project
 
+# Geometry types that we know how to reproject
+GEOMETRY_TYPES = (
+    'Polygon', 'LineString', 'MultiPolygon', 'LinearRing',
+    'MultiLineString', 'Point', 'MultiPoint'
+)
+
 def reproject(geom, from_crs=None, to_crs=None, projector=None):
     """
     Reproject a shapely {Multi,}Polygon or {Multi,}LineString
@@ -79,51 +141,65 @@ def reproject(geom, from_crs=None, to_crs=None, projector=None):
     if projector is None:
         projector = get_projector(from_crs, to_crs)
 
-    # Handle different geometry types
-    mapping = {
-        'Polygon': _polygon,
-        'LineString': _linestring,
-        'MultiPolygon': _multipolygon,
-        'LinearRing': _linearring,
-        'MultiLineString': _multilinestring,
-        'Point': _point,
-        'MultiPoint': _multipoint
-    }
+    # Check we know what to do with this geometry
     try:
         geom_type = geom.geom_type
-        return mapping[geom_type](geom, projector=projector)
     except AttributeError:
         msg = "{} doesn't appear to be a shapely geometry".format(geom)
         raise ValueError(msg)
-    except KeyError:
-        msg = "Don't know how to reproject a {}".format(geom.geom_type)
+    if geom_type not in GEOMETRY_TYPES:
+        msg = "Don't know how to reproject a {}".format(geom_type)
         raise ValueError(msg)
 
-# Reprojection helpers
-def _point(geom, projector):
-    return Point(projector(*geom.xy))
+    # Reproject all the coordinates in one go
+    return shapely.transform(geom, lambda coords: np.column_stack(projector(*coords.T)))
 
-def _multipoint(geom, projector):
-    return MultiPoint([_point(p, projector) for p in geom])
-
-def _polygon(geom, projector):
-    if geom.interiors:
-        reproj = Polygon(
-            shell=_linearring(geom.exterior, projector),
-            holes=[_linearring(i, projector) for i in geom.interiors]
-        )
-    else:
-        reproj = Polygon(reproject(geom.exterior, projector=projector))
-    return reproj
+def reproject_geometries(geoms, from_crs=None, to_crs=None):
+    """
+    Reproject a whole collection of shapely geometries at once
 
-def _linestring(geom, projector):
-    return LineString(projector(*geom.xy).T)
+    All the coordinates are gathered into one array, sent through a
+    single transformer call and then scattered back into new geometries,
+    so this is much faster than calling `reproject` on each geometry.
 
-def _linearring(geom, projector):
-    return LinearRing(projector(*geom.coords.xy).T)
+    Parameters:
+        geoms - a list or array of shapely geometries, or a GeoSeries. Missing
+            (None) geometries are passed through.
+        from_crs - the source coordinate reference system. Optional if
+            geoms is a GeoSeries with a CRS set, otherwise defaults to
+            'epsg:4326'.
+        to_crs - the destination coordinate reference system.
+            Optional, defaults to 'epsg:4326'
 
-def _multipolygon(geom, projector):
-    return MultiPolygon([_polygon(p, projector) for p in geom])
+    Returns:
+        the reprojected geometries, in the same kind of container as
+        was passed in (a list, a numpy array or a GeoSeries)
+    """
+    # Unpack GeoSeries, keeping track of what we were given
+    is_series = hasattr(geoms, 'crs') and hasattr(geoms, 'index')
+    if is_series:
+        from_crs = from_crs or geoms.crs
+        values = np.asarray(geoms.values, dtype=object)
+    else:
+        values = np.asarray(geoms, dtype=object)
+    from_crs = from_crs or GEOJSON_PROJ
+    to_crs = to_crs or GEOJSON_PROJ
 
-def _multilinestring(geom, projector):
-    return MultiLineString([_linestring(p, projector) for p in geom])
\ No newline at end of file
+    # Reproject all the coordinates in one call, in place in one contiguous
+    # (2, N) buffer - pyproj copies strided columns rather than writing
+    # into them. set_coordinates swaps new geometries into the array it's
+    # given, so work on a copy
+    result = values.copy()
+    transformer = get_transformer(from_crs, to_crs)
+    if transformer is not None:
+        xy = np.ascontiguousarray(shapely.get_coordinates(values).T)
+        transformer.transform(xy[0], xy[1], inplace=True)
+        result = shapely.set_coordinates(result, xy.T)
+
+    # Return the same sort of container we were given
+    if is_series:
+        import geopandas
+        return geopandas.GeoSeries(result, index=geoms.index, crs=to_crs)
+    elif isinstance(geoms, np.ndarray):
+        return result
+    return list(result)
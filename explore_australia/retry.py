@@ -0,0 +1,355 @@
+""" file:    retry.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Retries with backoff, and per-endpoint circuit breakers,
+        for flaky coverage servers
+"""
+
+import asyncio
+import collections
+import contextlib
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+
+import requests
+from rasterio.errors import RasterioIOError
+
+LOGGER = logging.getLogger('explore_australia')
+
+# HTTP statuses worth trying again - the server is busy or broken, not us
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# What each thread should give up while it waits to try again (see `releasing`)
+_BACKOFF = threading.local()
+
+class HTTPStatusError(IOError):
+
+    """
+    Raised when a server sends back an HTTP error
+
+    Parameters:
+        status - the HTTP status code
+        message - a description of what went wrong
+    """
+
+    def __init__(self, status, message='Something went wrong getting raster!'):
+        super().__init__(f'{message} (HTTP {status})')
+        self.status = status
+
+class CircuitOpenError(IOError):
+
+    """
+    Raised instead of making a request when the circuit breaker for an
+    endpoint is open
+
+    Parameters:
+        key - the endpoint whose breaker is open
+    """
+
+    def __init__(self, key):
+        super().__init__(f'Circuit breaker open for {key}, not trying it for now')
+        self.key = key
+
+def status_code(exc):
+    "Get the HTTP status code from an exception, if it has one"
+    status = getattr(exc, 'status', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status
+
+def is_retryable(exc):
+    """
+    Work out whether an error is worth retrying
+
+    Busy or broken servers (429 and 5xx responses), timeouts, dropped
+    connections and garbled responses are retryable. Everything else
+    (e.g. 404s for dead layers, OGC service exceptions for bad requests,
+    or bugs on our end) is permanent.
+
+    Parameters:
+        exc - the exception to check
+
+    Returns:
+        True if the request should be tried again
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status = status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    retryable = (TimeoutError, ConnectionError, socket.timeout, asyncio.TimeoutError,
+                 requests.ConnectionError, requests.Timeout,
+                 requests.exceptions.ChunkedEncodingError, RasterioIOError)
+    if 'aiohttp' in sys.modules:
+        aiohttp = sys.modules['aiohttp']
+        retryable += (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+    return isinstance(exc, retryable)
+
+@contextlib.contextmanager
+def releasing(release, reacquire):
+    """
+    Give something up whenever this thread backs off between attempts
+
+    While the block runs, `RetryPolicy.call` calls `release` just before
+    it sleeps and `reacquire` once it wakes up, so e.g. a concurrency slot
+    isn't held (or timed) while nothing's happening.
+
+    Parameters:
+        release - called with the exception that's about to be retried
+        reacquire - called with no arguments after the backoff
+    """
+    previous = getattr(_BACKOFF, 'hooks', None)
+    _BACKOFF.hooks = (release, reacquire)
+    try:
+        yield
+    finally:
+        _BACKOFF.hooks = previous
+
+class CircuitBreaker:
+
+    """
+    Stops everyone hitting an endpoint which keeps failing
+
+    After `threshold` failures in a row the breaker opens and requests
+    fail straight away with a CircuitOpenError, so workers can get on with
+    other endpoints. Once `reset_timeout` seconds have passed a single
+    trial request is let through: if it works the breaker closes again,
+    otherwise it stays open for another `reset_timeout` seconds.
+
+    Parameters:
+        threshold - the number of failures in a row before the breaker
+            opens. Optional, defaults to 5.
+        reset_timeout - the number of seconds to wait before trying an
+            open endpoint again. Optional, defaults to 60.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        "One of 'closed', 'open' or 'half-open'"
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            elif self._trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        "Check whether a request should go ahead"
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        "Record a request that worked, closing the breaker"
+        with self._lock:
+            self.failures, self.opened_at, self._trial = 0, None, False
+
+    def record_permanent(self):
+        """
+        Record a request that failed for reasons which say nothing about
+        the endpoint's health (e.g. a 404 for a dead layer, or a bug on our
+        end), so the breaker doesn't move. If it was the trial request
+        another trial is let through.
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        """
+        Record a request that failed, opening the breaker if needed
+
+        Returns:
+            True if the breaker is open now
+        """
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    LOGGER.warning(f'Opening circuit breaker after {self.failures} failures')
+                self.opened_at = time.monotonic()
+            self._trial = False
+            return self.opened_at is not None
+
+class CircuitBreakers:
+
+    """
+    A thread-safe collection of circuit breakers, one per endpoint
+
+    Parameters:
+        threshold - the number of failures in a row before an endpoint's
+            breaker opens. Optional, defaults to 5.
+        reset_timeout - the number of seconds to wait before trying an
+            open endpoint again. Optional, defaults to 60.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.threshold, self.reset_timeout)
+            return self._breakers[key]
+
+    def open_endpoints(self):
+        "Return the endpoints whose breakers aren't closed"
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return [key for key, breaker in breakers if breaker.state != 'closed']
+
+    def clear(self):
+        "Reset all the breakers"
+        with self._lock:
+            self._breakers.clear()
+
+class RetryPolicy:
+
+    """
+    Retries retryable failures with jittered exponential backoff
+
+    The delay before retry n is drawn uniformly from
+    [0, min(max_delay, base_delay * 2 ** n)] ('full jitter'), so workers
+    which failed together don't all come back at once.
+
+    Parameters:
+        attempts - the total number of attempts, including the first.
+            Optional, defaults to 4.
+        base_delay - the backoff for the first retry, in seconds.
+            Optional, defaults to 0.5.
+        max_delay - the longest we'll wait between attempts, in seconds.
+            Optional, defaults to 30.
+        breakers - a CircuitBreakers instance to track failures per
+            endpoint. Optional, if None there are no circuit breakers.
+        retryable - a function deciding whether an exception is worth
+            retrying. Optional, defaults to `is_retryable`.
+    """
+
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30, breakers=None,
+                 retryable=is_retryable):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breakers = breakers
+        self.retryable = retryable
+        self.counts = collections.Counter()
+        self._counts_lock = threading.Lock()
+
+    def delay(self, attempt):
+        "Return a jittered delay before retrying after the given attempt (from 0)"
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, key=None, **kwargs):
+        """
+        Call a function, retrying it if it fails with a retryable error
+
+        Parameters:
+            func - the function to call
+            *args, **kwargs - arguments for the function
+            key - the endpoint the call hits, used to pick a circuit
+                breaker. Optional.
+
+        Returns:
+            whatever the function returns
+        """
+        breaker = self._breaker(key)
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                self._count('rejected')
+                raise CircuitOpenError(key)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exc:  # pylint: disable=W0703
+                if not self._should_retry(exc, attempt, breaker, key):
+                    raise
+                self._back_off(attempt, exc)
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
+    async def call_async(self, func, *args, key=None, **kwargs):
+        "Coroutine version of `call`, for coroutine functions"
+        breaker = self._breaker(key)
+        for attempt in range(self.attempts):
+            if breaker is not None and not breaker.allow():
+                self._count('rejected')
+                raise CircuitOpenError(key)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as exc:  # pylint: disable=W0703
+                if not self._should_retry(exc, attempt, breaker, key):
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
+    def _back_off(self, attempt, exc):
+        "Sleep before the next attempt, letting go of whatever this thread holds"
+        hooks = getattr(_BACKOFF, 'hooks', None)
+        if hooks is None:
+            time.sleep(self.delay(attempt))
+            return
+        release, reacquire = hooks
+        release(exc)
+        try:
+            time.sleep(self.delay(attempt))
+        finally:
+            reacquire()
+
+    def _breaker(self, key):
+        "Get the circuit breaker for an endpoint, if we're using them"
+        if self.breakers is None or key is None:
+            return None
+        return self.breakers[key]
+
+    def _count(self, name):
+        "Bump a counter, from any thread"
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def _should_retry(self, exc, attempt, breaker, key):
+        "Record a failure and work out whether to go again"
+        # Only transport errors and busy servers count against the
+        # endpoint, so dead layers and our own bugs don't pause it
+        if not self.retryable(exc):
+            if breaker is not None:
+                breaker.record_permanent()
+            self._count('permanent')
+            return False
+        if breaker is not None and breaker.record_failure():
+            # Going round again would only raise a CircuitOpenError, so
+            # pass on the error that actually opened the breaker
+            self._count('tripped')
+            return False
+        if attempt == self.attempts - 1:
+            self._count('exhausted')
+            return False
+        self._count('retried')
+        LOGGER.warning(f'Retrying {key} after attempt {attempt + 1} failed: {exc}')
+        return True
+
+# Circuit breakers and retries shared by everything in this process
+BREAKERS = CircuitBreakers()
+RETRY = RetryPolicy(breakers=BREAKERS)
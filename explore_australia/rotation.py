@@ -5,10 +5,44 @@
     description: Rotation of geographic points
 """
 
-from scipy.linalg import expm, norm
 import numpy as np
-from shapely.geometry import Polygon, MultiPolygon, MultiLineString, LineString, LinearRing, \
-    Point, MultiPoint
+import shapely
+
+def rotation_matrices(axes, angles):
+    """
+    Generate Rodrigues' rotation matrices for many axes and
+    (counterclockwise/right-hand) angles at once
+
+    Uses the closed form R = I + sin(theta) K + (1 - cos(theta)) K^2,
+    where K is the cross-product matrix of the unit axis.
+
+    Parameters:
+        axes - an (N, 3) shaped array of vectors to rotate about. These
+            don't need to be unit vectors.
+        angles - an (N,) shaped array of the amount of rotation about each
+            axis, in radians
+
+    Returns:
+        an (N, 3, 3) shaped array of rotation matrices
+    """
+    axes = np.atleast_2d(np.asarray(axes, dtype=float))
+    axes = axes / np.linalg.norm(axes, axis=-1, keepdims=True)
+    angles = np.broadcast_to(np.asarray(angles, dtype=float), axes.shape[:-1])
+    x, y, z = axes[..., 0], axes[..., 1], axes[..., 2]
+    cos, sin = np.cos(angles), np.sin(angles)
+    vers = 1 - cos
+
+    matrices = np.empty(axes.shape[:-1] + (3, 3))
+    matrices[..., 0, 0] = cos + x * x * vers
+    matrices[..., 0, 1] = x * y * vers - z * sin
+    matrices[..., 0, 2] = x * z * vers + y * sin
+    matrices[..., 1, 0] = y * x * vers + z * sin
+    matrices[..., 1, 1] = cos + y * y * vers
+    matrices[..., 1, 2] = y * z * vers - x * sin
+    matrices[..., 2, 0] = z * x * vers - y * sin
+    matrices[..., 2, 1] = z * y * vers + x * sin
+    matrices[..., 2, 2] = cos + z * z * vers
+    return matrices
 
 def rotation_matrix(axis, angle):
     """
@@ -19,8 +53,22 @@ def rotation_matrix(axis, angle):
         axis - the vector to rotate about
         theta - the amount of rotation, in radians
     """
-    unit_axis = axis / norm(axis)
-    return expm(np.cross(np.identity(3), unit_axis * angle))
+    return rotation_matrices(axis, angle)[0]
+
+def rotate_vectors(vectors, axes, angles):
+    """
+    Rotate batches of cartesian vectors, each batch about its own axis
+
+    Parameters:
+        vectors - an (N, M, 3) shaped array of M vectors for each of the
+            N axes
+        axes - an (N, 3) shaped array of vectors to rotate about
+        angles - an (N,) shaped array of angles, in radians
+
+    Returns:
+        an (N, M, 3) shaped array of rotated vectors
+    """
+    return np.einsum('nij,nmj->nmi', rotation_matrices(axes, angles), vectors)
 
 def geographic_to_spherical(points):
     """
@@ -38,10 +86,11 @@ def geographic_to_spherical(points):
         an (N, 2) shaped array of (theta/inclination, phi/azimuth)
         points, in radians
     """
-    longitude, latitude = points.transpose()
-    inclination = np.radians(90 - latitude)
-    azimuth = np.radians(longitude + 180)
-    return np.vstack([inclination, azimuth]).transpose()
+    points = np.asarray(points, dtype=float)
+    result = np.empty(points.shape)
+    np.radians(90 - points[..., 1], out=result[..., 0])
+    np.radians(points[..., 0] + 180, out=result[..., 1])
+    return result
 
 def spherical_to_cartesian(points):
     """
@@ -58,11 +107,13 @@ def spherical_to_cartesian(points):
     Returns:
         an (N, 3) shaped array of (x, y, z) points, in radians
     """
-    inclination, azimuth = points.transpose()
-    x = np.sin(inclination) * np.cos(azimuth)
-    y = np.sin(inclination) * np.sin(azimuth)
-    z = np.cos(inclination)
-    return np.vstack([x, y, z]).transpose()
+    inclination, azimuth = points[..., 0], points[..., 1]
+    result = np.empty(points.shape[:-1] + (3,))
+    sin_inclination = np.sin(inclination)
+    np.multiply(sin_inclination, np.cos(azimuth), out=result[..., 0])
+    np.multiply(sin_inclination, np.sin(azimuth), out=result[..., 1])
+    np.cos(inclination, out=result[..., 2])
+    return result
 
 def cartesian_to_spherical(points):
     """
@@ -79,12 +130,13 @@ def cartesian_to_spherical(points):
         an (N, 2) shaped array of (inclination, azimuth) points,
         in radians
     """
-    x, y, z = points.transpose()
-    radius = np.sqrt(x ** 2 + y ** 2 + z ** 2)
-    inclination = np.arccos(z / radius)
-    azimuth = np.arctan2(y, x)
+    x, y, z = points[..., 0], points[..., 1], points[..., 2]
+    result = np.empty(points.shape[:-1] + (2,))
+    radius = np.sqrt(np.einsum('...i,...i->...', points, points))
+    np.arccos(np.divide(z, radius, out=radius), out=result[..., 0])
+    azimuth = np.arctan2(y, x, out=result[..., 1])
     azimuth[azimuth < 0] += 2 * np.pi
-    return np.vstack([inclination, azimuth]).transpose()
+    return result
 
 def spherical_to_geographic(points):
     """
@@ -101,10 +153,10 @@ def spherical_to_geographic(points):
     Returns:
         an (N, 2) shaped array of longitude/latitude points, in degrees
     """
-    inclination, azimuth = points.transpose()
-    latitude = 90 - np.degrees(inclination)
-    longitude = np.degrees(azimuth) - 180
-    return np.vstack([longitude, latitude]).transpose()
+    result = np.empty(points.shape)
+    np.subtract(90, np.degrees(points[..., 0]), out=result[..., 1])
+    np.subtract(np.degrees(points[..., 1]), 180, out=result[..., 0])
+    return result
 
 def geographic_to_cartesian(points):
     """
@@ -132,6 +184,72 @@ def cartesian_to_geographic(points):
     """
     return spherical_to_geographic(cartesian_to_spherical(points))
 
+def rotate_coordinates(points, poles, angles):
+    """
+    Rotate batches of geographic points on a spherical surface, each
+    batch about its own pole
+
+    Parameters:
+        points - an (N, M, 2) shaped array of longitude/latitude points,
+            in degrees
+        poles - an (N, 2) shaped array of longitude/latitude poles to
+            rotate about, in degrees
+        angles - an (N,) shaped array of angles, in degrees
+
+    Returns:
+        an (N, M, 2) shaped array of rotated longitude/latitude points
+    """
+    points = np.asarray(points, dtype=float)
+    nbatch, npoints, _ = points.shape
+    axes = geographic_to_cartesian(np.asarray(poles, dtype=float).reshape(-1, 2))
+    vectors = geographic_to_cartesian(points.reshape(-1, 2)).reshape(nbatch, npoints, 3)
+    rotated = rotate_vectors(vectors, axes, np.radians(angles))
+    return cartesian_to_geographic(rotated.reshape(-1, 3)).reshape(nbatch, npoints, 2)
+
+def rotate_geometries(geoms, poles, angles):
+    """
+    Rotate an array of shapely geometries on a spherical surface, each
+    about its own pole, with a single batch of numpy operations
+
+    Parameters:
+        geoms - an array of shapely geometries, given in WGS84 positions
+        poles - an (N, 2) shaped array of longitude/latitude poles, or an
+            array of shapely Points. A single pole is used for every
+            geometry.
+        angles - an (N,) shaped array of angles, in degrees. A single
+            angle is used for every geometry.
+
+    Returns:
+        an array of rotated geometries
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    poles = np.asarray(poles)
+    if poles.dtype == object:
+        poles = shapely.get_coordinates(poles)
+    poles = np.broadcast_to(np.asarray(poles, dtype=float), geoms.shape + (2,))
+    angles = np.broadcast_to(np.asarray(angles, dtype=float), geoms.shape)
+
+    # Rotate every coordinate about the pole of its parent geometry, one
+    # matrix element at a time so we never gather a matrix per coordinate
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    matrices = rotation_matrices(geographic_to_cartesian(poles.reshape(-1, 2)),
+                                 np.radians(angles))
+    vectors = geographic_to_cartesian(coords)
+    rotated = np.zeros_like(vectors)
+    for row in range(3):
+        for col in range(3):
+            rotated[:, row] += matrices[:, row, col][index] * vectors[:, col]
+
+    # set_coordinates swaps new geometries into the array it's given, so
+    # hand it a copy to leave the caller's array alone
+    return shapely.set_coordinates(geoms.copy(), cartesian_to_geographic(rotated))
+
+# Geometry types that we know how to rotate
+GEOMETRY_TYPES = (
+    'Point', 'MultiPoint', 'Polygon', 'LineString',
+    'MultiPolygon', 'LinearRing', 'MultiLineString'
+)
+
 def rotate(geom, pole, angle):
     """
     Rotate a shapely {Multi,}Polygon or {Multi,}LineString
@@ -145,60 +263,19 @@ def rotate(geom, pole, angle):
     Returns:
         the rotated geometries
     """
-    # Construct the rotation axis
-    pole = geographic_to_cartesian(np.asarray(pole.coords))[0]
-    pole /= norm(pole)
+    try:
+        geom_type = geom.geom_type
+    except AttributeError:
+        raise ValueError("Object doesn't look like a geometry object")
+    if geom_type not in GEOMETRY_TYPES:
+        raise ValueError("Don't know how to rotate a {}".format(geom_type))
 
     # Construct the rotation matrix and a function to rotate vectors
+    pole = geographic_to_cartesian(shapely.get_coordinates(pole))[0]
     rmatrix = rotation_matrix(pole, np.radians(angle))
     def rotator(points):
         "Rotation function"
-        vec = geographic_to_cartesian(points)
-        vec_rot = (rmatrix @ vec.T).T
-        return cartesian_to_geographic(vec_rot)
-
-    # Handle different geometry types
-    mapping = {
-        'Point': _point,
-        'MultiPoint': _multipoint,
-        'Polygon': _polygon,
-        'LineString': _linestring,
-        'MultiPolygon': _multipolygon,
-        'LinearRing': _linearring,
-        'MultiLineString': _multilinestring
-    }
-    try:
-        return mapping[geom.geom_type](geom, rotator)
-    except KeyError:
-        msg = "Don't know how to rotate a {}".format(geom.geom_type)
-        raise ValueError(msg)
-    except AttributeError:
-        raise ValueError("Object doesn't look like a geometry object")
-
-# Reprojection helpers
-def _point(geom, rotator):
-    return Point(*rotator(np.asarray(geom.coords)))
-
-def _multipoint(geom, rotator):
-    return MultiPoint([_point(p, rotator) for p in geom])
-
-def _polygon(geom, rotator):
-    if geom.interiors:
-        return Polygon(
-            shell=_linearring(geom.exterior, rotator),
-            holes=[_linearring(i, rotator) for i in geom.interiors]
-        )
-    else:
-        return Polygon(_linearring(geom.exterior, rotator))
-
-def _linestring(geom, rotator):
-    return LineString(rotator(np.asarray(geom.coords)))
-
-def _linearring(geom, rotator):
-    return LinearRing(rotator(np.asarray(geom.coords)))
-
-def _multipolygon(geom, rotator):
-    return MultiPolygon([_polygon(g, rotator) for g in geom])
+        return cartesian_to_geographic(geographic_to_cartesian(points) @ rmatrix.T)
 
-def _multilinestring(geom, rotator):
-    return MultiLineString([_linestring(g, rotator) for g in geom])
+    # Rotates all the coordinates in one go, whatever the geometry type
+    return shapely.transform(geom, rotator)
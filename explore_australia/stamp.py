@@ -5,16 +5,27 @@
     description: Utilities for generating stamps at scale
 """
 
+import os
 import pathlib
 import concurrent.futures
+import contextlib
 import logging
+import uuid
 
 from tqdm import tqdm
 from shapely import geometry
+import numpy as np
 import rasterio
 
-from . import CoverageService, endpoints
+from . import endpoints
+from .adaptive import AdaptiveController
+from .coalesce import RequestPlanner, coalesce_tasks
+from .coverage import WCS_SOURCE
 from .geometry import make_stamp
+from .reprojection import get_transformer
+from .warp import WARP_PLANS
+
+LOGGER = logging.getLogger('explore_australia')
 
 class Stamp:
 
@@ -47,6 +58,7 @@ class Stamp:
 
         # Set up other stuff - gets calculated on the fly
         self._crs, self._transform = None, None
+        self._pixel_lonlat = None
 
     @property
     def crs(self):
@@ -78,6 +90,39 @@ class Stamp:
         "Return the CRS as a rasterio object"
         return rasterio.crs.CRS.from_string(self.crs)
 
+    def pixel_lonlat(self):
+        """
+        Return the longitude and latitude of the centre of every pixel
+
+        All the pixel centres go through a single inverse projection call,
+        and the result is cached on the stamp (so don't modify it).
+
+        Returns:
+            a (height, width, 2) array of longitude/latitude values, in degrees
+        """
+        if self._pixel_lonlat is None:
+            self._pixel_lonlat = self._lonlat_grid()
+            self._pixel_lonlat.flags.writeable = False
+        return self._pixel_lonlat
+
+    def __getstate__(self):
+        # Leave the pixel grid behind so stamps are cheap to send to other
+        # processes - it gets worked out again if it's needed
+        state = self.__dict__.copy()
+        state['_pixel_lonlat'] = None
+        return state
+
+    def _lonlat_grid(self, out=None):
+        "Work out the pixel centre longitudes and latitudes, optionally into out"
+        cols, rows = np.meshgrid(np.arange(self.width) + 0.5,
+                                 np.arange(self.height) + 0.5)
+        xs, ys = self.transform * (cols, rows)
+        lons, lats = get_transformer(self.crs, 'epsg:4326').transform(xs, ys)
+        if out is None:
+            out = np.empty((self.height, self.width, 2))
+        out[..., 0], out[..., 1] = lons, lats
+        return out
+
     def get_tiff_metadata(self, dtype=None, nodata=None, count=1):
         "Return the metadata required to generate a reprojected geotiff"
         return dict(
@@ -91,11 +136,174 @@ class Stamp:
             crs=self.rasterio_crs
         )
 
-def get_stamp(wcs, stamp, output='output.tif', remove_crs=False):
+def pixel_lonlats(stamps):
+    """
+    Return the longitude and latitude of every pixel centre for many stamps
+
+    Parameters:
+        stamps - a sequence of `Stamp` instances, all with the same
+            number of pixels
+
+    Returns:
+        an (N, height, width, 2) array of longitude/latitude values, in degrees
+    """
+    stamps = list(stamps)
+    shapes = {(stamp.height, stamp.width) for stamp in stamps}
+    if len(shapes) > 1:
+        raise ValueError(f'Stamps must all have the same shape, got {sorted(shapes)}')
+    height, width = shapes.pop() if shapes else (0, 0)
+    lonlats = np.empty((len(stamps), height, width, 2))
+    for idx, stamp in enumerate(stamps):
+        # Don't cache on each stamp too, that'd double the memory we use
+        if stamp._pixel_lonlat is not None:  # pylint: disable=W0212
+            lonlats[idx] = stamp._pixel_lonlat  # pylint: disable=W0212
+        else:
+            stamp._lonlat_grid(out=lonlats[idx])  # pylint: disable=W0212
+    return lonlats
+
+def warp_to_array(source, stamp, plans=None):
+    """
+    Warp the first band of a raster onto the local grid of a stamp
+
+    The source-to-stamp pixel lookup is cached (see `warp.WarpPlanCache`),
+    so other layers on the same source grid reuse it rather than warping
+    from scratch.
+
+    Parameters:
+        source - an open rasterio dataset
+        stamp - the stamp to warp onto
+        plans - the `warp.WarpPlanCache` to use. Optional, defaults to
+            the shared `warp.WARP_PLANS`.
+
+    Returns:
+        a (stamp.height, stamp.width) float32 array
+    """
+    plan = (WARP_PLANS if plans is None else plans)(source, stamp)
+    return plan.apply(source.read(1), nodata=source.nodata)
+
+def write_stamp(data, stamp, output='output.tif', remove_crs=False, bands=None):
+    """
+    Write data on a stamp grid out to a GeoTIFF
+
+    The GeoTIFF is written to a temporary file next to the output and then
+    moved into place, so a crash part-way through never leaves a truncated
+    output behind.
+
+    Parameters:
+        data - a (height, width) array for a single band or a
+            (nbands, height, width) array for a multi-band stamp
+        stamp - the stamp the data is on
+        output - the name of the output tif file
+        remove_crs - if True, remove coordinate reference system before writing
+        bands - a list of names for each band. Optional.
+
+    Returns:
+        the name of the output tif file
+    """
+    data = np.asarray(data, dtype='float32')
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    kwargs = stamp.get_tiff_metadata(count=data.shape[0])
+    if remove_crs:
+        kwargs['crs'] = None
+    path = pathlib.Path(output)
+    temp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        with rasterio.open(temp, 'w', **kwargs) as sink:
+            sink.write(data)
+            if bands is not None:
+                sink.descriptions = tuple(bands)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return output
+
+def warp_to_stamp(source, stamp, output='output.tif', remove_crs=False):
+    """
+    Warp a raster into the local CRS and grid of a stamp
+
+    The warp happens in memory and the output is written exactly once.
+
+    Parameters:
+        source - the raster to warp, either as a path or an open
+            rasterio dataset
+        stamp - the stamp to warp onto
+        output - the name of the output tif file
+        remove_crs - if True, remove coordinate reference system before writing
+
+    Returns:
+        the name of the output tif file
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with rasterio.open(source, 'r') as src:
+            data = warp_to_array(src, stamp)
+    else:
+        data = warp_to_array(source, stamp)
+    return write_stamp(data, stamp, output=output, remove_crs=remove_crs)
+
+def read_stamp(wcs, stamp, tiles=None, source=None, controller=None):
+    """
+    Get the raster in a given stamp area from a WCS as an array
+
+    Parameters:
+        wcs - the URL pointing to the WCS endpoint
+        stamp - the stamp to use to crop the data
+        tiles - a `tiles.TileCache` to cut the stamp out of. Optional, if
+            given and the cache has all the tiles for the stamp then the
+            WCS isn't touched at all.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        controller - an `adaptive.AdaptiveController`. Optional, if given
+            the download and the warp each wait for a slot from it. Reads
+            from sources marked `local` (e.g. the tile cache) don't wait
+            for a download slot.
+
+    Returns:
+        a (stamp.height, stamp.width) float32 array
+    """
+    bounds = stamp.geometry.bounds
+    backend = find_source(wcs, bounds, tiles=tiles, source=source)
+    download, warp = contextlib.nullcontext, contextlib.nullcontext
+    if controller is not None:
+        warp = controller.warp
+        if not getattr(backend, 'local', False):
+            download = controller.download
+    with contextlib.ExitStack() as stack:
+        with download():
+            src = stack.enter_context(backend.open(wcs, bounds))
+        with warp():
+            return warp_to_array(src, stamp)
+
+def find_source(wcs, bounds, tiles=None, source=None):
+    """
+    Work out where to read a coverage from
+
+    Parameters:
+        wcs - the URL pointing to the WCS endpoint
+        bounds - a bounding box given as (minx, miny, maxx, maxy)
+        tiles - a `tiles.TileCache`, used if it has all the tiles we
+            need. Optional.
+        source - where to read coverages from otherwise. Optional,
+            defaults to the WCS itself (`coverage.WCSSource`).
+
+    Returns:
+        the first of tiles and source which covers the bounds
+    """
+    for backend in (tiles, WCS_SOURCE if source is None else source):
+        if backend is not None and backend.covers(wcs, bounds):
+            return backend
+    raise FileNotFoundError(f'No data for {wcs} covering {bounds}')
+
+def get_stamp(wcs, stamp, output='output.tif', remove_crs=False, tiles=None, source=None,
+              controller=None):
     """
     Get the raster in a given stamp area from a WCS
 
-    Warps the raster into a local CRS
+    Warps the raster into a local CRS. The response is held and warped in
+    memory, so the only thing written to disk is the output.
 
     Parameters:
         output - the name of the output tif file
@@ -105,40 +313,86 @@ def get_stamp(wcs, stamp, output='output.tif', remove_crs=False):
         distance - the approximate length of the sides of the box (in km)
         npoints - the number of points per side in the new stamp
         remove_crs - if True, remove coordinate reference system before writing
+        tiles - a `tiles.TileCache` to cut the stamp out of. Optional, if
+            given and the cache has all the tiles for the stamp then the
+            WCS isn't touched at all.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        controller - an `adaptive.AdaptiveController` limiting the number
+            of downloads and warps running at once. Optional.
     """
-    # Get data
-    try:
-        serv = CoverageService(wcs)
-        _temp = pathlib.Path(serv(stamp.geometry.bounds))
-
-        # Warp input to output
-        with rasterio.open(_temp, 'r') as src, \
-             rasterio.open(output, 'w', **stamp.get_tiff_metadata()) as sink:
-            src_band = rasterio.band(src, 1)
-            dst_band = rasterio.band(sink, 1)
-            rasterio.warp.reproject(
-                source=src_band,
-                destination=dst_band,
-                resampling=rasterio.warp.Resampling.nearest
-            )
+    data = read_stamp(wcs, stamp, tiles=tiles, source=source, controller=controller)
+    return write_stamp(data, stamp, output=output, remove_crs=remove_crs)
 
-        # Dump output to file without CRS info
-        if remove_crs:
-            kwargs = stamp.get_tiff_metadata()
-            kwargs['crs'] = None
-            with rasterio.open(output, 'r') as src:
-                data = src.read(1)
-            with rasterio.open(output, 'w', **kwargs) as sink:
-                sink.write(data, 1)
-        return output
-    finally:
+def coverage_layers():
+    """
+    Return all the coverage layers we pull, in a fixed order
+
+    This is the band order used for multi-band stamps.
+
+    Returns:
+        a list of (layer name, WCS URL) pairs
+    """
+    return [(layer, wcs) for wcses, _ in coverage_folders('') for layer, wcs in wcses.items()]
+
+def get_cube(stamp, tiles=None, layers=None, source=None, controller=None):
+    """
+    Get every coverage layer for a stamp as a single multi-band array
+
+    Layers that fail to download are filled with NaN.
+
+    Parameters:
+        stamp - the stamp to get data for
+        tiles - a `tiles.TileCache` to cut the stamp out of. Optional.
+        layers - a list of (layer name, WCS URL) pairs. Optional, defaults
+            to `coverage_layers()`.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        controller - an `adaptive.AdaptiveController` limiting the number
+            of downloads and warps running at once. Optional.
+
+    Returns:
+        a (nlayers, stamp.height, stamp.width) float32 array, and a list
+        of the (layer, wcs) pairs that failed
+    """
+    layers = layers or coverage_layers()
+    cube = np.full((len(layers), stamp.height, stamp.width), np.nan, dtype='float32')
+    failed = []
+    for idx, (layer, wcs) in enumerate(layers):
         try:
-            if _temp.exists():
-                _temp.unlink()
-        except NameError:
-            pass
+            cube[idx] = read_stamp(wcs, stamp, tiles=tiles, source=source,
+                                   controller=controller)
+        except Exception:  # pylint: disable=W0703
+            LOGGER.error(f'Failed to get {layer} for ({stamp.centre})')
+            failed.append((layer, wcs))
+    return cube, failed
 
-def get_coverages(name, stamp, no_crs=True, show_progress=True):
+def coverage_folders(name):
+    """
+    Return the endpoints to pull for a stamp and the folders to put them in
+
+    Parameters:
+        name - the root folder for the stamp
+
+    Returns:
+        a list of (endpoints, folder) pairs, where endpoints is a dictionary
+        mapping layer names to WCS URLs
+    """
+    root = pathlib.Path(name)
+    return [
+        (endpoints.GRAVITY, root / 'geophysics' / 'gravity'),
+        (endpoints.MAGNETICS, root / 'geophysics' / 'magnetics'),
+        (endpoints.RADMAP, root / 'geophysics' / 'radiometrics'),
+        (endpoints.ASTER, root / 'remote_sensing' / 'aster'),
+        #(endpoints.ASTER_TAS, root / 'remote_sensing' / 'aster'),
+    ]
+
+def get_coverages(name, stamp, no_crs=True, show_progress=True, tiles=None, cube=False,
+                  source=None, controller=None, geology=None):
     """
     Get coverages for a given centre and angle
 
@@ -153,20 +407,51 @@ def get_coverages(name, stamp, no_crs=True, show_progress=True):
         angle - An angle to rotate the box, in degrees from north
         no_crs - if True, remove CRS from data
         show_progress - if True, show a progress bar
+        tiles - a `tiles.TileCache` to cut the stamp out of. Optional.
+        cube - if True, write all the layers into a single multi-band GeoTIFF
+            called `f'{name}.tif'` (with band descriptions set to the layer
+            names) rather than one GeoTIFF per layer.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        controller - an `adaptive.AdaptiveController` limiting the number
+            of downloads and warps running at once. Optional.
+        geology - a `geology.GeologyRasterizer`. Optional, if given the
+            geology is rasterized onto the stamp too, and written to
+            `<name>/geology/<band>.tif` (or added to the cube as extra bands).
     """
+    if cube:
+        output = pathlib.Path(f'{name}.tif')
+        if not output.exists():
+            data, failed = get_cube(stamp, tiles=tiles, source=source, controller=controller)
+            bands = [layer for layer, _ in coverage_layers()]
+            if geology is not None:
+                data = np.concatenate([data, geology(stamp)])
+                bands += geology.bands
+            write_stamp(data, stamp, output=output, remove_crs=no_crs, bands=bands)
+            if show_progress:
+                for layer, _ in failed:
+                    print(f'Failed to get {layer} for ({stamp.centre})')
+        return
+
     # Contruct endpoints and folders
-    root = pathlib.Path(name)
-    folders = [
-        (endpoints.GRAVITY, root / 'geophysics' / 'gravity'),
-        (endpoints.MAGNETICS, root / 'geophysics' / 'magnetics'),
-        (endpoints.RADMAP, root / 'geophysics' / 'radiometrics'),
-        (endpoints.ASTER, root / 'remote_sensing' / 'aster'),
-        #(endpoints.ASTER_TAS, root / 'remote_sensing' / 'aster'),
-    ]
+    folders = coverage_folders(name)
     for _, folder in folders:
         if not folder.exists():
             folder.mkdir(parents=True)
 
+    # Geology comes from local layers, so it's quick compared to the
+    # coverages. Like the coverages, bands which are there already are kept
+    if geology is not None:
+        folder = pathlib.Path(name) / 'geology'
+        outputs = [folder / f'{band}.tif' for band in geology.bands]
+        if not all(output.exists() for output in outputs):
+            folder.mkdir(parents=True, exist_ok=True)
+            for output, data in zip(outputs, geology(stamp)):
+                if not output.exists():
+                    write_stamp(data, stamp, output=output, remove_crs=no_crs)
+
     # Download data
     if show_progress:
         failed = []
@@ -176,8 +461,11 @@ def get_coverages(name, stamp, no_crs=True, show_progress=True):
                     output_tif = folder / f'{layer}.tif'
                     if not output_tif.exists():
                         try:
-                            get_stamp(wcs=wcs, stamp=stamp, output=output_tif, remove_crs=no_crs)
-                        except:
+                            get_stamp(wcs=wcs, stamp=stamp, output=output_tif,
+                                      remove_crs=no_crs, tiles=tiles, source=source,
+                                      controller=controller)
+                        except Exception as exc:  # pylint: disable=W0703
+                            LOGGER.error(f'Failed to get {layer} for ({stamp.centre}): {exc}')
                             failed.append([wcs, stamp.centre])
                     pbar.update(1)
         if failed:
@@ -189,9 +477,11 @@ def get_coverages(name, stamp, no_crs=True, show_progress=True):
                 output_tif = folder / f'{layer}.tif'
                 if not output_tif.exists():
                     try:
-                        get_stamp(wcs=wcs, stamp=stamp, output=output_tif, remove_crs=no_crs)
-                    except:
-                        continue
+                        get_stamp(wcs=wcs, stamp=stamp, output=output_tif,
+                                  remove_crs=no_crs, tiles=tiles, source=source,
+                                  controller=controller)
+                    except Exception as exc:  # pylint: disable=W0703
+                        LOGGER.error(f'Failed to get {layer} for ({stamp.centre}): {exc}')
 
 def proj_to_stamp(proj):
     "Convert an orthogonal Mercator projection to a stamp"
@@ -213,17 +503,49 @@ def proj_to_stamp(proj):
         n_pixels=500
     )
 
-def get_coverages_parallel(stamps, logfile='get_stamps.log'):
+def get_coverages_parallel(stamps, logfile='get_stamps.log', tiles=None, source=None,
+                           manifest=None, nworkers=None, controller=None, coalesce=None,
+                           geology=None):
     """
     Get stamp raster data in parallel using a threadpool
 
+    By default the number of downloads and warps running at once is tuned
+    as we go, to sit near what the servers and CPUs can sustain (see
+    `adaptive.AdaptiveController`).
+
     Parameters:
         stamps - a geodataframe with 'id' and 'local_projection'
             columns containing stamp info
+        logfile - the file to log failures to
+        tiles - a `tiles.TileCache`. Optional, if given then all the tiles
+            covering the stamps are downloaded first and each stamp is cut
+            out of the local tiles rather than requested from the WCS.
+        source - where to read coverages from, as any object with
+            `covers(wcs, bounds)` and `open(wcs, bounds)` methods, such as a
+            `mirror.LocalMirror`. Optional, defaults to the WCS itself
+            (`coverage.WCSSource`).
+        manifest - the path to an SQLite campaign manifest (see
+            `manifest.Manifest`). Optional, if given then every
+            (stamp, layer) task is tracked in the manifest and rerunning
+            only redoes the tasks which failed or didn't finish.
+        nworkers - a fixed number of stamps to get at once. Optional, if
+            given this turns off the adaptive controller.
+        controller - the `adaptive.AdaptiveController` to use. Optional,
+            pass one in to set its limits or look at its metrics
+            afterwards.
+        coalesce - a `coalesce.RequestPlanner` (or True for the default
+            one). Optional, if given then stamps with overlapping bounding
+            boxes share one GetCoverage per layer, and stamps are run
+            cluster by cluster (see `coalesce.CoalescingSource`).
+        geology - a `geology.GeologyRasterizer`. Optional, if given the
+            geology is rasterized for all the stamps first, in batches
+            (see `geology.rasterize_geology`).
     """
     # Some info about how we're going to run
     total_stamps = len(stamps)
-    nworkers = 10
+    if nworkers is None:
+        controller = controller or AdaptiveController()
+        nworkers = controller.max_workers
 
     # Set up basic logging to file
     logging.basicConfig(level=logging.INFO,
@@ -232,20 +554,61 @@ def get_coverages_parallel(stamps, logfile='get_stamps.log'):
                         filename=logfile,
                         filemode='a')
 
-    # Map row to arguments
-    row_to_kwargs = lambda row: dict(
-        name=row.id,
-        stamp=proj_to_stamp(row.local_projection),
+    # Build each stamp once, so everything below works off the same grids
+    names = list(stamps.id)
+    proj_stamps = [proj_to_stamp(proj) for proj in stamps.local_projection]
+
+    # Prefetch all the tiles we need in one hit
+    if tiles is not None:
+        tiles.prefetch(
+            proj_stamps,
+            [wcs for wcses, _ in coverage_folders('') for wcs in wcses.values()]
+        )
+
+    # Geology comes from local layers, so get it out of the way first
+    if geology is not None:
+        from .geology import rasterize_geology
+        rasterize_geology(stamps, geology)
+
+    # Track tasks in the manifest if we have one
+    if manifest is not None:
+        from .manifest import Manifest, run_manifest
+        with Manifest(manifest) as campaign:
+            campaign.add_stamps(stamps, no_crs=False)
+            return run_manifest(campaign, nworkers=nworkers, tiles=tiles, source=source,
+                                controller=controller, coalesce=coalesce)
+
+    # Share requests between overlapping stamps, and run the stamps in each
+    # cluster together so clusters can be let go quickly. The plan is keyed
+    # on the bounds of the same stamps we run
+    if coalesce:
+        from .download import stamp_tasks
+        planner = coalesce if isinstance(coalesce, RequestPlanner) else None
+        tasks = [task for name, stamp in zip(names, proj_stamps)
+                 for task in stamp_tasks(name, stamp, make_folders=False)]
+        tasks, source = coalesce_tasks(tasks, planner=planner, source=source)
+        rank = {key: idx for idx, key in enumerate(dict.fromkeys(task.key for task in tasks))}
+        order = np.argsort([rank.get(name, len(rank)) for name in names], kind='stable')
+        names, proj_stamps = [names[idx] for idx in order], [proj_stamps[idx] for idx in order]
+
+    # Map stamps to arguments
+    stamp_to_kwargs = lambda name, stamp: dict(
+        name=name,
+        stamp=stamp,
         no_crs=False,
-        show_progress=False
+        show_progress=False,
+        tiles=tiles,
+        source=source,
+        controller=controller
     )
 
     # We can use a with statement to ensure threads are cleaned up promptly
     with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
         # Start the load operations and mark each future with the name
         future_to_args = {
-            executor.submit(get_coverages, **row_to_kwargs(row)): row.id
-            for _, row in tqdm(stamps.iterrows(), total=total_stamps, desc='Loading futures')
+            executor.submit(get_coverages, **stamp_to_kwargs(name, stamp)): name
+            for name, stamp in tqdm(zip(names, proj_stamps), total=total_stamps,
+                                    desc='Loading futures')
         }
 
         # Iterate over futures and collect them as they're sent, logging to file
@@ -258,3 +621,9 @@ def get_coverages_parallel(stamps, logfile='get_stamps.log'):
                 del future
             except Exception as exc:
                 logging.error('Stamp %s get generated an exception: %s\n', key, exc)
+
+    if controller is not None:
+        LOGGER.info(f'Worker controller finished with {controller.metrics()}')
+    if coalesce:
+        LOGGER.info(f'Coalesced requests: {source.report()}')
+        source.clear()
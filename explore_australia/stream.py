@@ -0,0 +1,332 @@
+""" file:    stream.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Stream coverage responses to disk or memory in chunks,
+        under a memory ceiling
+"""
+
+import asyncio
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import rasterio
+from rasterio.io import MemoryFile
+
+LOGGER = logging.getLogger('explore_australia')
+
+# The number of bytes read off the socket at a time
+CHUNK_SIZE = 1 << 16
+
+class IncompleteResponseError(ConnectionError):
+
+    """
+    Raised when a response doesn't match its Content-Length
+
+    This is a ConnectionError, so it's retried like any other dropped
+    connection (see `retry.is_retryable`).
+
+    Parameters:
+        nbytes - the number of bytes we got
+        expected - the number of bytes the server said it would send
+    """
+
+    def __init__(self, nbytes, expected):
+        super().__init__(f'Expected {expected} bytes in response but got {nbytes}')
+        self.nbytes = nbytes
+        self.expected = expected
+
+StreamStats = collections.namedtuple('StreamStats', 'nbytes checksum')
+StreamStats.__doc__ = """
+What came through a stream
+
+Parameters:
+    nbytes - the number of bytes in the response
+    checksum - the hex digest of the response, or None if we didn't ask
+        for one
+"""
+
+def content_length(headers):
+    """
+    Get the expected length of a response body from its headers
+
+    Compressed responses are decoded as they're streamed, so their
+    Content-Length doesn't match what we read and is ignored.
+
+    Parameters:
+        headers - the (case-insensitive) response headers
+
+    Returns:
+        the number of bytes to expect, or None if we can't tell
+    """
+    if headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class StreamCheck:
+
+    """
+    Keeps a running count (and optionally a checksum) of a stream
+
+    Parameters:
+        expected - the number of bytes we expect. Optional, if None the
+            length isn't checked.
+        checksum - the name of a hashlib algorithm (e.g. 'sha256') to
+            digest the stream with. Optional, if None no checksum is made.
+    """
+
+    def __init__(self, expected=None, checksum=None):
+        self.expected = expected
+        self.nbytes = 0
+        self._digest = hashlib.new(checksum) if checksum else None
+
+    def update(self, chunk):
+        "Account for the next chunk of the stream"
+        self.nbytes += len(chunk)
+        if self.expected is not None and self.nbytes > self.expected:
+            raise IncompleteResponseError(self.nbytes, self.expected)
+        if self._digest is not None:
+            self._digest.update(chunk)
+
+    def finish(self):
+        "Check we got everything, returning a StreamStats"
+        if self.expected is not None and self.nbytes != self.expected:
+            raise IncompleteResponseError(self.nbytes, self.expected)
+        return StreamStats(self.nbytes, self._digest.hexdigest() if self._digest else None)
+
+def copy_stream(chunks, sink, expected=None, checksum=None):
+    """
+    Write a stream of chunks to a file-like sink
+
+    Parameters:
+        chunks - an iterable of bytes
+        sink - something with a `write` method
+        expected - the number of bytes we expect. Optional.
+        checksum - the name of a hashlib algorithm to digest the stream
+            with. Optional.
+
+    Returns:
+        a StreamStats instance
+    """
+    check = StreamCheck(expected, checksum)
+    for chunk in chunks:
+        if chunk:
+            check.update(chunk)
+            sink.write(chunk)
+    return check.finish()
+
+async def copy_stream_async(chunks, sink, expected=None, checksum=None):
+    "Coroutine version of `copy_stream`, for asynchronous iterables of chunks"
+    check = StreamCheck(expected, checksum)
+    async for chunk in chunks:
+        if chunk:
+            check.update(chunk)
+            sink.write(chunk)
+    return check.finish()
+
+class MemoryBudget:
+
+    """
+    A ceiling on the number of response bytes held in memory at once
+
+    Everything that buffers responses in memory reserves space here
+    first, waiting if needed until other downloads have finished with
+    theirs. A single response bigger than the whole budget is let through
+    on its own rather than waiting forever.
+
+    Parameters:
+        limit - the most bytes to hold at once. Optional, if None there's
+            no limit.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes, blocking=True):
+        """
+        Reserve space for a response
+
+        Parameters:
+            nbytes - the number of bytes to reserve
+            blocking - if True (the default), wait until there's room
+
+        Returns:
+            True if the space was reserved
+        """
+        with self._cond:
+            while not self._fits(nbytes):
+                if not blocking:
+                    return False
+                self._cond.wait()
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+            return True
+
+    async def acquire_async(self, nbytes, interval=0.01):
+        "Coroutine version of `acquire`, which doesn't block the event loop"
+        while not self.acquire(nbytes, blocking=False):
+            await asyncio.sleep(interval)
+        return True
+
+    def release(self, nbytes):
+        "Give back space reserved with `acquire`"
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+    def _fits(self, nbytes):
+        return self.limit is None or self.used == 0 or self.used + nbytes <= self.limit
+
+# Shared by all downloads in this process. Set `MEMORY.limit` to change
+# the ceiling.
+MEMORY = MemoryBudget(limit=512 * 2 ** 20)
+
+class ResponseBuffer:
+
+    """
+    Holds a streamed coverage in memory, spilling to disk if it won't fit
+
+    Chunks are written straight into a GDAL in-memory file, so there's no
+    second copy of the response when it's opened with rasterio. If a
+    response grows past the space reserved for it and the budget can't
+    spare any more, it's moved to a temporary file instead.
+
+    Use `open` to read the coverage, and `close` (or a `with` block) to
+    give the memory back.
+
+    Parameters:
+        budget - the MemoryBudget the space came from. Optional, if None
+            nothing is tracked.
+        reserved - the number of bytes already reserved from the budget
+    """
+
+    def __init__(self, budget=None, reserved=0):
+        self.budget = budget
+        self.reserved = reserved
+        self.nbytes = 0
+        self.stats = None
+        self.path = None
+        self._memfile = MemoryFile()
+        self._spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def spilled(self):
+        "True if the response has been moved to disk"
+        return self.path is not None
+
+    def write(self, chunk):
+        "Add the next chunk of the response"
+        if self._spill is None and not self._grow(self.nbytes + len(chunk)):
+            self._spill_to_disk()
+        (self._spill or self._memfile).write(chunk)
+        self.nbytes += len(chunk)
+
+    @contextlib.contextmanager
+    def open(self):
+        """
+        Open the buffered coverage with rasterio
+
+        Yields:
+            an open rasterio dataset
+        """
+        if self._spill is not None:
+            self._spill.flush()
+            with rasterio.open(self.path) as src:
+                yield src
+        else:
+            with self._memfile.open() as src:
+                yield src
+
+    def close(self):
+        "Throw away the response and give back its memory"
+        self._memfile.close()
+        if self._spill is not None:
+            self._spill.close()
+            os.remove(self.path)
+            self._spill = None
+        if self.budget is not None and self.reserved:
+            self.budget.release(self.reserved)
+        self.reserved = 0
+
+    def _grow(self, nbytes):
+        "Make sure we've reserved at least nbytes, without waiting"
+        if nbytes <= self.reserved or self.budget is None:
+            return True
+        extra = max(nbytes, 2 * self.reserved) - self.reserved
+        if not self.budget.acquire(extra, blocking=False):
+            return False
+        self.reserved += extra
+        return True
+
+    def _spill_to_disk(self):
+        "Move what we've got so far to a temporary file"
+        LOGGER.debug(f'Spilling {self.nbytes} byte response to disk')
+        handle, self.path = tempfile.mkstemp(suffix='.tif', prefix='explore_australia_')
+        self._spill = os.fdopen(handle, 'wb')
+        self._memfile.seek(0)
+        for chunk in iter(lambda: self._memfile.read(CHUNK_SIZE), b''):
+            self._spill.write(chunk)
+        self._memfile.close()
+        if self.budget is not None and self.reserved:
+            self.budget.release(self.reserved)
+        self.reserved = 0
+
+def buffer_stream(chunks, expected=None, checksum=None, budget=None):
+    """
+    Stream a response into a ResponseBuffer
+
+    Space for the whole response is reserved from the budget up front if
+    we know how big it is (otherwise just one chunk), waiting if other
+    downloads are using it all.
+
+    Parameters:
+        chunks - an iterable of bytes
+        expected - the number of bytes we expect. Optional.
+        checksum - the name of a hashlib algorithm to digest the stream
+            with. Optional.
+        budget - the MemoryBudget to reserve space from. Optional,
+            defaults to the shared `MEMORY` budget.
+
+    Returns:
+        the filled ResponseBuffer (with the StreamStats as `stats`)
+    """
+    budget = MEMORY if budget is None else budget
+    reserved = expected or CHUNK_SIZE
+    budget.acquire(reserved)
+    buffer = ResponseBuffer(budget, reserved)
+    try:
+        buffer.stats = copy_stream(chunks, buffer, expected, checksum)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
+
+async def buffer_stream_async(chunks, expected=None, checksum=None, budget=None):
+    "Coroutine version of `buffer_stream`, for asynchronous iterables of chunks"
+    budget = MEMORY if budget is None else budget
+    reserved = expected or CHUNK_SIZE
+    await budget.acquire_async(reserved)
+    buffer = ResponseBuffer(budget, reserved)
+    try:
+        buffer.stats = await copy_stream_async(chunks, buffer, expected, checksum)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
@@ -0,0 +1,233 @@
+""" file:    tiles.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Local tile cache for coverages, so that overlapping stamps
+        only hit the WCS once
+"""
+
+import concurrent.futures
+import contextlib
+import hashlib
+import logging
+import os
+import pathlib
+import tempfile
+from urllib.parse import urlparse
+
+import numpy as np
+import rasterio
+import rasterio.merge
+import rasterio.shutil
+from rasterio.io import MemoryFile
+from tqdm import tqdm
+
+from .coverage import CoverageService
+from .retry import RETRY
+
+LOGGER = logging.getLogger('explore_australia')
+
+class TileCache:
+
+    """
+    Caches coverages as fixed-grid GeoTIFF tiles on local disk
+
+    Stamps tend to cluster around deposits, so rather than asking the WCS
+    for every stamp's bounding box we can download the tiles covering a
+    set of stamps once (see `prefetch`) and then cut each stamp out of the
+    local tiles (see `mosaic`).
+
+    Tiles are laid out on a regular longitude/latitude grid anchored at
+    (-180, -90), and stored as tiled, compressed GeoTIFFs under
+    `root/<layer key>/<column>_<row>.tif`.
+
+    Parameters:
+        root - the directory to keep tiles in
+        tile_size - the size of the tiles, in degrees. Optional, defaults
+            to 0.5 degrees (about 50 km).
+    """
+
+    origin = (-180, -90)
+
+    # Reads come off local disk, so they don't need a download slot
+    local = True
+
+    def __init__(self, root, tile_size=0.5):
+        self.root = pathlib.Path(root)
+        self.tile_size = tile_size
+
+    def tiles(self, bounds):
+        """
+        Return the indices of the tiles covering a bounding box
+
+        Parameters:
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Returns:
+            a list of (column, row) tuples
+        """
+        minx, miny, maxx, maxy = bounds
+        cols = np.arange(np.floor((minx - self.origin[0]) / self.tile_size),
+                         np.floor((maxx - self.origin[0]) / self.tile_size) + 1).astype(int)
+        rows = np.arange(np.floor((miny - self.origin[1]) / self.tile_size),
+                         np.floor((maxy - self.origin[1]) / self.tile_size) + 1).astype(int)
+        return [(col, row) for col in cols for row in rows]
+
+    def tile_bounds(self, tile):
+        "Return the (minx, miny, maxx, maxy) bounds of a tile"
+        col, row = tile
+        minx = self.origin[0] + col * self.tile_size
+        miny = self.origin[1] + row * self.tile_size
+        return (minx, miny, minx + self.tile_size, miny + self.tile_size)
+
+    def tile_path(self, wcs, tile):
+        "Return the location of a tile for a given WCS endpoint"
+        stem = pathlib.Path(urlparse(wcs).path).stem or 'coverage'
+        key = hashlib.sha1(wcs.encode('utf-8')).hexdigest()[:8]
+        col, row = tile
+        return self.root / f'{stem}_{key}' / f'{col}_{row}.tif'
+
+    def covers(self, wcs, bounds):
+        "Check whether we have all the tiles needed for a bounding box"
+        return all(self.tile_path(wcs, tile).exists() for tile in self.tiles(bounds))
+
+    def get_tile(self, wcs, tile):
+        """
+        Download a single tile from a WCS endpoint, if we don't already have it
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            tile - the (column, row) index of the tile
+
+        Returns:
+            the path to the tile, and the number of bytes downloaded
+        """
+        path = self.tile_path(wcs, tile)
+        if path.exists():
+            return path, 0
+
+        # Download to a temporary file, then repack as a tiled GeoTIFF and
+        # move into place so that we never leave half a tile lying around
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp = tempfile.mkstemp(suffix='.tif', dir=path.parent)
+        os.close(handle)
+        temp = pathlib.Path(temp)
+        repacked = temp.with_suffix('.cog.tif')
+        try:
+            RETRY.call(lambda: CoverageService(wcs)(self.tile_bounds(tile), output=str(temp)),
+                       key=wcs)
+            nbytes = temp.stat().st_size
+            rasterio.shutil.copy(temp, repacked, driver='GTiff',
+                                 tiled=True, compress='deflate')
+            repacked.replace(path)
+            return path, nbytes
+        finally:
+            for leftover in (temp, repacked):
+                if leftover.exists():
+                    leftover.unlink()
+
+    def prefetch(self, stamps, wcses, nworkers=4, show_progress=True):
+        """
+        Download all the tiles needed to cover a set of stamps
+
+        Parameters:
+            stamps - an iterable of `Stamp` instances
+            wcses - an iterable of WCS endpoint URLs to get tiles for
+            nworkers - the number of tiles to download at once
+            show_progress - if True, show a progress bar
+
+        Returns:
+            a list of (wcs, tile, exception) tuples for the tiles which
+            failed to download
+        """
+        # Work out the unique set of tiles we need
+        needed = set()
+        for stamp in stamps:
+            needed.update(self.tiles(stamp.geometry.bounds))
+        jobs = [(wcs, tile) for wcs in wcses for tile in sorted(needed)
+                if not self.tile_path(wcs, tile).exists()]
+        LOGGER.info(f'Prefetching {len(jobs)} tiles')
+
+        # Download in parallel
+        failed, total_bytes = [], 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nworkers) as executor:
+            futures = {executor.submit(self.get_tile, wcs, tile): (wcs, tile)
+                       for wcs, tile in jobs}
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(jobs),
+                               desc='Prefetching tiles', disable=not show_progress):
+                try:
+                    total_bytes += future.result()[1]
+                except Exception as exc:  # pylint: disable=W0703
+                    wcs, tile = futures[future]
+                    LOGGER.error('Tile %s for %s generated an exception: %s', tile, wcs, exc)
+                    failed.append((wcs, tile, exc))
+        LOGGER.info(f'Downloaded {total_bytes} bytes of tiles')
+        return failed
+
+    def mosaic(self, wcs, bounds, output):
+        """
+        Stitch together the local tiles covering a bounding box
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+            output - the GeoTIFF to write the mosaic to
+
+        Returns:
+            the name of the output GeoTIFF
+        """
+        data, profile = self._merge(wcs, bounds)
+        with rasterio.open(output, 'w', **profile) as sink:
+            sink.write(data)
+        return output
+
+    @contextlib.contextmanager
+    def open(self, wcs, bounds):
+        """
+        Stitch together the local tiles covering a bounding box in memory
+
+        Use as a context manager:
+
+            with tiles.open(wcs, bounds) as src:
+                data = src.read(1)
+
+        Parameters:
+            wcs - the URL pointing to the WCS endpoint
+            bounds - a bounding box given as (minx, miny, maxx, maxy)
+
+        Yields:
+            an open rasterio dataset holding the mosaic
+        """
+        data, profile = self._merge(wcs, bounds)
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as sink:
+                sink.write(data)
+            with memfile.open() as src:
+                yield src
+
+    def _merge(self, wcs, bounds):
+        "Merge tiles, returning the data and a profile to write it with"
+        sources = [rasterio.open(self.tile_path(wcs, tile)) for tile in self.tiles(bounds)]
+        try:
+            # Snap the bounds out onto the tiles' pixel grid, otherwise merge
+            # shifts the grid to start at the corner of the bounds
+            xres, _, left, _, yres, top = sources[0].transform[:6]
+            yres = abs(yres)
+            minx, miny, maxx, maxy = bounds
+            snapped = (
+                left + np.floor((minx - left) / xres) * xres,
+                top - np.ceil((top - miny) / yres) * yres,
+                left + np.ceil((maxx - left) / xres) * xres,
+                top - np.floor((top - maxy) / yres) * yres
+            )
+            data, transform = rasterio.merge.merge(sources, bounds=snapped)
+            profile = sources[0].profile
+        finally:
+            for src in sources:
+                src.close()
+
+        profile.update(driver='GTiff', height=data.shape[1], width=data.shape[2],
+                       transform=transform, tiled=False, compress=None)
+        profile.pop('blockxsize', None)
+        profile.pop('blockysize', None)
+        return data, profile
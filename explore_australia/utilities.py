@@ -5,7 +5,7 @@
     description: Utilities for explore data generator
 """
 
-from numpy import quantile, nanquantile, clip
+from numpy import quantile, nanquantile, clip, isnan
 
 def qclip(arr, lower=None, upper=None, finite_only=True):
     """
@@ -32,7 +32,10 @@ def qclip(arr, lower=None, upper=None, finite_only=True):
     else:
         minval, maxval = quantile(arr, [lower, upper])
 
-    return clip(arr, minval, maxval)
+    # Non-finite data gives NaN quantiles, which don't clip anything
+    return clip(arr,
+                None if isnan(minval) else minval,
+                None if isnan(maxval) else maxval)
 
 def omerc_projection(centre, angle):
     """
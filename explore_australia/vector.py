@@ -6,6 +6,7 @@
 """
 
 import numpy as np
+import shapely
 from shapely.geometry import LineString, Polygon
 
 class LinestringSampler(object):
@@ -25,7 +26,7 @@ class LinestringSampler(object):
 
     def __init__(self, linestring):
         # Map the vectors between points
-        self.points = np.asarray(linestring.xy).transpose()
+        self.points = shapely.get_coordinates(linestring)
         self.vectors = np.diff(self.points, axis=0)
         self.norms = np.linalg.norm(self.vectors, axis=1)
 
@@ -58,6 +59,122 @@ class LinestringSampler(object):
         origin = self.points[positions]
         return origin + (direction * projection.reshape((-1, 1)))
 
+class RaggedLinestringSampler(object):
+
+    """
+    Manages resampling of lots of linestrings at once
+
+    Like `LinestringSampler`, but the linestrings are held as one ragged
+    array: the coordinates of all the linestrings concatenated together,
+    and the offsets where each one starts. Segment norms and cumulative
+    lengths are worked out for every linestring in one pass, and sampling
+    any number of points along any of the linestrings takes a single
+    `np.searchsorted`.
+
+    Parameters:
+        points - an (n, d) array of the concatenated linestring vertices
+        offsets - an (m + 1,) array of the positions in `points` where each
+            of the m linestrings starts, ending with n
+    """
+
+    norm_tolerance = 1e-10  # eps for managing zero vs nonzero norms
+
+    def __init__(self, points, offsets):
+        self.points = np.asarray(points, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.starts, self.ends = self.offsets[:-1], self.offsets[1:]
+
+        # Map the vectors between points, with no vector between the last
+        # point of one linestring and the first of the next (or after the
+        # last point), so the cumulative length doesn't step across them
+        vectors = np.zeros_like(self.points)
+        vectors[:-1] = np.diff(self.points, axis=0)
+        vectors[self.ends[self.ends > 0] - 1] = 0
+        self.norms = np.linalg.norm(vectors, axis=1)
+
+        # Find unit vectors for each segment
+        nonzero = self.norms > self.norm_tolerance
+        self.unit_vectors = vectors
+        self.unit_vectors[nonzero] /= self.norms[nonzero].reshape((-1, 1))
+
+        # Distance to each vertex along all the linestrings, and the
+        # length of each
+        self.cumulative_norm = np.concatenate([[0], np.cumsum(self.norms)[:-1]])
+        empty = self.starts == self.ends
+        self.start_distance = np.where(
+            empty, 0, self.cumulative_norm[np.minimum(self.starts, len(self.points) - 1)])
+        self.lengths = np.where(
+            empty, 0, self.cumulative_norm[np.maximum(self.ends - 1, 0)] - self.start_distance)
+
+    @classmethod
+    def from_geometries(cls, linestrings):
+        """
+        Make a sampler from shapely LineStrings or LinearRings
+
+        Parameters:
+            linestrings - a list or array of linestrings
+
+        Returns:
+            a RaggedLinestringSampler instance
+        """
+        linestrings = np.asarray(linestrings, dtype=object)
+        points, index = shapely.get_coordinates(linestrings, return_index=True)
+        offsets = np.searchsorted(index, np.arange(len(linestrings) + 1))
+        return cls(points, offsets)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def sample(self, distances, lines):
+        """
+        Sample distances along our linestrings
+
+        Parameters:
+            distances - points given as distances along their linestrings
+            lines - the index of the linestring each point is on
+
+        Returns:
+            an (len(distances), d) array of points
+        """
+        distances, lines = np.asarray(distances, dtype=float), np.asarray(lines, dtype=int)
+        along = distances + self.start_distance[lines]
+
+        # Find the segment each sample lands on, keeping it within its own
+        # linestring. Single points have no segments so land on themselves
+        positions = np.searchsorted(self.cumulative_norm, along, side='right') - 1
+        first, last = self.starts[lines], np.maximum(self.ends[lines] - 2, self.starts[lines])
+        positions = np.clip(positions, first, last)
+
+        # New points, parameterized as a projection length, direction from
+        # an origin vertex
+        projection = along - self.cumulative_norm[positions]
+        return self.points[positions] \
+            + self.unit_vectors[positions] * projection.reshape((-1, 1))
+
+    def resample(self, resolution, clip=None):
+        """
+        Resample all our linestrings at some resolution, as
+        `resample_linestring` does for one
+
+        Parameters:
+            resolution - the resolution to resample at
+            clip - the smallest and largest number of points to put on
+                each linestring. If None, defaults to [4, inf]
+
+        Returns:
+            the resampled points as an (N, d) array, and an (m + 1,) array
+            of offsets where each linestring's points start
+        """
+        clip = clip or DEFAULT_CLIP
+        counts = np.clip(self.lengths / resolution, *clip).astype(int)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        # Ragged linspace(0, length, count) for each linestring
+        lines = np.repeat(np.arange(len(counts)), counts)
+        steps = np.arange(offsets[-1]) - offsets[lines]
+        spacing = self.lengths / np.maximum(counts - 1, 1)
+        return self.sample(steps * spacing[lines], lines), offsets
+
 def resample_linestring_count(linestring, count=None, step=None,
                               step_round=True):
     """
@@ -177,27 +294,52 @@ def resample_polygon(polygon, resolution=0.01, clip=None, return_points=True):
         depending on return_poly - either a list of points on the boundary or
         a new shapely Polygon instance.
     """
-    # Helper for resampling
-    _rsamp = lambda ls: \
-        resample_linestring(ls, resolution, clip or DEFAULT_CLIP)
-
-    # Actually do resampling
-    if polygon.interiors:
-        result = {
-            'shell': _rsamp(polygon.exterior),
-            'holes': [_rsamp(i) for i in polygon.interiors]
-        }
-    else:
-        result = {'shell': _rsamp(polygon.exterior)}
+    # Resample the shell and holes together
+    rings = [polygon.exterior] + list(polygon.interiors)
+    points, offsets = RaggedLinestringSampler.from_geometries(rings).resample(
+        resolution, clip)
 
     # Work out what we're returning here
-    if not return_points:
-        result = Polygon(**result)
-    elif polygon.interiors:
-        result = np.vstack([
-            result['shell'],
-            np.vstack(result['holes'])
-        ])
-    else:
-        result = result['shell']
-    return result
\ No newline at end of file
+    if return_points:
+        return points
+    rings = np.split(points, offsets[1:-1])
+    return Polygon(shell=rings[0], holes=rings[1:])
+
+def resample_many(geoms, resolution, clip=None):
+    """
+    Resample lots of LineStrings and Polygons at once
+
+    All the linestrings and polygon boundaries are resampled together by a
+    `RaggedLinestringSampler`, rather than one at a time.
+
+    Parameters:
+        geoms - a list or array of shapely LineStrings and Polygons
+        resolution - the resolution to resample at
+        clip - If None, defaults to [4, inf]
+
+    Returns:
+        a list of arrays of points, one for each geometry, as
+        `resample(geom, resolution, return_points=True)` would give
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    types = shapely.get_type_id(geoms)
+    unknown = ~np.isin(types, (1, 2, 3))
+    if unknown.any():
+        raise ValueError("Don't know how to resample a {} instance".format(
+            geoms[unknown][0].geom_type))
+
+    # Split polygons into their rings, keeping track of who owns each
+    polygons = np.flatnonzero(types == 3)
+    rings, owners = shapely.get_rings(geoms[polygons], return_index=True)
+    lines = np.flatnonzero(types != 3)
+    parts = np.concatenate([geoms[lines], rings])
+    owners = np.concatenate([lines, polygons[owners]]).astype(int)
+
+    # Resample everything, then put each geometry's parts back together
+    points, offsets = RaggedLinestringSampler.from_geometries(parts).resample(resolution, clip)
+    order = np.argsort(owners, kind='stable')
+    pieces = np.split(points, offsets[1:-1])
+    bounds = np.searchsorted(owners[order], np.arange(len(geoms) + 1))
+    return [np.concatenate([pieces[idx] for idx in order[start:end]]) if end > start
+            else np.empty((0, points.shape[1]))
+            for start, end in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,453 @@
+""" file:    warp.py (explore_australia)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Reusable nearest-neighbour warp plans, so that layers on the
+        same source grid only pay for warping once per stamp, and backends
+        for warping in threads or worker processes
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+import threading
+
+import numpy as np
+import rasterio
+import rasterio.warp
+
+from .adaptive import cpu_count
+
+class WarpPlan:
+
+    """
+    A nearest-neighbour lookup from a destination grid into a source grid
+
+    With nearest-neighbour resampling, which source pixel lands in each
+    destination pixel only depends on the two grids, not on the data. A
+    plan works this out once (by letting GDAL warp a band of flat source
+    pixel indices) and can then warp any band on the source grid with a
+    single fancy-indexing operation. Plans made this way pick exactly the
+    same pixels as `rasterio.warp.reproject` does.
+
+    Use `WarpPlan.from_grids` to construct a plan.
+
+    Parameters:
+        index - a (height, width) array of flat indices into the source
+            band for each destination pixel, or -1 where the destination
+            pixel falls outside the source
+        source_shape - the (height, width) of the source grid
+    """
+
+    def __init__(self, index, source_shape):
+        self.index = index
+        self.source_shape = tuple(source_shape)
+        self.valid = index >= 0
+        self._lookup = index[self.valid].astype(np.intp)
+
+    @classmethod
+    def from_grids(cls, src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape):
+        """
+        Work out the nearest-neighbour lookup between two grids
+
+        Parameters:
+            src_crs, src_transform, src_shape - the CRS, affine transform
+                and (height, width) of the source grid
+            dst_crs, dst_transform, dst_shape - the CRS, affine transform
+                and (height, width) of the destination grid
+
+        Returns:
+            a WarpPlan instance
+        """
+        npixels = src_shape[0] * src_shape[1]
+        dtype = 'int32' if npixels < np.iinfo('int32').max else 'float64'
+        source = np.arange(npixels, dtype=dtype).reshape(src_shape)
+        index = np.empty(dst_shape, dtype=dtype)
+        rasterio.warp.reproject(
+            source=source,
+            destination=index,
+            src_transform=src_transform,
+            src_crs=src_crs,
+            src_nodata=None,
+            dst_transform=dst_transform,
+            dst_crs=dst_crs,
+            dst_nodata=-1,
+            resampling=rasterio.warp.Resampling.nearest
+        )
+        return cls(index.astype(np.int64), src_shape)
+
+    def apply(self, band, nodata=None, dtype='float32', out=None):
+        """
+        Warp a band from the source grid onto the destination grid
+
+        Parameters:
+            band - a (height, width) array on the source grid
+            nodata - the value to fill destination pixels outside the
+                source with. Optional, defaults to zero.
+            dtype - the dtype of the output array
+            out - an array on the destination grid to write into.
+                Optional, if None a new array is made.
+
+        Returns:
+            a (height, width) array on the destination grid
+        """
+        if band.shape != self.source_shape:
+            raise ValueError(f'Band has shape {band.shape}, plan expects {self.source_shape}')
+        if out is None:
+            out = np.empty(self.index.shape, dtype=dtype)
+        elif out.shape != self.index.shape:
+            raise ValueError(f'Output has shape {out.shape}, plan expects {self.index.shape}')
+        out.fill(0 if nodata is None else nodata)
+        out[self.valid] = band.ravel()[self._lookup]
+        return out
+
+def grid_key(crs, transform, shape):
+    "Return a hashable key for a grid"
+    if crs is not None and not isinstance(crs, str):
+        crs = crs.to_wkt()
+    return (crs, tuple(transform)[:6], tuple(shape))
+
+class WarpPlanCache:
+
+    """
+    A thread-safe LRU cache of warp plans, keyed on the source and
+    destination grids
+
+    The layers in each coverage folder (e.g. the four radiometrics layers)
+    come back from the WCS on the same grid for the same stamp, so a plan
+    worked out for one of them can be reused for the rest.
+
+    Parameters:
+        maxsize - the maximum number of plans to keep. A 500 by 500 stamp
+            plan takes about 2 MB. Optional, defaults to 64.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self._plans = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, source, stamp):
+        """
+        Get the plan for warping an open dataset onto a stamp's grid
+
+        Parameters:
+            source - an open rasterio dataset
+            stamp - the `stamp.Stamp` to warp onto
+
+        Returns:
+            a WarpPlan instance
+        """
+        src_shape = (source.height, source.width)
+        dst_shape = (stamp.height, stamp.width)
+        key = (grid_key(source.crs, source.transform, src_shape),
+               grid_key(stamp.crs, stamp.transform, dst_shape))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        # Work out the plan outside the lock so other threads aren't held up
+        plan = WarpPlan.from_grids(source.crs, source.transform, src_shape,
+                                   stamp.rasterio_crs, stamp.transform, dst_shape)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def __len__(self):
+        return len(self._plans)
+
+    def clear(self):
+        "Remove all plans from the cache"
+        with self._lock:
+            self._plans.clear()
+            self.hits, self.misses = 0, 0
+
+# Plans shared by everything in this process
+WARP_PLANS = WarpPlanCache()
+
+class Coverage(collections.namedtuple('Coverage', 'data crs transform nodata')):
+
+    """
+    A coverage read into memory, which can be sent to other processes
+
+    This has enough of the interface of an open rasterio dataset to be
+    warped with `stamp.warp_to_array` or read by the warpers, so sources
+    can hand one out in place of a dataset.
+
+    Parameters:
+        data - the (height, width) array for the first band
+        crs - the rasterio CRS of the coverage
+        transform - the affine transform of the coverage
+        nodata - the nodata value, or None
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dataset(cls, src, out=None):
+        """
+        Read the first band of an open rasterio dataset
+
+        Parameters:
+            src - an open rasterio dataset
+            out - a (src.height, src.width) array to read into. Optional.
+
+        Returns:
+            a Coverage instance
+        """
+        return cls(src.read(1, out=out), src.crs, src.transform, src.nodata)
+
+    @property
+    def height(self):
+        return self.data.shape[0]
+
+    @property
+    def width(self):
+        return self.data.shape[1]
+
+    @property
+    def dtypes(self):
+        return (self.data.dtype.name,)
+
+    def read(self, band=1, out=None):
+        "Return the data, like `rasterio.DatasetReader.read`"
+        if band != 1:
+            raise IndexError(f'Coverages only have one band, not {band}')
+        if out is None:
+            return self.data
+        out[...] = self.data
+        return out
+
+class SharedBlocks:
+
+    """
+    A thread-safe pool of shared memory blocks, which worker processes can
+    map by name
+
+    Blocks are handed out with `take` and given back with `give`, and are
+    reused rather than created and destroyed for every array. Sizes are
+    rounded up to a power of two so a block fits the next few arrays too.
+    Everything is unlinked on `close`.
+
+    Parameters:
+        min_size - the smallest block to make, in bytes. Optional,
+            defaults to 1 MB.
+    """
+
+    def __init__(self, min_size=1 << 20):
+        self.min_size = min_size
+        self._free = []
+        self._blocks = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def nbytes(self):
+        "The total size of all the blocks"
+        return sum(block.size for block in self._blocks)
+
+    def take(self, shape, dtype='float32'):
+        """
+        Get a block big enough for an array
+
+        Parameters:
+            shape - the shape of the array
+            dtype - the dtype of the array
+
+        Returns:
+            the SharedMemory block and an array viewing the start of it
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with self._lock:
+            fits = [block for block in self._free if block.size >= nbytes]
+            if fits:
+                block = min(fits, key=lambda b: b.size)
+                self._free.remove(block)
+            else:
+                size = max(self.min_size, 1 << max(nbytes - 1, 0).bit_length())
+                block = shared_memory.SharedMemory(create=True, size=size)
+                self._blocks.append(block)
+        return block, np.ndarray(shape, dtype, buffer=block.buf)
+
+    def give(self, block):
+        "Give a block back to be reused (don't keep any arrays viewing it)"
+        if block is not None:
+            with self._lock:
+                self._free.append(block)
+
+    def close(self):
+        "Unlink all the blocks"
+        with self._lock:
+            for block in self._blocks:
+                with contextlib.suppress(BufferError):
+                    block.close()
+                block.unlink()
+            self._free, self._blocks = [], []
+
+# Shared memory blocks this (worker) process has mapped, by name
+_ATTACHED = {}
+
+def _attach(name, shape, dtype):
+    "View a shared memory block made by another process as an array"
+    block = _ATTACHED.get(name)
+    if block is None:
+        block = _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype, buffer=block.buf)
+
+def _warp_shared(source, crs, transform, nodata, stamp, output):
+    "Warp a coverage in one shared block into another (runs in the worker processes)"
+    coverage = Coverage(_attach(*source), crs, transform, nodata)
+    WARP_PLANS(coverage, stamp).apply(coverage.data, nodata=nodata, out=_attach(*output))
+
+class ThreadWarper:
+
+    """
+    Warps coverages onto stamp grids in the calling thread
+
+    This has the same interface as `ProcessWarper`, so the two can be
+    swapped. Blocks are always None.
+
+    Parameters:
+        plans - the `WarpPlanCache` to use. Optional, defaults to the
+            shared `WARP_PLANS`.
+    """
+
+    def __init__(self, plans=None):
+        self.plans = WARP_PLANS if plans is None else plans
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, src):
+        "Read the first band of a dataset, returning the Coverage and its block"
+        return Coverage.from_dataset(src), None
+
+    def warp(self, coverage, stamp, block=None):  # pylint: disable=W0613
+        "Warp a coverage onto a stamp's grid, returning the array and its block"
+        return self.plans(coverage, stamp).apply(coverage.data, nodata=coverage.nodata), None
+
+    def release(self, block):
+        "Give back a block from `read` or `warp`"
+        pass
+
+    def close(self):
+        "Nothing to clean up"
+        pass
+
+class ProcessWarper:
+
+    """
+    Warps coverages onto stamp grids in a pool of worker processes
+
+    Coverages and warped stamps go between processes in shared memory
+    blocks, so only the block names and grid metadata are pickled rather
+    than the arrays themselves. Read coverages straight into shared memory
+    with `read`, warp them with `warp`, and give the blocks back with
+    `release` once you're done with the arrays:
+
+        with ProcessWarper() as warper:
+            coverage, block = warper.read(src)
+            data, output = warper.warp(coverage, stamp, block)
+            warper.release(block)
+            ...  # do something with data
+            warper.release(output)
+
+    Each worker keeps its own warp plans, so plans are only reused when
+    layers for the same stamp land on the same worker.
+
+    Parameters:
+        nworkers - the number of worker processes. Optional, defaults to
+            the number of CPUs.
+        context - the multiprocessing start method. Optional, defaults to
+            'forkserver' since forking a process full of threads (and GDAL
+            state) isn't safe.
+    """
+
+    def __init__(self, nworkers=None, context='forkserver'):
+        self.nworkers = nworkers or cpu_count()
+        self.blocks = SharedBlocks()
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.nworkers, mp_context=multiprocessing.get_context(context))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, src):
+        """
+        Read the first band of a dataset straight into shared memory
+
+        Parameters:
+            src - an open rasterio dataset
+
+        Returns:
+            the Coverage and the block holding its data
+        """
+        block, data = self.blocks.take((src.height, src.width), src.dtypes[0])
+        try:
+            return Coverage.from_dataset(src, out=data), block
+        except BaseException:
+            self.blocks.give(block)
+            raise
+
+    def warp(self, coverage, stamp, block=None):
+        """
+        Warp a coverage onto a stamp's grid in a worker process
+
+        Parameters:
+            coverage - the Coverage to warp
+            stamp - the `stamp.Stamp` to warp onto
+            block - the shared block holding the coverage's data, from
+                `read`. Optional, if None the data is copied into one.
+
+        Returns:
+            a (stamp.height, stamp.width) float32 array and the shared block
+            holding it
+        """
+        copied = block is None
+        if copied:
+            block, data = self.blocks.take(coverage.data.shape, coverage.data.dtype)
+            data[...] = coverage.data
+        output, out = self.blocks.take((stamp.height, stamp.width), 'float32')
+        try:
+            self.pool.submit(
+                _warp_shared,
+                (block.name, coverage.data.shape, coverage.data.dtype.str),
+                coverage.crs, coverage.transform, coverage.nodata, stamp,
+                (output.name, out.shape, out.dtype.str)
+            ).result()
+        except BaseException:
+            self.blocks.give(output)
+            raise
+        finally:
+            if copied:
+                self.blocks.give(block)
+        return out, output
+
+    def release(self, block):
+        "Give back a block from `read` or `warp` (don't keep any arrays viewing it)"
+        self.blocks.give(block)
+
+    def close(self):
+        "Shut down the workers and unlink the shared memory"
+        self.pool.shutdown()
+        self.blocks.close()
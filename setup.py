@@ -15,12 +15,15 @@ REQUIREMENTS = [
     'numpy',
     'scipy',
     'owslib',
+    'aiohttp',
     'ipykernel',
     'matplotlib',
     'geopandas',
+    'pyogrio',
     'scikit-learn',
     'pint',
-    'tqdm'
+    'tqdm',
+    'zarr'
 ]
 DEV_REQUIREMENTS = [
     'pylint',
@@ -68,6 +71,8 @@ setup(
     entry_points={
         'console_scripts': [
             'get_coverages = explore_australia:cli.main',
+            'coverage_campaign = explore_australia:cli.campaign',
+            'ingest_geology = explore_australia:cli.ingest',
         ],
     }
 )
@@ -0,0 +1,229 @@
+""" file:    test_adaptive.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for the adaptive worker controller
+"""
+
+import unittest
+import concurrent.futures
+import threading
+import time
+from unittest import mock
+
+from explore_australia.adaptive import AdaptiveController, AdaptiveLimit
+from explore_australia.retry import CircuitOpenError, HTTPStatusError, RetryPolicy
+from explore_australia.stamp import Stamp, read_stamp
+
+from wcs_server import LocalWCSServer
+
+class FakeClock:
+
+    "A clock which only moves when we tell it to"
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+class TestAdaptiveLimit(unittest.TestCase):
+
+    "Tests for adjustable limits"
+
+    def test_limits(self):
+        "Check limits are clipped"
+        limit = AdaptiveLimit('test', 4, minimum=2, maximum=8)
+        self.assertEqual(limit.set_limit(100), 8)
+        self.assertEqual(limit.set_limit(0.5), 2)
+
+    def test_shrink(self):
+        "Check shrinking a limit makes new work wait"
+        limit = AdaptiveLimit('test', 2)
+        limit.acquire()
+        limit.acquire()
+        limit.set_limit(1)
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: limit.acquire() or acquired.set())
+        thread.start()
+
+        # Still over the limit after one finishes
+        limit.release(0.1)
+        time.sleep(0.05)
+        self.assertFalse(acquired.is_set())
+        self.assertEqual(limit.metrics()['waiting'], 1)
+
+        limit.release(0.1)
+        thread.join(1)
+        self.assertTrue(acquired.is_set())
+        window, saturated = limit.take_window()
+        self.assertEqual(len(window), 2)
+        self.assertTrue(saturated)
+        self.assertIsNone(limit.take_window())
+
+class TestAdaptiveController(unittest.TestCase):
+
+    "Tests for AIMD adjustments"
+
+    def setUp(self):
+        self.clock, self.cpu_clock = FakeClock(), FakeClock()
+        self.controller = AdaptiveController(
+            downloads=4, warps=2, max_warps=8, interval=1, min_samples=4, ncpus=4,
+            clock=self.clock, cpu_clock=self.cpu_clock)
+
+    def run_downloads(self, latencies, error=None):
+        "Pretend to run some downloads, one after another"
+        for latency in latencies:
+            try:
+                with self.controller.download():
+                    self.clock.now += latency
+                    if error is not None:
+                        raise error
+            except type(error):
+                pass
+
+    def tick(self, cpu=0.5):
+        "Move on an interval with the given CPU use and adjust"
+        self.clock.now += self.controller.interval
+        self.cpu_clock.now += cpu * self.controller.interval * self.controller.ncpus
+        self.controller.adjust()
+
+    def test_increase(self):
+        "Check saturated downloads grow additively"
+        limit = self.controller.downloads
+        for _ in range(limit.limit):
+            limit.acquire()
+        thread = threading.Thread(target=limit.acquire)
+        thread.start()
+        time.sleep(0.05)
+        for _ in range(limit.limit):
+            limit.release(0.1)
+        thread.join(1)
+        self.tick()
+        self.assertEqual(limit.limit, 5)
+        decision = self.controller.decisions[-1]
+        self.assertEqual((decision.stage, decision.old, decision.new), ('downloads', 4, 5))
+
+    def test_errors(self):
+        "Check retryable errors cut downloads multiplicatively"
+        self.run_downloads([0.1] * 4, error=HTTPStatusError(503))
+        self.tick()
+        self.assertEqual(self.controller.downloads.limit, 2)
+        self.assertIn('error rate', self.controller.decisions[-1].reason)
+
+        # ...but permanent ones don't
+        self.run_downloads([0.1] * 4, error=HTTPStatusError(404))
+        self.tick()
+        self.assertEqual(self.controller.downloads.limit, 2)
+        self.assertEqual(self.controller.metrics()['downloads']['failed'], 4)
+
+    def test_latency(self):
+        "Check rising latency cuts downloads"
+        self.run_downloads([0.1] * 4)
+        self.tick()
+        self.assertAlmostEqual(self.controller.baseline, 0.1)
+        self.run_downloads([0.5] * 4)
+        self.tick()
+        self.assertEqual(self.controller.downloads.limit, 2)
+        self.assertIn('latency', self.controller.decisions[-1].reason)
+
+        # Not enough samples to go on
+        self.run_downloads([5.] * 2)
+        self.tick()
+        self.assertEqual(self.controller.downloads.limit, 2)
+
+    def test_rejected(self):
+        "Check requests turned away by a circuit breaker aren't timed"
+        self.run_downloads([0.1] * 4)
+        self.tick()
+        for _ in range(4):
+            self.run_downloads([0.] * 4, error=CircuitOpenError('wcs'))
+            self.tick()
+        self.assertEqual(self.controller.downloads.limit, 4)
+        self.assertAlmostEqual(self.controller.baseline, 0.1)
+        self.assertEqual(self.controller.metrics()['downloads']['completed'], 4)
+        self.assertEqual(self.controller.downloads.active, 0)
+
+    def test_baseline_floor(self):
+        "Check very quick responses don't make normal ones look like congestion"
+        for _ in range(4):
+            self.run_downloads([0.] * 4)
+            self.tick()
+        self.assertAlmostEqual(self.controller.baseline, self.controller.min_baseline)
+        self.run_downloads([0.08] * 4)
+        self.tick()
+        self.assertEqual(self.controller.downloads.limit, 4)
+
+    def test_backoff(self):
+        "Check the download slot is given up while a request backs off"
+        policy = RetryPolicy(attempts=3, base_delay=1)
+        calls, active = [], []
+
+        def _fetch():
+            self.clock.now += 0.1
+            calls.append(self.controller.downloads.active)
+            if len(calls) < 3:
+                raise HTTPStatusError(503)
+            return 'data'
+
+        def _sleep(delay):
+            active.append(self.controller.downloads.active)
+            self.clock.now += 10
+
+        with mock.patch('explore_australia.retry.time.sleep', _sleep):
+            with self.controller.download():
+                self.assertEqual(policy.call(_fetch), 'data')
+        self.assertEqual(calls, [1, 1, 1])
+        self.assertEqual(active, [0, 0])
+        window, _ = self.controller.downloads.take_window()
+        self.assertEqual(len(window), 3)
+        for latency, _ in window:
+            self.assertAlmostEqual(latency, 0.1)
+        self.assertEqual([ok for _, ok in window], [False, False, True])
+
+    def test_warps(self):
+        "Check warps are tuned on CPU use"
+        warps = self.controller.warps
+        warps.acquire()
+        warps.acquire()
+        thread = threading.Thread(target=lambda: warps.acquire() or warps.release(0.1))
+        thread.start()
+        time.sleep(0.05)
+        warps.release(0.1)
+        warps.release(0.1)
+        thread.join(1)
+        self.tick(cpu=0.5)
+        self.assertEqual(warps.limit, 3)
+
+        with self.controller.warp():
+            pass
+        self.tick(cpu=0.99)
+        self.assertEqual(warps.limit, 1)
+        self.assertAlmostEqual(self.controller.metrics()['cpu'], 0.99)
+
+    def test_interval(self):
+        "Check adjustments only happen every interval"
+        self.run_downloads([0.1] * 4, error=HTTPStatusError(503))
+        self.assertEqual(self.controller.downloads.limit, 4)
+        self.clock.now += 1
+        self.run_downloads([0.1])
+        self.assertEqual(self.controller.downloads.limit, 2)
+
+    def test_read_stamp(self):
+        "Check stamps can be read through the controller"
+        controller = AdaptiveController(downloads=2, warps=1)
+        stamps = [Stamp(lon=135.9 + 0.05 * i, lat=-35.3, distance=5, n_pixels=51)
+                  for i in range(6)]
+        with LocalWCSServer(resolution=0.002, latency=0.02) as server:
+            with concurrent.futures.ThreadPoolExecutor(controller.max_workers) as executor:
+                list(executor.map(
+                    lambda stamp: read_stamp(server.url(), stamp, controller=controller),
+                    stamps))
+            self.assertLessEqual(server.max_active, 2)
+        metrics = controller.metrics()
+        self.assertEqual(metrics['downloads']['completed'], 6)
+        self.assertEqual(metrics['warps']['completed'], 6)
+        self.assertEqual(metrics['downloads']['active'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
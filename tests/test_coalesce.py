@@ -0,0 +1,160 @@
+""" file:    test_coalesce.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for coalescing requests for overlapping stamps
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas
+
+from explore_australia.coalesce import CoalescingSource, RequestPlanner, coalesce_tasks
+from explore_australia.download import CoverageTask
+from explore_australia.manifest import Manifest, run_manifest
+from explore_australia.stamp import Stamp, read_stamp
+from explore_australia.stream import MemoryBudget
+
+from wcs_server import LocalWCSServer
+
+class TestRequestPlanner(unittest.TestCase):
+
+    "Tests for clustering bounding boxes"
+
+    def test_cluster(self):
+        "Check overlapping boxes are clustered and distant ones aren't"
+        boxes = [(0, 0, 1, 1), (10, 10, 11, 11), (0.1, 0.1, 1.1, 1.1)]
+        clusters = RequestPlanner(max_size=2).cluster(boxes)
+        self.assertEqual(sorted(members for _, members in clusters), [[0, 2], [1]])
+        self.assertIn(((0, 0, 1.1, 1.1), [0, 2]), clusters)
+
+    def test_budget(self):
+        "Check clusters stay within the size budget"
+        boxes = [(0.1 * idx, 0, 0.1 * idx + 1, 1) for idx in range(20)]
+        for union, _ in RequestPlanner(max_size=1.5).cluster(boxes):
+            self.assertLessEqual(union[2] - union[0], 1.5)
+
+    def test_overhead(self):
+        "Check boxes with a gap between them are only merged if we allow the overhead"
+        boxes = [(0, 0, 1, 1), (1.2, 0, 2.2, 1)]
+        self.assertEqual(len(RequestPlanner(max_size=5).cluster(boxes)), 2)
+        self.assertEqual(len(RequestPlanner(max_size=5, max_overhead=0.5).cluster(boxes)), 1)
+
+    def test_plan(self):
+        "Check layers are planned separately and jobs come back in cluster order"
+        boxes = [(0, 0, 1, 1), (10, 10, 11, 11), (0.1, 0.1, 1.1, 1.1)]
+        jobs = [(wcs, bounds) for wcs in ('a', 'b') for bounds in boxes]
+        plan = RequestPlanner(max_size=2).plan(jobs)
+        self.assertEqual(len(plan), 4)
+        self.assertEqual(plan.request('b', boxes[2]).bounds, (0, 0, 1.1, 1.1))
+        self.assertIsNone(plan.request('c', boxes[0]))
+
+        ordered = plan.order(jobs + [('c', boxes[0])], key=lambda job: job)
+        self.assertEqual(ordered[-1], ('c', boxes[0]))
+        self.assertEqual([ordered.index(('a', boxes[idx])) for idx in (0, 2)], [0, 1])
+
+        summary = plan.summary()
+        self.assertEqual((summary['requests'], summary['members']), (4, 6))
+        self.assertAlmostEqual(summary['saved'], 1 - (2 * 1.21 + 2) / 6)
+
+class TestCoalescingSource(unittest.TestCase):
+
+    "Tests for serving stamps out of coalesced requests"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+
+        # Three offset stamps around one deposit, and one a long way off
+        self.stamps = [Stamp(lon=135.9 + 0.01 * i, lat=-35.3 - 0.01 * i, angle=15. * i,
+                             distance=5, n_pixels=51)
+                       for i in range(3)]
+        self.stamps.append(Stamp(lon=121.5, lat=-30.7, distance=5, n_pixels=51))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def tasks(self, server):
+        "Make tasks for our stamps"
+        return [CoverageTask(str(idx), stamp, layer, server.url(f'{layer}.nc'),
+                             self.root / f'{idx}_{layer}.tif', False)
+                for idx, stamp in enumerate(self.stamps) for layer in ('magmap', 'radmap')]
+
+    def test_fan_out(self):
+        "Check each cluster is fetched once and stamps match fetching them on their own"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks, source = coalesce_tasks(self.tasks(server))
+            self.assertEqual(len(source.plan), 4)
+            for task in tasks:
+                # GDAL's approximate transformer can flip the odd pixel on a
+                # boundary when the source window moves
+                coalesced = read_stamp(task.wcs, task.stamp, source=source)
+                same = np.isclose(coalesced, read_stamp(task.wcs, task.stamp), equal_nan=True)
+                self.assertGreater(same.mean(), 0.99)
+            self.assertEqual(server.coverage_requests(), 4 + len(tasks))
+
+        report = source.report()
+        self.assertEqual((report['fetches'], report['served']), (4, len(tasks)))
+        self.assertGreater(report['saved'], 0.3)
+        self.assertEqual(source._fetches, {})  # pylint: disable=W0212
+
+    def test_failure(self):
+        "Check a failed cluster fails all its members without asking again"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks = self.tasks(server)[:6:2]
+            tasks, source = coalesce_tasks(tasks)
+            server.fail_next = [None, 404]
+            for task in tasks:
+                with self.assertRaises(IOError):
+                    read_stamp(task.wcs, task.stamp, source=source)
+            self.assertEqual(server.coverage_requests(), 1)
+
+    def test_manifest(self):
+        "Check manifests can be run with coalesced requests"
+        locations = pandas.DataFrame({
+            'id': [str(idx) for idx in range(len(self.stamps))],
+            'local_projection': [stamp.crs for stamp in self.stamps]
+        })
+        with LocalWCSServer(resolution=0.01) as server, \
+                Manifest(self.root / 'manifest.db') as manifest:
+            layers = {'magmap': server.url('magmap.nc')}
+            manifest.add_stamps(locations, folders=lambda name: [(layers, self.root / name)])
+            counts = run_manifest(manifest, nworkers=2, show_progress=False,
+                                  coalesce=RequestPlanner(max_size=1))
+            self.assertEqual(counts, {'done': 4})
+            self.assertEqual(server.coverage_requests(), 2)
+
+    def test_budget(self):
+        "Check clusters whose members never come back are let go when memory runs out"
+        with LocalWCSServer(resolution=0.002) as server:
+            budget = MemoryBudget(limit=1)
+            tasks, source = coalesce_tasks(self.tasks(server))
+            source.budget = budget
+
+            # Only the first stamp asks for each layer, so neither cluster
+            # finishes on its own
+            for layer in ('magmap', 'radmap'):
+                task = next(task for task in tasks if task.layer == layer and task.key == '0')
+                read_stamp(task.wcs, task.stamp, source=source)
+            self.assertEqual(len(source._fetches), 1)  # pylint: disable=W0212
+            self.assertEqual(source.report()['evicted'], 1)
+            self.assertGreater(budget.used, 0)
+
+            source.clear()
+            self.assertEqual(budget.used, 0)
+            self.assertEqual(source._fetches, {})  # pylint: disable=W0212
+
+    def test_unplanned(self):
+        "Check stamps outside the plan go straight to the source"
+        with LocalWCSServer(resolution=0.002) as server:
+            source = CoalescingSource(RequestPlanner().plan([]))
+            stamp = self.stamps[0]
+            self.assertTrue(np.array_equal(read_stamp(server.url(), stamp, source=source),
+                                           read_stamp(server.url(), stamp), equal_nan=True))
+        self.assertEqual(source.report()['saved'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
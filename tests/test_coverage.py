@@ -7,15 +7,18 @@
 """
 
 import unittest
+import tempfile
 from pathlib import Path
 
 import numpy as np
 import rasterio
 import requests
 
-from explore_australia.coverage import read_to_maskedarray, rotate_raster
+from explore_australia.coverage import read_to_maskedarray, rotate_raster, CapabilitiesCache
 from explore_australia import CoverageService
 
+from wcs_server import LocalWCSServer
+
 # Check for internet connection by connection to Google DNS
 try:
     requests.get('http://8.8.8.8', timeout=1)
@@ -143,5 +146,44 @@ class TestCoverageService(unittest.TestCase):
             except NameError:
                 pass
 
+class TestCapabilitiesCache(unittest.TestCase):
+    "Tests for sharing capabilities documents between coverage services"
+
+    def test_shared_between_services(self):
+        "Check we only ask for capabilities once per URL"
+        cache = CapabilitiesCache()
+        with LocalWCSServer() as server:
+            services = [CoverageService(server.url('magmap.nc'), capabilities=cache)
+                        for _ in range(5)]
+            self.assertEqual(server.capabilities_requests(), 1)
+
+            # Layer metadata shouldn't need the network either
+            for service in services:
+                self.assertEqual(service.default_layer, 'magmap')
+                service.snap_bounds((135.8, -35.4, 136, -35.2))
+            self.assertEqual(len(server.requests), 1)
+
+            # A different URL gets its own document
+            CoverageService(server.url('radmap.nc'), capabilities=cache)
+            self.assertEqual(server.capabilities_requests(), 2)
+
+    def test_expiry(self):
+        "Check documents are refetched once they expire"
+        cache = CapabilitiesCache(ttl=0)
+        with LocalWCSServer() as server:
+            for _ in range(3):
+                CoverageService(server.url(), capabilities=cache)
+            self.assertEqual(server.capabilities_requests(), 3)
+
+    def test_persisted(self):
+        "Check documents on disk are reused by new caches"
+        with tempfile.TemporaryDirectory() as cache_dir, LocalWCSServer() as server:
+            first = CoverageService(server.url(), capabilities=CapabilitiesCache(cache_dir=cache_dir))
+            second = CoverageService(server.url(), capabilities=CapabilitiesCache(cache_dir=cache_dir))
+            self.assertEqual(server.capabilities_requests(), 1)
+            self.assertEqual(first.default_layer, second.default_layer)
+            self.assertEqual(len(list(Path(cache_dir).glob('*.xml'))), 1)
+            self.assertEqual(list(Path(cache_dir).glob('*.tmp')), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+""" file:    test_cube.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for multi-band stamp outputs
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas
+import rasterio
+
+from explore_australia.cube import StampCube, get_cubes_parallel
+from explore_australia.stamp import Stamp, get_cube, write_stamp, read_stamp
+
+from wcs_server import LocalWCSServer
+
+class TestStampCube(unittest.TestCase):
+
+    "Tests for multi-band stamps"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.stamps = [
+            Stamp(lon=135.9, lat=-35.3, angle=30.0),
+            Stamp(lon=121.5, lat=-30.7, angle=0.0),
+            Stamp(lon=139.5, lat=-20.7, angle=240.0)
+        ]
+        self.locations = pandas.DataFrame({
+            'id': ['a', 'b', 'c'],
+            'local_projection': [s.crs for s in self.stamps]
+        })
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_multiband_geotiff(self):
+        "Check we can write a stamp with named bands"
+        with LocalWCSServer(resolution=0.01) as server:
+            layers = [('magmap', server.url('magmap.nc')), ('radmap', server.url('radmap.nc'))]
+            data, failed = get_cube(self.stamps[0], layers=layers)
+        self.assertEqual(failed, [])
+        self.assertEqual(data.shape, (2, 500, 500))
+
+        output = write_stamp(data, self.stamps[0], output=self.root / 'cube.tif',
+                             bands=['magmap', 'radmap'])
+        with rasterio.open(output) as src:
+            self.assertEqual(src.count, 2)
+            self.assertEqual(src.descriptions, ('magmap', 'radmap'))
+            self.assertEqual(src.transform, self.stamps[0].transform)
+            self.assertTrue(np.array_equal(src.read(), data))
+
+    def test_campaign_store(self):
+        "Check we can get a whole campaign into one store and resume it"
+        store = self.root / 'campaign.zarr'
+        with LocalWCSServer(resolution=0.01) as server:
+            layers = [('magmap', server.url('magmap.nc')), ('radmap', server.url('radmap.nc'))]
+            cube = get_cubes_parallel(self.locations, store, layers=layers, nworkers=2)
+            self.assertEqual(cube[:].shape, (3, 2, 500, 500))
+            self.assertTrue(cube.complete[:].all())
+
+            # Rerunning shouldn't fetch anything
+            nrequests = server.coverage_requests()
+            get_cubes_parallel(self.locations, store, layers=layers)
+            self.assertEqual(server.coverage_requests(), nrequests)
+
+            expected = read_stamp(server.url('radmap.nc'), self.stamps[1])
+
+        # Check metadata round-trips
+        cube = StampCube(store, mode='r')
+        self.assertEqual(len(cube), 3)
+        self.assertEqual(cube.ids, ['a', 'b', 'c'])
+        self.assertEqual(cube.bands, ['magmap', 'radmap'])
+        self.assertEqual(cube.crs[1], self.stamps[1].crs)
+        self.assertEqual(cube.transform, self.stamps[1].transform)
+        self.assertTrue(np.array_equal(cube[1, cube.band('radmap')], expected))
+
+    def test_progress_kept(self):
+        "Check stamps written before a run dies stay complete"
+        store = self.root / 'campaign.zarr'
+        calls = []
+        def _dies(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return get_cube(*args, **kwargs)
+
+        with LocalWCSServer(resolution=0.01) as server:
+            layers = [('magmap', server.url('magmap.nc'))]
+            with mock.patch('explore_australia.cube.get_cube', _dies):
+                with self.assertRaises(KeyboardInterrupt):
+                    get_cubes_parallel(self.locations, store, layers=layers, nworkers=1)
+            self.assertEqual(list(StampCube(store).complete[:]), [True, False, False])
+
+            # Resuming only gets the rest
+            nrequests = server.coverage_requests()
+            cube = get_cubes_parallel(self.locations, store, layers=layers, nworkers=1)
+            self.assertTrue(cube.complete[:].all())
+            self.assertEqual(server.coverage_requests(), nrequests + 2)
+
+    def test_mismatched_store(self):
+        "Check we don't write into a store made for other stamps or bands"
+        store = self.root / 'campaign.zarr'
+        StampCube.create(store, ids=['a', 'b', 'c'], crses=[s.crs for s in self.stamps],
+                         transform=self.stamps[0].transform, bands=['magmap'])
+        with LocalWCSServer(resolution=0.01) as server:
+            layers = [('magmap', server.url('magmap.nc'))]
+            with self.assertRaises(ValueError):
+                get_cubes_parallel(self.locations.iloc[::-1], store, layers=layers)
+            with self.assertRaises(ValueError):
+                get_cubes_parallel(self.locations, store,
+                                   layers=layers + [('radmap', server.url('radmap.nc'))])
+            self.assertEqual(server.coverage_requests(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
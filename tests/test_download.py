@@ -0,0 +1,112 @@
+""" file:    test_download.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for the asynchronous coverage downloader
+"""
+
+import unittest
+import tempfile
+import types
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas
+import rasterio
+
+from explore_australia import endpoints
+from explore_australia.download import AsyncCoverageDownloader, CoverageTask, \
+    get_coverages_async
+from explore_australia.stamp import Stamp, coverage_folders
+
+from wcs_server import LocalWCSServer
+
+class TestAsyncCoverageDownloader(unittest.TestCase):
+
+    "Tests for downloading coverages through a shared event loop"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.stamps = [
+            Stamp(lon=135.9, lat=-35.3, angle=30, distance=5, n_pixels=51),
+            Stamp(lon=121.5, lat=-30.7, angle=0, distance=5, n_pixels=51),
+            Stamp(lon=139.5, lat=-20.7, angle=240, distance=5, n_pixels=51)
+        ]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_tasks(self, server, layers=('magmap', 'radmap')):
+        "Make a task per stamp and layer"
+        return [
+            CoverageTask(idx, stamp, layer, server.url(f'{layer}.nc'),
+                         self.root / f'{idx}_{layer}.tif', False)
+            for idx, stamp in enumerate(self.stamps)
+            for layer in layers
+        ]
+
+    def test_download(self):
+        "Check we get a warped output for every task"
+        with LocalWCSServer(resolution=0.005) as server:
+            tasks = self.make_tasks(server)
+            failures = AsyncCoverageDownloader(per_host=2).run(tasks, show_progress=False)
+
+            # Only one capabilities document per endpoint
+            self.assertEqual(failures, [])
+            self.assertEqual(server.capabilities_requests(), 2)
+            self.assertEqual(server.coverage_requests(), len(tasks))
+
+        for task in tasks:
+            with self.subTest(output=task.output.name):
+                with rasterio.open(task.output) as src:
+                    self.assertEqual(src.shape, (51, 51))
+                    self.assertEqual(src.crs, task.stamp.rasterio_crs)
+                    self.assertTrue(np.isfinite(src.read(1)).all())
+
+    def test_progress_total(self):
+        "Check the progress bar only counts the layers still to get"
+        name = str(self.root / 'stamp')
+        (_, folder), = coverage_folders(name)[:1]
+        folder.mkdir(parents=True)
+        done = list(coverage_folders(name)[0][0])[:2]
+        for layer in done:
+            (folder / f'{layer}.tif').touch()
+
+        other = str(self.root / 'other')
+        stamps = pandas.DataFrame({'id': [name, other],
+                                   'local_projection': [self.stamps[0].crs] * 2})
+        pending = 2 * endpoints.TOTAL_COVERAGES - len(done)
+        with mock.patch.object(AsyncCoverageDownloader, 'run', return_value=[]) as run:
+            get_coverages_async(stamps, logfile=str(self.root / 'log'), show_progress=False)
+        self.assertEqual(run.call_args[1]['total'], pending)
+
+        # Tasks are still built lazily, as the downloader takes them
+        tasks = run.call_args[0][0]
+        self.assertIsInstance(tasks, types.GeneratorType)
+        self.assertFalse(Path(other).exists())
+        self.assertEqual(len(list(tasks)), pending)
+
+    def test_per_host_limit(self):
+        "Check that we never have more than per_host requests in flight"
+        with LocalWCSServer(resolution=0.005, latency=0.05) as server:
+            tasks = self.make_tasks(server, layers=('a', 'b', 'c', 'd'))
+            AsyncCoverageDownloader(per_host=3, concurrency=10).run(tasks, show_progress=False)
+            self.assertLessEqual(server.max_active, 3)
+
+    def test_failures(self):
+        "Check failed requests are reported rather than raised"
+        with LocalWCSServer(resolution=0.005) as server:
+            tasks = self.make_tasks(server, layers=('magmap',))
+            server.fail_next = [None, 404]  # let capabilities through, fail first coverage
+            failures = AsyncCoverageDownloader(concurrency=1).run(tasks, show_progress=False)
+            self.assertEqual(len(failures), 1)
+            task, exc = failures[0]
+            self.assertEqual(task, tasks[0])
+            self.assertIsInstance(exc, IOError)
+            self.assertFalse(tasks[0].output.exists())
+            self.assertTrue(tasks[1].output.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+""" file:    test_geology.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for clipping geology out for stamps
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import geopandas
+import numpy as np
+import pandas
+import rasterio
+from shapely.geometry import box, LineString, Point
+
+from click.testing import CliRunner
+
+from explore_australia.cli import ingest
+from explore_australia.geology import (GeologyIndex, GeologyRasterizer, GeologyStore,
+                                       categories, grid_footprint, ingest_geology,
+                                       line_density, line_distance, open_geology,
+                                       rasterize_geology, rasterize_units)
+from explore_australia.stamp import Stamp, coverage_folders, coverage_layers, get_coverages
+
+def make_units(lon=135.9, lat=-35.3, size=0.02, count=20):
+    "Make a chequerboard of square units around a point"
+    cells = [(col, row) for col in range(count) for row in range(count)]
+    left, bottom = lon - size * count / 2, lat - size * count / 2
+    return geopandas.GeoDataFrame(
+        {'code': [f'{col}_{row}' for col, row in cells],
+         'age': [(col + row) % 3 for col, row in cells]},
+        geometry=[box(left + col * size, bottom + row * size,
+                      left + (col + 1) * size, bottom + (row + 1) * size)
+                  for col, row in cells],
+        crs='EPSG:4326')
+
+class TestGeologyIndex(unittest.TestCase):
+
+    "Tests for the geology index"
+
+    def setUp(self):
+        self.units = make_units()
+        self.index = GeologyIndex(self.units)
+        self.stamps = [Stamp(lon=135.9 + 0.03 * i, lat=-35.3, angle=20. * i, distance=10)
+                       for i in range(4)]
+
+    def brute_force(self, stamp):
+        "Clip the way the notebook does, scanning the whole layer"
+        subset = self.units[self.units.intersects(stamp.geometry)]
+        return subset.intersection(stamp.geometry).to_crs(stamp.crs)
+
+    def test_clip(self):
+        "Check clipping matches scanning the whole layer"
+        for stamp in self.stamps:
+            with self.subTest(angle=stamp.angle):
+                clipped, expected = self.index.clip(stamp), self.brute_force(stamp)
+                expected = expected[expected.area > 0]
+                self.assertEqual(list(clipped.index), list(expected.index))
+                self.assertTrue(np.allclose(clipped.area, expected.area))
+                self.assertEqual(list(clipped.code), list(self.units.code[expected.index]))
+                self.assertEqual(clipped.crs, expected.crs)
+
+    def test_clip_many(self):
+        "Check clipping in bulk matches clipping one at a time"
+        for stamp, clipped in zip(self.stamps, self.index.clip_many(self.stamps)):
+            single = self.index.clip(stamp)
+            self.assertEqual(list(clipped.index), list(single.index))
+            self.assertTrue(np.allclose(clipped.area, single.area))
+
+    def test_candidates(self):
+        "Check candidates come from the tree rather than the whole layer"
+        candidates = self.index.candidates(self.stamps[0])
+        self.assertLess(len(candidates), len(self.units) / 2)
+        self.assertTrue(self.units.geometry.iloc[candidates].intersects(
+            self.stamps[0].geometry).all())
+
+    def test_empty(self):
+        "Check stamps away from the layer get nothing back"
+        clipped = self.index.clip(Stamp(lon=121.5, lat=-30.7))
+        self.assertEqual(len(clipped), 0)
+        self.assertEqual(list(clipped.columns), ['code', 'age', 'geometry'])
+
+    def test_lines(self):
+        "Check line layers (e.g. faults) are clipped to lines"
+        faults = geopandas.GeoDataFrame(
+            {'name': ['a', 'b']},
+            geometry=[LineString([(135.8, -35.3), (136.0, -35.3)]),
+                      LineString([(135.9, -35.6), (135.9, -35.5)])],
+            crs='EPSG:4326')
+        clipped = GeologyIndex(faults).clip(self.stamps[0])
+        self.assertEqual(list(clipped.name), ['a'])
+        self.assertEqual(list(clipped.geom_type), ['LineString'])
+        expected = faults.iloc[:1].intersection(self.stamps[0].geometry).to_crs(self.stamps[0].crs)
+        self.assertAlmostEqual(clipped.length.iloc[0], expected.length.iloc[0])
+
+class TestRasterize(unittest.TestCase):
+
+    "Tests for burning geology onto stamp grids"
+
+    def setUp(self):
+        self.units = make_units()
+        self.index = GeologyIndex(self.units)
+        self.stamp = Stamp(lon=135.9, lat=-35.3, angle=0, distance=10, n_pixels=101)
+        self.line = geopandas.GeoSeries([LineString([(-6000, 0), (6000, 0)])])
+
+    def test_units(self):
+        "Check units are burnt in with labels numbered across the whole layer"
+        labels = categories(self.units.code)
+        self.assertEqual(sorted(labels.values()), list(range(1, len(self.units) + 1)))
+        units = self.index.clip_many([self.stamp], outlines=[grid_footprint(self.stamp)])[0]
+        burnt = rasterize_units(units, self.stamp, 'code', labels)
+        self.assertEqual(burnt.shape, (101, 101))
+        self.assertTrue((burnt > 0).all())
+
+        # The centre pixel should be labelled with the unit under the centre
+        under = self.units[self.units.contains(Point(135.9001, -35.3001))].code.iloc[0]
+        self.assertEqual(burnt[50, 50], labels[under])
+
+    def test_distance(self):
+        "Check distances to a line through the middle of the stamp"
+        distance = line_distance(self.line, self.stamp)
+        self.assertEqual(distance[50, 50], 0)
+        self.assertAlmostEqual(distance[0, 50], 5000, delta=100)
+        self.assertTrue(np.all(np.isnan(line_distance([], self.stamp))))
+        self.assertTrue(np.all(line_distance([], self.stamp, max_distance=100) == 100))
+
+        # Lines just off the stamp count if we're capping distances
+        outside = geopandas.GeoSeries([LineString([(-6000, 5600), (6000, 5600)])])
+        self.assertTrue(np.all(np.isnan(line_distance(outside, self.stamp))))
+        distance = line_distance(outside, self.stamp, max_distance=2000)
+        self.assertAlmostEqual(distance[0, 50], 500, delta=100)
+        self.assertEqual(distance[50, 50], 2000)
+
+    def test_density(self):
+        "Check the density of a straight line is its length over the disc area"
+        density = line_density(self.line, self.stamp, radius=1000)
+        expected = 2 / np.pi  # 2 km of line in a disc of pi km²
+        self.assertAlmostEqual(density[50, 50], expected, delta=0.1 * expected)
+        self.assertEqual(density[0, 50], 0)
+        self.assertTrue(np.all(line_density([], self.stamp) == 0))
+
+    def test_rasterizer(self):
+        "Check all the bands come out, in batches and to disk"
+        faults = geopandas.GeoDataFrame(
+            {'name': ['a']}, geometry=[LineString([(135.8, -35.3), (136.0, -35.3)])],
+            crs='EPSG:4326')
+        rasterizer = GeologyRasterizer(units=self.index, columns=['code', 'age'],
+                                       lines={'faults': GeologyIndex(faults)})
+        self.assertEqual(rasterizer.bands,
+                         ['code', 'age', 'faults_distance', 'faults_density'])
+        data = rasterizer(self.stamp)
+        self.assertEqual(data.shape, (4, 101, 101))
+        self.assertEqual(data.dtype, np.float32)
+        self.assertTrue(np.isin(np.unique(data[1]), [1, 2, 3]).all())
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            stamps = pandas.DataFrame({
+                'id': [str(Path(tempdir) / name) for name in 'ab'],
+                'local_projection': [self.stamp.crs, Stamp(lon=135.92, lat=-35.3).crs]
+            })
+            rasterize_geology(stamps, rasterizer, batch_size=1, show_progress=False)
+            with rasterio.open(Path(tempdir) / 'a' / 'geology' / 'faults_distance.tif') as src:
+                written = src.read(1)
+                self.assertEqual(written.shape, (500, 500))
+                self.assertEqual(written.min(), 0)
+
+    def test_get_coverages(self):
+        "Check geology written alongside coverages is kept on reruns, and cube names keep dots"
+        rasterizer = GeologyRasterizer(units=self.index, columns=['age'])
+        with tempfile.TemporaryDirectory() as tempdir:
+            # All the coverages are there already, so nothing is downloaded
+            name = str(Path(tempdir) / 'dep_1.5')
+            for wcses, folder in coverage_folders(name):
+                folder.mkdir(parents=True, exist_ok=True)
+                for layer in wcses:
+                    (folder / f'{layer}.tif').touch()
+
+            with mock.patch.object(rasterizer, 'rasterize_many',
+                                   wraps=rasterizer.rasterize_many) as rasterize:
+                get_coverages(name, self.stamp, show_progress=False, geology=rasterizer)
+                get_coverages(name, self.stamp, show_progress=False, geology=rasterizer)
+            self.assertEqual(rasterize.call_count, 1)
+            self.assertTrue((Path(name) / 'geology' / 'age.tif').exists())
+
+            nlayers = len(coverage_layers())
+            empty = (np.zeros((nlayers, 101, 101), dtype='float32'), [])
+            with mock.patch('explore_australia.stamp.get_cube', return_value=empty):
+                get_coverages(name, self.stamp, show_progress=False, cube=True,
+                              geology=rasterizer)
+            with rasterio.open(Path(tempdir) / 'dep_1.5.tif') as src:
+                self.assertEqual(src.count, nlayers + 1)
+
+class TestGeologyStore(unittest.TestCase):
+
+    "Tests for clipping geology out of ingested FlatGeobuf files"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.units = make_units(count=40, size=0.01)
+        self.index = GeologyIndex(self.units)
+        self.units.to_file(self.root / 'units.shp')
+        self.path = self.root / 'units.fgb'
+        self.assertEqual(ingest_geology(self.root / 'units.shp', self.path), len(self.units))
+        self.store = GeologyStore(self.path)
+        self.stamps = [Stamp(lon=135.9 + 0.03 * i, lat=-35.3, angle=20. * i, distance=10)
+                       for i in range(4)]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_clip(self):
+        "Check clipping from the store matches clipping from the whole layer"
+        for stamp, clipped in zip(self.stamps, self.store.clip_many(self.stamps)):
+            expected = self.index.clip(stamp)
+            self.assertEqual(sorted(clipped.code), sorted(expected.code))
+            self.assertAlmostEqual(clipped.area.sum(), expected.area.sum(), places=3)
+            self.assertEqual(clipped.crs, expected.crs)
+
+    def test_partial_reads(self):
+        "Check stamps only read the features under them"
+        self.assertEqual(len(self.store), len(self.units))
+        clipped = self.store.clip(self.stamps[0])
+        self.assertGreaterEqual(self.store.features_read, len(clipped))
+        self.assertLess(self.store.features_read, len(self.units) / 4)
+        self.assertEqual(len(self.store.clip(Stamp(lon=121.5, lat=-30.7))), 0)
+
+    def test_rasterizer(self):
+        "Check the store can stand in for an index when rasterizing"
+        self.assertEqual(sorted(self.store.values('age').unique()), [0, 1, 2])
+        stamp = Stamp(lon=135.9, lat=-35.3, angle=90, distance=10, n_pixels=51)
+        from_store = GeologyRasterizer(units=self.store, columns=['code', 'age'])(stamp)
+        from_index = GeologyRasterizer(units=self.index, columns=['code', 'age'])(stamp)
+        self.assertTrue(np.array_equal(from_store, from_index))
+
+    def test_open(self):
+        "Check FlatGeobuf files are opened as stores"
+        self.assertIsInstance(open_geology(str(self.path)), GeologyStore)
+
+    def test_cli(self):
+        "Check layers can be ingested from the command line"
+        result = CliRunner().invoke(ingest, [str(self.root / 'units.shp'), '--output',
+                                             str(self.root / 'store'), '--columns', 'age'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        store = GeologyStore(self.root / 'store' / 'units.fgb')
+        self.assertEqual(len(store), len(self.units))
+        self.assertEqual(list(store.clip(self.stamps[0]).columns), ['age', 'geometry'])
+
+if __name__ == '__main__':
+    unittest.main()
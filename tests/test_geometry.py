@@ -9,11 +9,13 @@
 import unittest
 from itertools import product
 
+import shapely
 from shapely.geometry import Point, MultiPolygon
 import numpy as np
 import pyproj
 
-from explore_australia.geometry import make_box
+from explore_australia import geometry
+from explore_australia.geometry import make_box, make_stamp, make_stamps
 
 EPSG_3112_BOUNDS = (-2918276.3772, -5287521.9260, 2362935.9369, -1372651.4100)
 
@@ -77,7 +79,7 @@ class TestStamp(unittest.TestCase):
                     make_box(p, distance=distance, npoints=150, projection=None)
                     for p in pts
                 ])
-                self.assertEqual(len(polys), nsquares)
+                self.assertEqual(len(polys.geoms), nsquares)
 
     def test_make_box_output_proj(self):
         """
@@ -98,5 +100,63 @@ class TestStamp(unittest.TestCase):
                 expected = (distance * 1000) ** 2 * nsquares # in m^2
                 self.assertTrue(np.isclose(polys.area, expected, rtol=1e-1))
 
+    def test_make_box_quantities(self):
+        "Check that pint quantities give the same box as plain kilometres"
+        centre = Point(135.5, -25.3)
+        expected = make_box(centre, distance=10, npoints=10)
+        self.assertTrue(expected.is_valid)
+        self.assertEqual(len(expected.exterior.coords), 4 * 9 + 1)
+        for distance in (10 * geometry.UNITS.km, 10000 * geometry.UNITS.m):
+            with self.subTest(distance=distance):
+                box = make_box(centre, distance=distance, npoints=10)
+                self.assertTrue(box.equals_exact(expected, 1e-12))
+        self.assertEqual(geometry.EARTH_RADIUS.to('m').magnitude, geometry.EARTH_RADIUS_M)
+
+class TestMakeStamps(unittest.TestCase):
+    """
+    Tests for batch stamp creation
+    """
+
+    def setUp(self):
+        "Fixture set up"
+        self.nstamps = 25
+        self.lons = np.random.uniform(115, 150, self.nstamps)
+        self.lats = np.random.uniform(-40, -12, self.nstamps)
+        self.angles = np.random.uniform(0, 360, self.nstamps)
+
+    def check_same(self, poly_a, poly_b):
+        "Check two polygons have the same vertices"
+        coords_a = shapely.get_coordinates(shapely.normalize(poly_a))
+        coords_b = shapely.get_coordinates(shapely.normalize(poly_b))
+        self.assertEqual(coords_a.shape, coords_b.shape)
+        self.assertTrue(np.allclose(coords_a, coords_b, atol=1e-9))
+
+    def test_matches_make_stamp(self):
+        "Check batch stamps match stamps made one at a time"
+        for distance in (1, 25, 100):
+            polys = make_stamps(self.lons, self.lats, self.angles, distance=distance)
+            self.assertEqual(polys.shape, (self.nstamps,))
+            for idx in range(self.nstamps):
+                with self.subTest(distance=distance, idx=idx):
+                    expected = make_stamp(Point(self.lons[idx], self.lats[idx]),
+                                          angle=self.angles[idx], distance=distance)
+                    self.check_same(polys[idx], expected)
+
+    def test_interpolated_sides(self):
+        "Check we can add points along the sides"
+        polys = make_stamps(self.lons, self.lats, self.angles, npoints=10)
+        self.assertTrue(np.all(shapely.get_num_coordinates(polys) == 4 * 9 + 1))
+        self.assertTrue(np.allclose(
+            shapely.area(polys),
+            shapely.area(make_stamps(self.lons, self.lats, self.angles)),
+            rtol=1e-3))
+
+    def test_frame(self):
+        "Check we can get a GeoDataFrame back"
+        frame = make_stamps(self.lons, self.lats, self.angles, as_frame=True)
+        self.assertEqual(len(frame), self.nstamps)
+        self.assertTrue(np.allclose(frame.angle, self.angles))
+        self.assertEqual(frame.crs.to_epsg(), 4326)
+
 if __name__ == '__main__':
     unittest.main()
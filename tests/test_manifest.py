@@ -0,0 +1,106 @@
+""" file:    test_manifest.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for resumable campaign manifests
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas
+import rasterio
+from click.testing import CliRunner
+
+from explore_australia.cli import campaign
+from explore_australia.manifest import Manifest, run_manifest, file_checksum
+from explore_australia.stamp import Stamp
+
+from wcs_server import LocalWCSServer
+
+class TestManifest(unittest.TestCase):
+
+    "Tests for campaign manifests"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        stamps = [Stamp(lon=135.9, lat=-35.3, angle=30.0), Stamp(lon=121.5, lat=-30.7, angle=0.0)]
+        self.locations = pandas.DataFrame({
+            'id': ['a', 'b'],
+            'local_projection': [s.crs for s in stamps]
+        })
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def folders(self, server):
+        "Make a function putting our stand-in layers under the temp dir"
+        layers = {'magmap': server.url('magmap.nc'), 'radmap': server.url('radmap.nc')}
+        return lambda name: [(layers, self.root / name)]
+
+    def test_add_stamps(self):
+        "Check tasks are only added once"
+        with LocalWCSServer() as server, Manifest(self.root / 'manifest.db') as manifest:
+            self.assertEqual(manifest.add_stamps(self.locations, folders=self.folders(server)), 4)
+            self.assertEqual(manifest.add_stamps(self.locations, folders=self.folders(server)), 0)
+            self.assertEqual(len(manifest), 4)
+            self.assertEqual(manifest.counts(), {'pending': 4})
+            self.assertEqual([(t.stamp_id, t.layer) for t in manifest.pending()],
+                             [('a', 'magmap'), ('a', 'radmap'), ('b', 'magmap'), ('b', 'radmap')])
+
+    def test_resume(self):
+        "Check rerunning only redoes tasks that failed or didn't finish"
+        with LocalWCSServer(resolution=0.01) as server, \
+                Manifest(self.root / 'manifest.db') as manifest:
+            manifest.add_stamps(self.locations, folders=self.folders(server))
+
+            # Fail the first coverage request (permanently, so it isn't
+            # retried), after the capabilities
+            server.fail_next = [None, 404]
+            counts = run_manifest(manifest, nworkers=1, show_progress=False)
+            self.assertEqual(counts, {'done': 3, 'failed': 1})
+            failed = manifest.task('a', 'magmap')
+            self.assertEqual(failed['attempts'], 1)
+            self.assertIsNotNone(failed['error'])
+            self.assertFalse((self.root / 'a' / 'magmap.tif').exists())
+
+            # Check the records for the finished tasks
+            done = manifest.task('b', 'radmap')
+            self.assertEqual((done['bytes'], done['checksum']),
+                             file_checksum(self.root / 'b' / 'radmap.tif'))
+            self.assertGreaterEqual(done['finished'], done['started'])
+
+            # Pretend we crashed half way through another task
+            manifest.start('b', 'magmap')
+            nrequests = server.coverage_requests()
+            counts = run_manifest(manifest, show_progress=False)
+            self.assertEqual(counts, {'done': 4})
+            self.assertEqual(server.coverage_requests(), nrequests + 2)
+            self.assertEqual(manifest.task('a', 'magmap')['attempts'], 2)
+            with rasterio.open(self.root / 'a' / 'magmap.tif') as src:
+                self.assertEqual(src.shape, (500, 500))
+
+            # Nothing left to do
+            self.assertEqual(manifest.pending(), [])
+
+    def test_max_attempts(self):
+        "Check we can give up on tasks that keep failing"
+        with LocalWCSServer() as server, Manifest(self.root / 'manifest.db') as manifest:
+            manifest.add_stamps(self.locations.iloc[:1], folders=self.folders(server))
+            manifest.start('a', 'magmap')
+            manifest.fail('a', 'magmap', 'nope')
+            self.assertEqual([t.layer for t in manifest.pending(max_attempts=1)], ['radmap'])
+            self.assertEqual(len(manifest.pending()), 2)
+
+    def test_status_command(self):
+        "Check the status command reports task counts"
+        with LocalWCSServer() as server, Manifest(self.root / 'manifest.db') as manifest:
+            manifest.add_stamps(self.locations, folders=self.folders(server))
+        result = CliRunner().invoke(campaign, ['status', str(self.root / 'manifest.db')])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('pending: 4', result.output)
+
+if __name__ == '__main__':
+    unittest.main()
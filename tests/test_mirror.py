@@ -0,0 +1,93 @@
+""" file:    test_mirror.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for reading coverages from local grids
+"""
+
+import unittest
+import tempfile
+import concurrent.futures
+from pathlib import Path
+
+import numpy as np
+
+from explore_australia.mirror import LocalMirror
+from explore_australia.stamp import Stamp, read_stamp, get_cube
+
+from wcs_server import LocalWCSServer, render_coverage
+
+class TestLocalMirror(unittest.TestCase):
+
+    "Tests for the local mirror source"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.stamps = [
+            Stamp(lon=135.9, lat=-35.3, angle=30., distance=5, n_pixels=101),
+            Stamp(lon=136.4, lat=-34.6, angle=200., distance=5, n_pixels=101)
+        ]
+
+        # A local 'national grid' on the same lattice as the stand-in server
+        for name in ('magmap', 'radmap'):
+            data = render_coverage((135, -36, 137, -34), resolution=0.002)
+            (self.root / f'{name}.tif').write_bytes(data)
+        self.mirror = LocalMirror(self.root)
+
+    def tearDown(self):
+        self.mirror.close()
+        self.tempdir.cleanup()
+
+    def test_paths(self):
+        "Check we find local grids for WCS endpoints"
+        url = 'http://example.com/thredds/wcs/rr2/magmap.nc'
+        self.assertEqual(self.mirror.path(url), self.root / 'magmap.tif')
+        self.assertIsNone(self.mirror.path('http://example.com/thredds/wcs/missing.nc'))
+        self.assertTrue(self.mirror.covers(url, self.stamps[0].geometry.bounds))
+        self.assertFalse(self.mirror.covers(url, (120, -30, 121, -29)))
+
+        mirror = LocalMirror(self.root, paths={url: self.root / 'radmap.tif'})
+        self.assertEqual(mirror.path(url), self.root / 'radmap.tif')
+
+    def test_matches_wcs(self):
+        "Check stamps from the mirror match stamps from the WCS, without touching it"
+        with LocalWCSServer(resolution=0.002) as server:
+            for idx, stamp in enumerate(self.stamps):
+                with self.subTest(stamp=idx):
+                    expected = read_stamp(server.url('magmap.nc'), stamp)
+                    nrequests = server.coverage_requests()
+                    local = read_stamp(server.url('magmap.nc'), stamp, source=self.mirror)
+                    self.assertEqual(server.coverage_requests(), nrequests)
+                    self.assertTrue(np.array_equal(local, expected))
+
+    def test_missing_layers(self):
+        "Check layers without a local grid fail rather than going to the network"
+        layers = [('magmap', 'http://127.0.0.1:1/thredds/wcs/magmap.nc'),
+                  ('gravity', 'http://127.0.0.1:1/thredds/wcs/gravity.nc')]
+        cube, failed = get_cube(self.stamps[0], layers=layers, source=self.mirror)
+        self.assertEqual(failed, [layers[1]])
+        self.assertTrue(np.isfinite(cube[0]).all())
+        self.assertTrue(np.isnan(cube[1]).all())
+
+    def test_threads(self):
+        "Check the mirror can be shared between threads"
+        wcs = 'http://example.com/thredds/wcs/magmap.nc'
+        expected = [read_stamp(wcs, stamp, source=self.mirror) for stamp in self.stamps]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda s: read_stamp(wcs, s, source=self.mirror),
+                                        self.stamps * 4))
+        for idx, result in enumerate(results):
+            self.assertTrue(np.array_equal(result, expected[idx % 2]))
+
+        # Handles from the worker threads get closed too, and reads after
+        # closing open fresh ones
+        opened = list(self.mirror._opened)  # pylint: disable=W0212
+        self.assertGreater(len(opened), 1)
+        self.mirror.close()
+        self.assertTrue(all(src.closed for src in opened))
+        self.assertTrue(np.array_equal(read_stamp(wcs, self.stamps[0], source=self.mirror),
+                                       expected[0]))
+
+if __name__ == '__main__':
+    unittest.main()
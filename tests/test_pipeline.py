@@ -0,0 +1,159 @@
+""" file:    test_pipeline.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for the pipelined downloader
+"""
+
+import unittest
+import pickle
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas
+import rasterio
+
+from explore_australia import endpoints
+from explore_australia.coverage import CoverageService
+from explore_australia.download import CoverageTask
+from explore_australia.pipeline import Pipeline, get_coverages_pipelined
+from explore_australia.stamp import Stamp, coverage_folders, read_stamp, warp_to_array
+from explore_australia.warp import Coverage
+
+from wcs_server import LocalWCSServer
+
+class SlowWriter(Pipeline):
+
+    "A pipeline with a slow write stage, keeping track of how far ahead the tasks get"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written, self.ahead = 0, 0
+
+    def tasks(self, tasks):
+        "Yield tasks, recording how many haven't been written yet"
+        for idx, task in enumerate(tasks):
+            self.ahead = max(self.ahead, idx - self.written)
+            yield task
+
+    def _write(self, warper, task, warped):
+        time.sleep(0.02)
+        self.written += 1
+        return super()._write(warper, task, warped)
+
+class TestPipeline(unittest.TestCase):
+
+    "Tests for the pipeline"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.stamps = [Stamp(lon=135.9 + 0.05 * i, lat=-35.3, angle=10. * i,
+                             distance=5, n_pixels=51)
+                       for i in range(10)]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def tasks(self, server, layers=('magmap',)):
+        "Make tasks for our stamps"
+        return [CoverageTask(str(idx), stamp, layer, server.url(f'{layer}.nc'),
+                             self.root / f'{idx}_{layer}.tif', False)
+                for idx, stamp in enumerate(self.stamps) for layer in layers]
+
+    def check_outputs(self, server, tasks):
+        "Check the outputs match reading the stamps directly"
+        for task in tasks:
+            with rasterio.open(task.output) as src:
+                self.assertTrue(np.allclose(src.read(1), read_stamp(task.wcs, task.stamp),
+                                            equal_nan=True))
+
+    def test_coverage(self):
+        "Check in-memory coverages warp like open datasets"
+        with LocalWCSServer(resolution=0.002) as server, \
+                CoverageService(server.url()).open(self.stamps[0].geometry.bounds) as src:
+            coverage = pickle.loads(pickle.dumps(Coverage.from_dataset(src)))
+            self.assertTrue(np.array_equal(warp_to_array(coverage, self.stamps[0]),
+                                           warp_to_array(src, self.stamps[0]), equal_nan=True))
+
+    def test_threads(self):
+        "Check the pipeline gets every stamp, warping in threads"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks = self.tasks(server, layers=('magmap', 'radmap'))
+            pipeline = Pipeline(fetchers=3, warpers=2, writers=2, batch_size=4,
+                                processes=False)
+            failures = pipeline.run(tasks, show_progress=False)
+            self.assertEqual(failures, [])
+            self.check_outputs(server, tasks)
+
+        stats = pipeline.stats()
+        self.assertEqual(list(stats), ['fetch', 'warp', 'write'])
+        for name, metrics in stats.items():
+            with self.subTest(stage=name):
+                self.assertEqual(metrics['items'], len(tasks))
+                self.assertGreater(metrics['throughput'], 0)
+        self.assertLessEqual(stats['write']['batches'], len(tasks))
+
+    def test_processes(self):
+        "Check the pipeline can warp in worker processes"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks = self.tasks(server)[:4]
+            failures = Pipeline(fetchers=2, warpers=2).run(tasks, show_progress=False)
+            self.assertEqual(failures, [])
+            self.check_outputs(server, tasks)
+
+    def test_failures(self):
+        "Check failed tasks are reported without stopping the pipeline"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks = self.tasks(server)
+            tasks[3] = tasks[3]._replace(wcs=server.url('missing.nc'), output=self.root / 'x.tif')
+            server.fail_next = [404]  # capabilities for the first endpoint we hit
+            pipeline = Pipeline(fetchers=1, warpers=1, processes=False)
+            failures = pipeline.run(tasks[3:4] + tasks[:3] + tasks[4:], show_progress=False)
+        self.assertEqual([task.key for task, _ in failures], ['3'])
+        self.assertFalse((self.root / 'x.tif').exists())
+        self.assertEqual(pipeline.stats()['fetch']['failed'], 1)
+        self.assertEqual(pipeline.stats()['write']['items'], len(tasks) - 1)
+
+    def test_back_pressure(self):
+        "Check a slow stage holds up the ones before it"
+        with LocalWCSServer(resolution=0.002) as server:
+            tasks = self.tasks(server, layers=('magmap', 'radmap'))
+            pipeline = SlowWriter(fetchers=1, warpers=1, writers=1, queue_size=1,
+                                  batch_size=1, processes=False)
+            pipeline.run(pipeline.tasks(tasks), show_progress=False)
+
+        # One item in each queue, one in each worker and one being generated
+        self.assertLessEqual(pipeline.ahead, 7)
+        stats = pipeline.stats()
+        self.assertGreater(stats['fetch']['blocked'], stats['fetch']['busy'])
+        self.assertGreater(stats['write']['busy'], stats['write']['starved'])
+
+    def test_progress_total(self):
+        "Check the progress bar only counts the layers still to get"
+        name = str(self.root / 'stamp')
+        (wcses, folder), = coverage_folders(name)[:1]
+        folder.mkdir(parents=True)
+        done = list(wcses)[:2]
+        for layer in done:
+            (folder / f'{layer}.tif').touch()
+
+        stamps = pandas.DataFrame({'id': [name], 'local_projection': [self.stamps[0].crs]})
+        with mock.patch.object(Pipeline, 'run', return_value=[]) as run:
+            get_coverages_pipelined(stamps, logfile=str(self.root / 'log'),
+                                    show_progress=False)
+        self.assertEqual(run.call_args[1]['total'], endpoints.TOTAL_COVERAGES - len(done))
+
+    def test_pickle_stamp(self):
+        "Check stamps don't carry their pixel grids between processes"
+        stamp = self.stamps[0]
+        stamp.pixel_lonlat()
+        copied = pickle.loads(pickle.dumps(stamp))
+        self.assertLess(len(pickle.dumps(stamp)), 10000)
+        self.assertTrue(np.array_equal(copied.pixel_lonlat(), stamp.pixel_lonlat()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,14 @@
 """
 
 import unittest
+import concurrent.futures
 
 from shapely.geometry import Point, MultiPoint, LineString, MultiLineString, \
     GeometryCollection, Polygon, MultiPolygon
 import numpy as np
 
-from explore_australia.reprojection import reproject, get_projector
+from explore_australia.reprojection import reproject, reproject_geometries, \
+    get_projector, get_transformer
 
 class TestReprojection(unittest.TestCase):
 
@@ -23,6 +25,40 @@ class TestReprojection(unittest.TestCase):
         geom = Point(135, -43)
         self.assertTrue(np.allclose(geom.xy, projector(*geom.xy)))
 
+    def test_transformer_cache(self):
+        "Check transformers are reused within a thread but not between threads"
+        transformer = get_transformer('epsg:4326', 'epsg:3112')
+        self.assertIs(get_transformer('EPSG:4326', 'epsg:3112'), transformer)
+        self.assertIsNone(get_transformer('epsg:4326', 'epsg:4326'))
+        self.assertIsNot(get_transformer('epsg:3112', 'epsg:4326'), transformer)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            other = executor.submit(get_transformer, 'epsg:4326', 'epsg:3112').result()
+        self.assertIsNot(other, transformer)
+
+    def test_projector_threads(self):
+        "Check a projector can be shared between threads"
+        projector = get_projector('epsg:4326', 'epsg:3112')
+        lons, lats = np.random.uniform(120, 150, 100), np.random.uniform(-40, -15, 100)
+        expected = projector(lons, lats)
+        self.assertEqual(expected.shape, (2, 100))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: projector(lons, lats), range(8)))
+        for result in results:
+            self.assertTrue(np.array_equal(result, expected))
+
+    def test_crs_specifications(self):
+        "Check EPSG codes, PROJ strings and dicts give the same answer"
+        geom = Point(135, -43)
+        expected = reproject(geom, 'epsg:4326', 'epsg:3112')
+        wgs84 = '+proj=longlat +datum=WGS84 +no_defs'
+        for crs in (wgs84, {'proj': 'longlat', 'datum': 'WGS84', 'no_defs': True}):
+            with self.subTest(crs=crs):
+                self.assertTrue(np.allclose(
+                    reproject(geom, crs, 'epsg:3112').xy, expected.xy))
+        with self.assertRaises(ValueError):
+            get_projector(4326, 'epsg:3112')
+
     def test_fail_on_unknown(self):
         "An unknown object should raise a valueerror"
         with self.assertRaises(ValueError):
@@ -46,7 +82,7 @@ class TestReprojection(unittest.TestCase):
         geom = MultiPoint([(135, -43), (165, -25)])
         new_geom = reproject(geom, 'epsg:4326', 'epsg:3112')
         new_new_geom = reproject(new_geom, 'epsg:3112')
-        for g, ng in zip(geom, new_new_geom):
+        for g, ng in zip(geom.geoms, new_new_geom.geoms):
             self.assertTrue(np.allclose(g.xy, ng.xy))
 
     def test_reproject_linestring(self):
@@ -61,7 +97,7 @@ class TestReprojection(unittest.TestCase):
         geom = MultiLineString([[(135, -43), (165, -25)], [(134, -32), (132, -32)]])
         new_geom = reproject(geom, 'epsg:4326', 'epsg:3112')
         new_new_geom = reproject(new_geom, 'epsg:3112')
-        for g, ng in zip(geom, new_new_geom):
+        for g, ng in zip(geom.geoms, new_new_geom.geoms):
             self.assertTrue(np.allclose(g.xy, ng.xy))
 
     def test_reproject_polygon(self):
@@ -92,8 +128,49 @@ class TestReprojection(unittest.TestCase):
         ])
         new_geom = reproject(geom, 'epsg:4326', 'epsg:3112')
         new_new_geom = reproject(new_geom, 'epsg:3112')
-        for g, ng in zip(geom, new_new_geom):
+        for g, ng in zip(geom.geoms, new_new_geom.geoms):
             self.assertTrue(np.allclose(g.exterior.xy, ng.exterior.xy))
 
+    def test_reproject_geometries(self):
+        "Check bulk reprojection matches reprojecting one at a time"
+        geoms = [
+            Point(135, -43),
+            MultiPoint([(135, -43), (165, -25)]),
+            LineString([(135, -43), (165, -25)]),
+            MultiLineString([[(135, -43), (165, -25)], [(134, -32), (132, -32)]]),
+            Polygon(
+                shell=[(-1, -1), (-1, 2), (2, 2), (2, -1)],
+                holes=[[(0, 0), (1, 1), (1, 0)]]
+            ),
+            None
+        ]
+        for container in (list, np.array):
+            with self.subTest(container=container.__name__):
+                new_geoms = reproject_geometries(container(geoms), 'epsg:4326', 'epsg:3112')
+                self.assertIsInstance(new_geoms, type(container(geoms)))
+                self.assertIsNone(new_geoms[-1])
+                for geom, new_geom in zip(geoms[:-1], new_geoms):
+                    expected = reproject(geom, 'epsg:4326', 'epsg:3112')
+                    self.assertEqual(new_geom.geom_type, geom.geom_type)
+                    self.assertTrue(new_geom.equals_exact(expected, 1e-6))
+
+                # Inputs should be left alone
+                self.assertTrue(geoms[0].equals(Point(135, -43)))
+
+    def test_reproject_geoseries(self):
+        "Check GeoSeries come back with the new CRS"
+        try:
+            import geopandas
+        except ImportError:
+            self.skipTest('geopandas not installed')
+        series = geopandas.GeoSeries([Point(135, -43), Point(165, -25)],
+                                     index=['a', 'b'], crs='epsg:4326')
+        new_series = reproject_geometries(series, to_crs='epsg:3112')
+        self.assertEqual(list(new_series.index), ['a', 'b'])
+        self.assertEqual(new_series.crs.to_epsg(), 3112)
+        expected = series.to_crs('epsg:3112')
+        for geom, new_geom in zip(expected, new_series):
+            self.assertTrue(new_geom.equals_exact(geom, 1e-6))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,174 @@
+""" file:    test_retry.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for retries and circuit breakers
+"""
+
+import unittest
+import time
+
+import numpy as np
+import requests
+
+from explore_australia.coverage import WCSSource
+from explore_australia.download import AsyncCoverageDownloader, CoverageTask
+from explore_australia.retry import RetryPolicy, CircuitBreaker, CircuitBreakers, \
+    CircuitOpenError, HTTPStatusError, is_retryable
+from explore_australia.stamp import Stamp, read_stamp
+
+from wcs_server import LocalWCSServer
+
+class TestRetry(unittest.TestCase):
+
+    "Tests for retrying flaky endpoints"
+
+    def setUp(self):
+        self.stamp = Stamp(lon=135.9, lat=-35.3, angle=30., distance=5, n_pixels=51)
+
+    def test_classification(self):
+        "Check errors are split into retryable and permanent"
+        response = requests.Response()
+        response.status_code = 503
+        for exc, expected in (
+                (HTTPStatusError(429), True),
+                (HTTPStatusError(503), True),
+                (HTTPStatusError(404), False),
+                (HTTPStatusError(400), False),
+                (requests.HTTPError(response=response), True),
+                (requests.ConnectionError(), True),
+                (TimeoutError(), True),
+                (ValueError('bad layer'), False),
+                (CircuitOpenError('http://example.com'), False)):
+            with self.subTest(exc=repr(exc)):
+                self.assertEqual(is_retryable(exc), expected)
+
+    def test_backoff(self):
+        "Check delays grow exponentially up to the cap"
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt, cap in ((0, 1), (1, 2), (2, 4), (5, 5)):
+            delays = [policy.delay(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= cap for delay in delays))
+            self.assertGreater(max(delays), cap / 2)
+
+    def test_retry_then_succeed(self):
+        "Check transient failures are retried"
+        source = WCSSource(RetryPolicy(attempts=3, base_delay=0.001))
+        with LocalWCSServer(resolution=0.002) as server:
+            expected = read_stamp(server.url(), self.stamp)
+            server.fail_next = [503, 429]
+            nrequests = server.coverage_requests()
+            data = read_stamp(server.url(), self.stamp, source=source)
+            self.assertEqual(server.coverage_requests(), nrequests + 3)
+        self.assertTrue(np.array_equal(data, expected))
+        self.assertEqual(source.retry.counts['retried'], 2)
+
+    def test_permanent_failures(self):
+        "Check permanent failures and exhausted retries are raised"
+        source = WCSSource(RetryPolicy(attempts=3, base_delay=0.001))
+        with LocalWCSServer(resolution=0.002) as server:
+            read_stamp(server.url(), self.stamp)
+            nrequests = server.coverage_requests()
+
+            server.fail_next = [404]
+            with self.assertRaises(requests.HTTPError):
+                read_stamp(server.url(), self.stamp, source=source)
+            self.assertEqual(server.coverage_requests(), nrequests + 1)
+
+            server.fail_next = [503] * 3
+            with self.assertRaises(requests.HTTPError):
+                read_stamp(server.url(), self.stamp, source=source)
+            self.assertEqual(server.coverage_requests(), nrequests + 4)
+
+    def test_circuit_breaker(self):
+        "Check a failing endpoint is paused, then tried again"
+        breaker = CircuitBreaker(threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+        # After the timeout we get one trial request
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_breaker_pauses_endpoint(self):
+        "Check requests to an open endpoint fail without touching the server"
+        breakers = CircuitBreakers(threshold=2, reset_timeout=60)
+        source = WCSSource(RetryPolicy(attempts=1, breakers=breakers))
+        with LocalWCSServer(resolution=0.002) as server:
+            read_stamp(server.url('dead.nc'), self.stamp)
+            read_stamp(server.url('alive.nc'), self.stamp)
+            nrequests = server.coverage_requests()
+            server.fail_next = [503, 503]
+            for _ in range(2):
+                with self.assertRaises(requests.HTTPError):
+                    read_stamp(server.url('dead.nc'), self.stamp, source=source)
+            with self.assertRaises(CircuitOpenError):
+                read_stamp(server.url('dead.nc'), self.stamp, source=source)
+            self.assertEqual(server.coverage_requests(), nrequests + 2)
+            self.assertEqual(breakers.open_endpoints(), [server.url('dead.nc')])
+
+            # Other endpoints carry on
+            read_stamp(server.url('alive.nc'), self.stamp, source=source)
+
+    def test_failed_trial(self):
+        "Check a failed trial request raises the real error, not CircuitOpenError"
+        breakers = CircuitBreakers(threshold=1, reset_timeout=0.05)
+        policy = RetryPolicy(attempts=4, base_delay=0, breakers=breakers)
+        errors = [ConnectionError('first'), ConnectionError('trial')]
+
+        def _flaky():
+            raise errors.pop(0)
+
+        for message in ('first', 'trial'):
+            with self.assertRaisesRegex(ConnectionError, message):
+                policy.call(_flaky, key='wcs')
+            self.assertEqual(breakers['wcs'].state, 'open')
+            time.sleep(0.06)
+        self.assertEqual(policy.counts['tripped'], 2)
+        self.assertEqual(policy.counts['rejected'], 0)
+
+    def test_permanent_failures_leave_breaker(self):
+        "Check dead layers and our own bugs don't pause a healthy endpoint"
+        breakers = CircuitBreakers(threshold=2, reset_timeout=60)
+        policy = RetryPolicy(attempts=1, breakers=breakers)
+        with LocalWCSServer(resolution=0.002) as server:
+            server.fail_next = [404] * 3
+            for _ in range(3):
+                with self.assertRaises(requests.HTTPError):
+                    read_stamp(server.url('dead.nc'), self.stamp, source=WCSSource(policy))
+            def _bug():
+                raise ValueError('oops')
+            for _ in range(3):
+                with self.assertRaises(ValueError):
+                    policy.call(_bug, key=server.url('dead.nc'))
+            self.assertEqual(breakers.open_endpoints(), [])
+            self.assertEqual(policy.counts['permanent'], 6)
+
+    def test_async_retries(self):
+        "Check the asynchronous downloader retries too"
+        import tempfile
+        from pathlib import Path
+        with tempfile.TemporaryDirectory() as tempdir, \
+                LocalWCSServer(resolution=0.005) as server:
+            tasks = [CoverageTask('a', self.stamp, 'magmap', server.url('magmap.nc'),
+                                  Path(tempdir) / 'magmap.tif', False)]
+            server.fail_next = [None, 502]  # let capabilities through
+            downloader = AsyncCoverageDownloader(
+                concurrency=1, retry=RetryPolicy(attempts=2, base_delay=0.001))
+            failures = downloader.run(tasks, show_progress=False)
+            self.assertEqual(failures, [])
+            self.assertEqual(server.coverage_requests(), 2)
+            self.assertTrue(tasks[0].output.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,7 +16,8 @@ from explore_australia.rotation import \
     geographic_to_spherical, spherical_to_geographic, \
     spherical_to_cartesian, cartesian_to_spherical, \
     geographic_to_cartesian, cartesian_to_geographic, \
-    rotation_matrix, rotate
+    rotation_matrix, rotation_matrices, rotate_vectors, \
+    rotate_coordinates, rotate_geometries, rotate
 from explore_australia.geometry import make_box
 
 class TestRotation(unittest.TestCase):
@@ -131,5 +132,69 @@ class TestRotation(unittest.TestCase):
                     self.assertTrue(rgeom is not None)
                     self.assertEqual(rgeom.geom_type, geom.geom_type)
 
+    def test_rotation_matrices(self):
+        "Check the closed-form matrices match the matrix exponential"
+        from scipy.linalg import expm
+
+        axes = np.random.normal(size=(20, 3))
+        angles = np.random.uniform(-2 * np.pi, 2 * np.pi, 20)
+        matrices = rotation_matrices(axes, angles)
+        self.assertEqual(matrices.shape, (20, 3, 3))
+        for axis, angle, matrix in zip(axes, angles, matrices):
+            expected = expm(np.cross(np.eye(3), axis / norm(axis) * angle))
+            self.assertTrue(np.allclose(matrix, expected))
+            self.assertTrue(np.allclose(rotation_matrix(axis, angle), expected))
+
+    def test_rotate_vectors(self):
+        "Check batched rotation matches rotating one batch at a time"
+        axes = np.random.normal(size=(5, 3))
+        angles = np.random.uniform(0, 2 * np.pi, 5)
+        vectors = np.random.normal(size=(5, 7, 3))
+        rotated = rotate_vectors(vectors, axes, angles)
+        self.assertEqual(rotated.shape, (5, 7, 3))
+        for idx in range(5):
+            expected = (rotation_matrix(axes[idx], angles[idx]) @ vectors[idx].T).T
+            self.assertTrue(np.allclose(rotated[idx], expected))
+
+    def test_rotate_batches(self):
+        "Check batched geographic rotation matches rotating each geometry"
+        centres = [Point(116.35, -42.01), Point(135.5, -25.3), Point(140.0, -12.5)]
+        angles = [30., 145., 270.]
+        boxes = [make_box(centre, distance=10) for centre in centres]
+
+        # Coordinate arrays
+        rings = np.stack([np.asarray(box.exterior.coords) for box in boxes])
+        poles = np.asarray([centre.coords[0] for centre in centres])
+        rotated = rotate_coordinates(rings, poles, angles)
+        self.assertEqual(rotated.shape, rings.shape)
+
+        # Geometry arrays, with mixed types
+        geoms = boxes + [MultiLineString([[(130, -30), (131, -31)], [(132, -32), (133, -33)]])]
+        rgeoms = rotate_geometries(geoms, centres + [centres[0]], angles + [angles[0]])
+        for idx, (geom, centre, angle) in enumerate(zip(geoms, centres + [centres[0]],
+                                                        angles + [angles[0]])):
+            with self.subTest(geom=idx):
+                expected = rotate(geom, centre, angle)
+                self.assertEqual(rgeoms[idx].geom_type, geom.geom_type)
+                self.assertTrue(rgeoms[idx].equals_exact(expected, 1e-9))
+                if idx < len(boxes):
+                    self.assertTrue(np.allclose(rotated[idx], expected.exterior.coords))
+
+        # Inputs are left alone
+        self.assertTrue(geoms[0].equals(boxes[0]))
+
+    def test_rotate_geometries_one_pole(self):
+        "Check a single pole and angle are used for every geometry"
+        geoms = [make_box(Point(130 + idx, -30 - idx), 10) for idx in range(4)]
+        pole = Point(135, -25)
+        for poles in (pole, [135, -25], [[135, -25]]):
+            with self.subTest(poles=poles):
+                rgeoms = rotate_geometries(geoms, poles, 30)
+                self.assertEqual(len(rgeoms), len(geoms))
+                for geom, rgeom in zip(geoms, rgeoms):
+                    self.assertTrue(rgeom.equals_exact(rotate(geom, pole, 30), 1e-9))
+        with self.assertRaises(ValueError):
+            rotate_geometries(geoms, [[135, -25], [136, -26]], 30)
+
 if __name__ == '__main__':
     unittest.main()
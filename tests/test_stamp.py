@@ -0,0 +1,106 @@
+""" file:    test_stamp.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for stamp generation
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+
+from explore_australia import CoverageService
+from explore_australia.reprojection import get_transformer
+from explore_australia.stamp import Stamp, get_stamp, warp_to_array, pixel_lonlats
+
+from wcs_server import LocalWCSServer
+
+class TestStamp(unittest.TestCase):
+
+    "Tests for stamp grids"
+
+    def test_pixel_lonlat(self):
+        "Check pixel centres line up with the stamp grid"
+        stamp = Stamp(lon=135.9, lat=-35.3, angle=30., distance=5, n_pixels=(51, 41))
+        lonlat = stamp.pixel_lonlat()
+        self.assertEqual(lonlat.shape, (41, 51, 2))
+        self.assertIs(stamp.pixel_lonlat(), lonlat)
+        with self.assertRaises(ValueError):
+            lonlat[0, 0] = 0
+
+        # Check a few pixels against going through rasterio and pyproj
+        transformer = get_transformer(stamp.crs, 'epsg:4326')
+        for row, col in ((0, 0), (20, 25), (40, 50), (3, 47)):
+            with self.subTest(row=row, col=col):
+                x, y = rasterio.transform.xy(stamp.transform, row, col)
+                self.assertTrue(np.allclose(lonlat[row, col], transformer.transform(x, y)))
+
+        # All the pixels should be inside the stamp footprint
+        self.assertTrue(np.all(np.abs(lonlat[..., 0] - stamp.lon) < 0.05))
+        self.assertTrue(np.all(np.abs(lonlat[..., 1] - stamp.lat) < 0.05))
+
+    def test_pixel_lonlats(self):
+        "Check we can stack pixel centres for many stamps"
+        stamps = [Stamp(lon=lon, lat=-30., angle=angle, distance=5, n_pixels=21)
+                  for lon, angle in ((120., 0.), (130., 45.), (140., 275.))]
+        cached = stamps[1].pixel_lonlat()
+        lonlats = pixel_lonlats(stamps)
+        self.assertEqual(lonlats.shape, (3, 21, 21, 2))
+        self.assertTrue(np.array_equal(lonlats[1], cached))
+        self.assertTrue(np.array_equal(lonlats[2], stamps[2].pixel_lonlat()))
+        with self.assertRaises(ValueError):
+            pixel_lonlats(stamps + [Stamp(lon=120., lat=-30., n_pixels=11)])
+
+class TestGetStamp(unittest.TestCase):
+
+    "Tests for pulling stamps from a WCS"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.stamp = Stamp(lon=135.9, lat=-35.3, angle=30, distance=5, n_pixels=101)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_get_stamp(self):
+        "Check we get a georeferenced stamp on the right grid"
+        with LocalWCSServer(resolution=0.002) as server:
+            output = get_stamp(server.url(), self.stamp, output=self.root / 'stamp.tif')
+        with rasterio.open(output) as src:
+            self.assertEqual(src.shape, (101, 101))
+            self.assertEqual(src.transform, self.stamp.transform)
+            self.assertEqual(src.crs, self.stamp.rasterio_crs)
+
+    def test_remove_crs(self):
+        "Check we can strip the CRS on the way out"
+        with LocalWCSServer(resolution=0.002) as server:
+            output = get_stamp(server.url(), self.stamp, output=self.root / 'stamp.tif',
+                               remove_crs=True)
+        with rasterio.open(output) as src:
+            self.assertIsNone(src.crs)
+            self.assertEqual(src.transform, self.stamp.transform)
+
+    def test_matches_file_warp(self):
+        "Check the in-memory warp matches warping band-to-band on disk"
+        with LocalWCSServer(resolution=0.002) as server:
+            data = CoverageService(server.url()).fetch(self.stamp.geometry.bounds)
+
+        # Warp straight into a file band
+        with MemoryFile(data) as memfile, memfile.open() as src:
+            in_memory = warp_to_array(src, self.stamp)
+            with rasterio.open(self.root / 'band.tif', 'w', **self.stamp.get_tiff_metadata()) as sink:
+                rasterio.warp.reproject(
+                    source=rasterio.band(src, 1),
+                    destination=rasterio.band(sink, 1),
+                    resampling=rasterio.warp.Resampling.nearest
+                )
+        with rasterio.open(self.root / 'band.tif') as src:
+            self.assertTrue(np.array_equal(src.read(1), in_memory))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+""" file:    test_stream.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for streaming coverage responses
+"""
+
+import unittest
+import concurrent.futures
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from explore_australia.coverage import CoverageService, WCSSource
+from explore_australia.retry import RetryPolicy, is_retryable
+from explore_australia.stamp import Stamp, read_stamp
+from explore_australia.stream import MemoryBudget, ResponseBuffer, IncompleteResponseError, \
+    buffer_stream, content_length, copy_stream
+
+from wcs_server import LocalWCSServer, render_coverage
+
+BOUNDS = (135.5, -35.5, 136.5, -34.5)
+
+def chunked(data, size=1000):
+    "Split some bytes into chunks"
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+class TestStreaming(unittest.TestCase):
+
+    "Tests for streaming responses"
+
+    def setUp(self):
+        self.data = render_coverage(BOUNDS, 0.01)
+
+    def test_copy_stream(self):
+        "Check streams are copied, counted and checksummed"
+        sink = io.BytesIO()
+        stats = copy_stream(chunked(self.data), sink, len(self.data), 'sha256')
+        self.assertEqual(sink.getvalue(), self.data)
+        self.assertEqual(stats.nbytes, len(self.data))
+        self.assertEqual(stats.checksum, hashlib.sha256(self.data).hexdigest())
+        self.assertIsNone(copy_stream(chunked(self.data), io.BytesIO()).checksum)
+
+    def test_content_length(self):
+        "Check lengths are validated"
+        for expected in (len(self.data) + 1, len(self.data) - 1):
+            with self.subTest(expected=expected), self.assertRaises(IncompleteResponseError) as err:
+                copy_stream(chunked(self.data), io.BytesIO(), expected)
+            self.assertTrue(is_retryable(err.exception))
+        self.assertEqual(content_length({'Content-Length': '12'}), 12)
+        self.assertIsNone(content_length({'Content-Length': '12', 'Content-Encoding': 'gzip'}))
+        self.assertIsNone(content_length({}))
+
+    def test_budget(self):
+        "Check the memory budget makes downloads wait their turn"
+        budget = MemoryBudget(limit=100)
+        self.assertTrue(budget.acquire(60))
+        self.assertFalse(budget.acquire(60, blocking=False))
+
+        # Blocks until the first reservation is released
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: budget.acquire(60) and acquired.set())
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(acquired.is_set())
+        budget.release(60)
+        thread.join(1)
+        self.assertTrue(acquired.is_set())
+        budget.release(60)
+
+        # Oversized requests go through on their own
+        self.assertTrue(budget.acquire(1000))
+        budget.release(1000)
+        self.assertEqual(budget.used, 0)
+        self.assertEqual(budget.peak, 1000)
+
+    def test_buffer(self):
+        "Check buffered responses can be opened and give back their memory"
+        budget = MemoryBudget(limit=len(self.data))
+        with buffer_stream(chunked(self.data), len(self.data), budget=budget) as buffer:
+            self.assertFalse(buffer.spilled)
+            self.assertEqual(budget.used, len(self.data))
+            with buffer.open() as src:
+                self.assertEqual(src.shape, (100, 100))
+        self.assertEqual(budget.used, 0)
+
+    def test_spill(self):
+        "Check responses which outgrow the budget are moved to disk"
+        data = render_coverage(BOUNDS, 0.004)
+        budget = MemoryBudget(limit=len(data) // 2)
+        with buffer_stream(chunked(data), budget=budget) as buffer:
+            self.assertTrue(buffer.spilled)
+            self.assertEqual(budget.used, 0)
+            with buffer.open() as src:
+                self.assertEqual(src.shape, (250, 250))
+            path = buffer.path
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_buffer(self):
+        "Check failed streams give back their memory"
+        budget = MemoryBudget(limit=None)
+        with self.assertRaises(IncompleteResponseError):
+            buffer_stream(chunked(self.data), len(self.data) + 1, budget=budget)
+        self.assertEqual(budget.used, 0)
+        with ResponseBuffer() as buffer:
+            buffer.write(self.data)
+            self.assertEqual(buffer.nbytes, len(self.data))
+
+class TestStreamingService(unittest.TestCase):
+
+    "Tests for streaming from a WCS"
+
+    def setUp(self):
+        self.stamp = Stamp(lon=135.9, lat=-35.3, angle=30., distance=5, n_pixels=51)
+
+    def test_download(self):
+        "Check coverages are streamed to disk with a checksum"
+        with tempfile.TemporaryDirectory() as tempdir, LocalWCSServer(resolution=0.01) as server:
+            service = CoverageService(server.url())
+            output = Path(tempdir) / 'coverage.tif'
+            stats = service.download(BOUNDS, output, checksum='sha256')
+            data = output.read_bytes()
+            self.assertEqual(data, service.fetch(BOUNDS))
+            self.assertEqual(stats, (len(data), hashlib.sha256(data).hexdigest()))
+
+            # Truncated responses don't leave anything behind
+            server.truncate_next = [1000]
+            with self.assertRaises(requests.RequestException) as err:
+                service.download(BOUNDS, output)
+            self.assertTrue(is_retryable(err.exception))
+            self.assertFalse(output.exists())
+
+    def test_truncated_retry(self):
+        "Check truncated responses are retried"
+        source = WCSSource(RetryPolicy(attempts=2, base_delay=0.001))
+        with LocalWCSServer(resolution=0.002) as server:
+            expected = read_stamp(server.url(), self.stamp)
+            server.truncate_next = [1000]
+            data = read_stamp(server.url(), self.stamp, source=source)
+        self.assertTrue(np.array_equal(data, expected))
+        self.assertEqual(source.retry.counts['retried'], 1)
+
+    def test_memory_ceiling(self):
+        "Check parallel reads stay under the memory ceiling"
+        stamps = [Stamp(lon=135.9 + 0.1 * i, lat=-35.3, angle=30., distance=5, n_pixels=51)
+                  for i in range(8)]
+        with LocalWCSServer(resolution=0.002) as server:
+            with CoverageService(server.url()).buffer(stamps[0].geometry.bounds) as buffer:
+                limit = int(2.5 * buffer.nbytes)
+            source = WCSSource(budget=MemoryBudget(limit=limit))
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda stamp: read_stamp(server.url(), stamp, source=source), stamps))
+        self.assertEqual(len(results), 8)
+        self.assertLessEqual(source.budget.peak, limit)
+        self.assertEqual(source.budget.used, 0)
+
+if __name__ == '__main__':
+    unittest.main()
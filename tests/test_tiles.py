@@ -0,0 +1,84 @@
+""" file:    test_tiles.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for the local coverage tile cache
+"""
+
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+from explore_australia.stamp import Stamp, get_stamp
+from explore_australia.tiles import TileCache
+
+from wcs_server import LocalWCSServer
+
+class TestTileCache(unittest.TestCase):
+
+    "Tests for the tile cache"
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.cache = TileCache(self.root / 'tiles', tile_size=0.5)
+
+        # A cluster of overlapping stamps straddling a tile boundary
+        self.stamps = [
+            Stamp(lon=136.0 + offset, lat=-35.0 + offset, angle=angle,
+                  distance=5, n_pixels=51)
+            for offset, angle in ((0, 0), (0.01, 45), (-0.02, 120), (0.03, 300))
+        ]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_tile_indices(self):
+        "Check tiles cover the bounds asked for"
+        bounds = (135.9, -35.1, 136.1, -34.9)
+        tiles = self.cache.tiles(bounds)
+        self.assertEqual(len(tiles), 4)
+        for tile in tiles:
+            minx, miny, maxx, maxy = self.cache.tile_bounds(tile)
+            self.assertTrue(minx < bounds[2] and maxx > bounds[0])
+            self.assertTrue(miny < bounds[3] and maxy > bounds[1])
+
+    def test_prefetch(self):
+        "Check that prefetching only gets each tile once"
+        with LocalWCSServer(resolution=0.002) as server:
+            wcs = server.url('magmap.nc')
+            failed = self.cache.prefetch(self.stamps, [wcs], show_progress=False)
+            self.assertEqual(failed, [])
+            self.assertEqual(server.coverage_requests(), 4)
+            for stamp in self.stamps:
+                self.assertTrue(self.cache.covers(wcs, stamp.geometry.bounds))
+
+            # Running again shouldn't hit the server
+            self.cache.prefetch(self.stamps, [wcs], show_progress=False)
+            self.assertEqual(server.coverage_requests(), 4)
+
+    def test_get_stamp_from_tiles(self):
+        "Check stamps cut from tiles match stamps pulled from the WCS"
+        with LocalWCSServer(resolution=0.002) as server:
+            wcs = server.url('magmap.nc')
+            self.cache.prefetch(self.stamps, [wcs], show_progress=False)
+            nrequests = server.coverage_requests()
+
+            for idx, stamp in enumerate(self.stamps):
+                with self.subTest(stamp=idx):
+                    from_tiles = get_stamp(wcs, stamp, output=self.root / f'tiled_{idx}.tif',
+                                           tiles=self.cache)
+                    direct = get_stamp(wcs, stamp, output=self.root / f'direct_{idx}.tif')
+                    with rasterio.open(from_tiles) as tsrc, rasterio.open(direct) as dsrc:
+                        self.assertEqual(tsrc.transform, dsrc.transform)
+                        matches = np.isclose(tsrc.read(1), dsrc.read(1))
+                        self.assertGreater(matches.mean(), 0.99)
+
+            # Only the direct requests should have gone to the server
+            self.assertEqual(server.coverage_requests(), nrequests + len(self.stamps))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+""" file:    test_vector.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for vector resampling
+"""
+
+import unittest
+
+import numpy as np
+from shapely.geometry import LineString, Point, Polygon
+
+from explore_australia.vector import (LinestringSampler, RaggedLinestringSampler,
+                                      resample_linestring, resample_many, resample_polygon)
+
+class TestRaggedLinestringSampler(unittest.TestCase):
+
+    "Tests for resampling lots of linestrings at once"
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.lines = [LineString(rng.normal(size=(rng.integers(2, 20), 2)))
+                      for _ in range(50)]
+        self.polygon = Point(0, 0).buffer(10) \
+            .difference(Point(3, 0).buffer(1)).difference(Point(-3, 0).buffer(1))
+
+    def test_sample(self):
+        "Check sampling matches sampling each linestring on its own"
+        sampler = RaggedLinestringSampler.from_geometries(self.lines)
+        self.assertEqual(len(sampler), len(self.lines))
+        for idx, line in enumerate(self.lines):
+            single = LinestringSampler(line)
+            self.assertAlmostEqual(sampler.lengths[idx], single.length)
+            distances = np.linspace(0, single.length, 7)
+            self.assertTrue(np.allclose(sampler.sample(distances, np.full(7, idx)),
+                                        single.sample(distances)))
+
+    def test_resample(self):
+        "Check resampling matches resample_linestring"
+        points, offsets = RaggedLinestringSampler.from_geometries(self.lines).resample(0.05)
+        self.assertEqual(offsets[-1], len(points))
+        for idx, line in enumerate(self.lines):
+            expected = resample_linestring(line, 0.05)
+            self.assertEqual(offsets[idx + 1] - offsets[idx], len(expected))
+            self.assertTrue(np.allclose(points[offsets[idx]:offsets[idx + 1]], expected))
+
+    def test_degenerate(self):
+        "Check repeated vertices and single points don't throw sampling off"
+        sampler = RaggedLinestringSampler(
+            [[0, 0], [0, 0], [1, 0], [5, 5], [5, 5], [6, 5]], [0, 3, 4, 6])
+        self.assertTrue(np.allclose(sampler.lengths, [1, 0, 1]))
+        self.assertTrue(np.allclose(
+            sampler.sample([0, 0.5, 1, 0, 0, 0.5, 1], [0, 0, 0, 1, 2, 2, 2]),
+            [[0, 0], [0.5, 0], [1, 0], [5, 5], [5, 5], [5.5, 5], [6, 5]]))
+
+    def test_polygon(self):
+        "Check polygon shells and holes are resampled together"
+        rings = [self.polygon.exterior] + list(self.polygon.interiors)
+        expected = np.vstack([resample_linestring(ring, 0.5) for ring in rings])
+        self.assertTrue(np.allclose(resample_polygon(self.polygon, 0.5), expected))
+        resampled = resample_polygon(self.polygon, 0.5, return_points=False)
+        self.assertEqual(len(resampled.interiors), 2)
+        self.assertAlmostEqual(resampled.area, self.polygon.area, delta=0.01 * self.polygon.area)
+
+    def test_many(self):
+        "Check mixed linestrings and polygons come back in order"
+        geoms = [self.lines[0], self.polygon, self.lines[1]]
+        resampled = resample_many(geoms, 0.5)
+        self.assertEqual(len(resampled), 3)
+        self.assertTrue(np.allclose(resampled[0], resample_linestring(self.lines[0], 0.5)))
+        self.assertTrue(np.allclose(resampled[1], resample_polygon(self.polygon, 0.5)))
+        self.assertTrue(np.allclose(resampled[2], resample_linestring(self.lines[1], 0.5)))
+        with self.assertRaises(ValueError):
+            resample_many([Point(0, 0)], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
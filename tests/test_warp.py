@@ -0,0 +1,163 @@
+""" file:    test_warp.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: Tests for cached warp plans
+"""
+
+import unittest
+from multiprocessing import shared_memory
+
+import numpy as np
+import rasterio
+import rasterio.warp
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+from explore_australia import CoverageService
+from explore_australia.stamp import Stamp, get_cube, warp_to_array
+from explore_australia.warp import WarpPlan, WarpPlanCache, WARP_PLANS, Coverage, \
+    SharedBlocks, ThreadWarper, ProcessWarper
+
+from wcs_server import LocalWCSServer
+
+class TestWarpPlan(unittest.TestCase):
+
+    "Tests for warp plans"
+
+    def setUp(self):
+        self.stamp = Stamp(lon=135.9, lat=-35.3, angle=30., distance=5, n_pixels=101)
+        self.src_transform = from_origin(135.85, -35.25, 0.001, 0.001)
+        self.src_shape = (60, 120)  # stamp hangs off the bottom edge
+
+    def warp(self, band, nodata=None):
+        "Warp with GDAL, the way we used to"
+        output = np.zeros((self.stamp.height, self.stamp.width), dtype='float32')
+        rasterio.warp.reproject(
+            source=band, destination=output,
+            src_transform=self.src_transform, src_crs='EPSG:4326', src_nodata=nodata,
+            dst_transform=self.stamp.transform, dst_crs=self.stamp.rasterio_crs,
+            dst_nodata=nodata, resampling=rasterio.warp.Resampling.nearest
+        )
+        return output
+
+    def test_matches_reproject(self):
+        "Check a plan picks the same pixels as rasterio, including off the edge"
+        plan = WarpPlan.from_grids('EPSG:4326', self.src_transform, self.src_shape,
+                                   self.stamp.rasterio_crs, self.stamp.transform,
+                                   (self.stamp.height, self.stamp.width))
+        self.assertTrue((~plan.valid).any())
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                band = np.random.default_rng(seed).normal(size=self.src_shape).astype('float32')
+                self.assertTrue(np.array_equal(plan.apply(band), self.warp(band)))
+
+        # Check nodata is carried through
+        band = np.ones(self.src_shape, dtype='float32')
+        band[20:40, 40:60] = -9999
+        self.assertTrue(np.array_equal(plan.apply(band, nodata=-9999),
+                                       self.warp(band, nodata=-9999)))
+
+        with self.assertRaises(ValueError):
+            plan.apply(band[:10])
+
+        # Check we can warp into an existing array
+        out = np.full((self.stamp.height, self.stamp.width), 5, dtype='float32')
+        self.assertIs(plan.apply(band, nodata=-9999, out=out), out)
+        self.assertTrue(np.array_equal(out, self.warp(band, nodata=-9999)))
+
+    def test_cache(self):
+        "Check plans are shared between layers on the same grid"
+        plans = WarpPlanCache(maxsize=2)
+        profile = dict(driver='GTiff', width=self.src_shape[1], height=self.src_shape[0],
+                       count=1, dtype='float32', crs='EPSG:4326', transform=self.src_transform)
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as sink:
+                sink.write(np.ones(self.src_shape, dtype='float32'), 1)
+            with memfile.open() as src:
+                for _ in range(3):
+                    warp_to_array(src, self.stamp, plans=plans)
+                self.assertEqual((plans.hits, plans.misses), (2, 1))
+
+                # A new stamp needs a new plan, and the cache stays bounded
+                for angle in (10., 20.):
+                    warp_to_array(src, Stamp(lon=135.9, lat=-35.3, angle=angle,
+                                             distance=5, n_pixels=101), plans=plans)
+                self.assertEqual(len(plans), 2)
+                self.assertEqual(plans.misses, 3)
+
+    def test_cube_layers_share_plans(self):
+        "Check all the layers of a cube reuse one plan"
+        WARP_PLANS.clear()
+        with LocalWCSServer(resolution=0.002) as server:
+            layers = [(name, server.url(f'{name}.nc')) for name in ('dose', 'pctk', 'ppmth')]
+            cube, failed = get_cube(self.stamp, layers=layers)
+            self.assertEqual(failed, [])
+            self.assertEqual((WARP_PLANS.hits, WARP_PLANS.misses), (2, 1))
+
+            # Check against warping each layer with GDAL
+            for band, (_, wcs) in zip(cube, layers):
+                data = CoverageService(wcs).fetch(self.stamp.geometry.bounds)
+                with MemoryFile(data) as memfile, memfile.open() as src:
+                    expected = np.zeros((self.stamp.height, self.stamp.width), dtype='float32')
+                    rasterio.warp.reproject(
+                        source=rasterio.band(src, 1), destination=expected,
+                        dst_transform=self.stamp.transform, dst_crs=self.stamp.rasterio_crs,
+                        resampling=rasterio.warp.Resampling.nearest
+                    )
+                self.assertTrue(np.array_equal(band, expected))
+
+class TestWarpers(unittest.TestCase):
+
+    "Tests for the thread and process warping backends"
+
+    def setUp(self):
+        self.stamps = [Stamp(lon=135.9, lat=-35.3, angle=angle, distance=5, n_pixels=101)
+                       for angle in (0., 30., 60.)]
+        transform = from_origin(135.8, -35.2, 0.001, 0.001)
+        data = np.random.default_rng(42).normal(size=(200, 200)).astype('float32')
+        self.coverage = Coverage(data, rasterio.crs.CRS.from_epsg(4326), transform, None)
+
+    def test_blocks(self):
+        "Check shared memory blocks are reused and unlinked"
+        with SharedBlocks(min_size=1024) as blocks:
+            block, array = blocks.take((10, 10), 'float64')
+            self.assertEqual((array.shape, array.dtype, block.size), ((10, 10), 'float64', 1024))
+            blocks.give(block)
+            again, _ = blocks.take((20, 10), 'float32')
+            self.assertIs(again, block)
+            bigger, _ = blocks.take((40, 40), 'float32')
+            self.assertEqual(bigger.size, 8192)
+            self.assertEqual(blocks.nbytes, 1024 + 8192)
+            name = bigger.name
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_process_warper(self):
+        "Check warping in worker processes matches warping in threads"
+        expected = [ThreadWarper().warp(self.coverage, stamp)[0] for stamp in self.stamps]
+        with ProcessWarper(nworkers=2) as warper:
+            # Coverage copied into shared memory
+            for stamp, want in zip(self.stamps, expected):
+                data, block = warper.warp(self.coverage, stamp)
+                self.assertTrue(np.array_equal(data, want))
+                warper.release(block)
+
+            # Coverage read straight into shared memory
+            with MemoryFile() as memfile:
+                with memfile.open(driver='GTiff', width=200, height=200, count=1,
+                                  dtype='float32', crs='EPSG:4326',
+                                  transform=self.coverage.transform) as sink:
+                    sink.write(self.coverage.data, 1)
+                with memfile.open() as src:
+                    coverage, block = warper.read(src)
+                data, output = warper.warp(coverage, self.stamps[1], block)
+                self.assertTrue(np.array_equal(data, expected[1]))
+                for used in (block, output):
+                    warper.release(used)
+
+            # Blocks are reused rather than made for every warp
+            self.assertLessEqual(len(warper.blocks._blocks), 3)  # pylint: disable=W0212
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+""" file:    wcs_server.py (tests)
+    author:  Jess Robertson, jess@unearthed.solutions
+    date:    Saturday, 17 October 2026
+
+    description: A local stand-in for the NCI THREDDS WCS endpoints so that
+        downloads can be tested and benchmarked offline
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+
+# Extent of the coverages served, roughly mainland Australia + Tasmania
+AUSTRALIA_BOUNDS = (112.0, -44.0, 154.0, -9.0)
+
+CAPABILITIES_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<WCS_Capabilities version="1.0.0" xmlns="http://www.opengis.net/wcs"
+    xmlns:gml="http://www.opengis.net/gml" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <Service>
+    <name>WCS</name><label>Local stand-in WCS</label>
+    <fees>NONE</fees><accessConstraints>NONE</accessConstraints>
+  </Service>
+  <Capability>
+    <Request>
+      <GetCapabilities><DCPType><HTTP><Get>
+        <OnlineResource xlink:href="{url}"/>
+      </Get></HTTP></DCPType></GetCapabilities>
+      <DescribeCoverage><DCPType><HTTP><Get>
+        <OnlineResource xlink:href="{url}"/>
+      </Get></HTTP></DCPType></DescribeCoverage>
+      <GetCoverage><DCPType><HTTP><Get>
+        <OnlineResource xlink:href="{url}"/>
+      </Get></HTTP></DCPType></GetCoverage>
+    </Request>
+    <Exception><Format>application/vnd.ogc.se_xml</Format></Exception>
+  </Capability>
+  <ContentMetadata>
+    <CoverageOfferingBrief>
+      <name>{layer}</name>
+      <label>{layer}</label>
+      <lonLatEnvelope srsName="urn:ogc:def:crs:OGC:1.3:CRS84">
+        <gml:pos>{bounds[0]} {bounds[1]}</gml:pos>
+        <gml:pos>{bounds[2]} {bounds[3]}</gml:pos>
+      </lonLatEnvelope>
+    </CoverageOfferingBrief>
+  </ContentMetadata>
+</WCS_Capabilities>
+"""
+
+def synthetic_field(lons, lats):
+    """
+    A smooth, deterministic field so that the same location always has
+    the same value no matter how the coverage was requested
+
+    Parameters:
+        lons, lats - arrays of longitude/latitude, in degrees
+
+    Returns:
+        an array of float32 values
+    """
+    return (np.sin(np.radians(lons) * 200) + np.cos(np.radians(lats) * 300)).astype('float32')
+
+def render_coverage(bbox, resolution, bounds=AUSTRALIA_BOUNDS):
+    """
+    Render a GeoTIFF for the given bbox on a fixed global pixel lattice
+
+    Parameters:
+        bbox - the requested (minx, miny, maxx, maxy) in WGS84
+        resolution - the pixel size, in degrees
+        bounds - the extent of the coverage
+
+    Returns:
+        the GeoTIFF as bytes
+    """
+    # Snap outwards onto the lattice anchored at the coverage origin
+    minx, miny, maxx, maxy = bbox
+    left = bounds[0] + np.floor((max(minx, bounds[0]) - bounds[0]) / resolution) * resolution
+    top = bounds[3] - np.floor((bounds[3] - min(maxy, bounds[3])) / resolution) * resolution
+    width = max(int(np.ceil((min(maxx, bounds[2]) - left) / resolution)), 1)
+    height = max(int(np.ceil((top - max(miny, bounds[1])) / resolution)), 1)
+
+    # Sample the field at pixel centres
+    lons = left + (np.arange(width) + 0.5) * resolution
+    lats = top - (np.arange(height) + 0.5) * resolution
+    data = synthetic_field(*np.meshgrid(lons, lats))
+
+    profile = dict(
+        driver='GTiff', dtype='float32', count=1, width=width, height=height,
+        crs='EPSG:4326', transform=from_origin(left, top, resolution, resolution),
+        nodata=None
+    )
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as sink:
+            sink.write(data, 1)
+        return memfile.read()
+
+class _Handler(BaseHTTPRequestHandler):
+
+    "Handles GetCapabilities and GetCoverage requests"
+
+    protocol_version = 'HTTP/1.1'  # so clients can keep connections alive
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+    def do_GET(self):  # pylint: disable=C0103
+        "Dispatch a WCS request"
+        server = self.server.owner
+        parsed = urlparse(self.path)
+        query = {k.lower(): v[0] for k, v in parse_qs(parsed.query).items()}
+        request = query.get('request', '').lower()
+        layer = parsed.path.rstrip('/').split('/')[-1].split('.')[0] or 'coverage'
+
+        with server.lock:
+            server.requests.append((parsed.path, request))
+            status = server.fail_next.pop(0) if server.fail_next else None
+            server.active += 1
+            server.max_active = max(server.active, server.max_active)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if status is not None:
+                self._send(status, b'upstream unavailable', 'text/plain')
+            elif request == 'getcapabilities':
+                url = f'http://{self.headers["Host"]}{parsed.path}'
+                body = CAPABILITIES_TEMPLATE.format(url=url, layer=layer, bounds=server.bounds)
+                self._send(200, body.encode('utf-8'), 'text/xml')
+            elif request == 'getcoverage':
+                bbox = [float(v) for v in query['bbox'].split(',')]
+                body = render_coverage(bbox, server.resolution, server.bounds)
+                with server.lock:
+                    cut = server.truncate_next.pop(0) if server.truncate_next else None
+                self._send(200, body, 'image/tiff', cut)
+            else:
+                self._send(400, b'unknown request', 'text/plain')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send(self, status, body, content_type, cut=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if cut is not None:
+            # Drop the connection part way through the body
+            body = body[:cut]
+            self.close_connection = True
+        self.wfile.write(body)
+        with self.server.owner.lock:
+            self.server.owner.bytes_sent += len(body)
+
+class LocalWCSServer:
+
+    """
+    A threaded HTTP server which looks enough like a THREDDS WCS 1.0.0 endpoint
+    for owslib and our downloaders to talk to it.
+
+    Every path on the server is its own coverage, so
+    `server.url('magmap.nc')` and `server.url('radmap.nc')` look like two
+    different endpoints on the same host.
+
+    Use as a context manager:
+
+        with LocalWCSServer(latency=0.05) as server:
+            service = CoverageService(server.url('magmap.nc'))
+
+    Parameters:
+        resolution - the pixel size of the served coverages, in degrees.
+            Optional, defaults to 0.001 (about 100 m)
+        latency - seconds to sleep before answering each request, to
+            mimic a remote server. Optional, defaults to 0.
+        bounds - the extent of the served coverages in WGS84
+    """
+
+    def __init__(self, resolution=0.001, latency=0, bounds=AUSTRALIA_BOUNDS):
+        self.resolution = resolution
+        self.latency = latency
+        self.bounds = bounds
+        self.lock = threading.Lock()
+        self.requests = []
+        self.bytes_sent = 0
+        self.active, self.max_active = 0, 0  # concurrent requests being handled
+        self.fail_next = []  # HTTP status codes to return for the next requests
+        self.truncate_next = []  # cut the next coverage responses off after this many bytes
+        self._server, self._thread = None, None
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, path='coverage.nc'):
+        "Return the URL for a coverage on this server"
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/thredds/wcs/{path}'
+
+    def coverage_requests(self):
+        "Return the number of GetCoverage requests served"
+        return sum(1 for _, req in self.requests if req == 'getcoverage')
+
+    def capabilities_requests(self):
+        "Return the number of GetCapabilities requests served"
+        return sum(1 for _, req in self.requests if req == 'getcapabilities')